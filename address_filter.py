@@ -0,0 +1,189 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Prefiltro probabilistico per confrontare le tx di un blocco con gli indirizzi monitorati.
+
+Un filtro di Bloom scarta quasi tutti gli script non monitorati con pochi accessi in memoria;
+i candidati vengono poi confermati su un indice compatto di impronte a 64 bit ordinate.
+"""
+
+import hashlib
+import math
+from array import array
+from bisect import bisect_left
+
+from chain_backends import address_to_scriptpubkey
+
+
+def script_fingerprint(script):
+    """Restituisce l'impronta a 64 bit di uno scriptPubKey."""
+    return int.from_bytes(hashlib.blake2b(script, digest_size=8).digest(), 'little')
+
+
+class BloomFilter:
+    """Filtro di Bloom con double hashing sulle due metà dell'impronta a 64 bit."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1024)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.capacity = capacity
+
+    def add(self, fingerprint):
+        bits, size = self.bits, self.size
+        first, second = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+        for i in range(self.hashes):
+            position = (first + i * second) % size
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, fingerprint):
+        bits, size = self.bits, self.size
+        first, second = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+        for i in range(self.hashes):
+            position = (first + i * second) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class WatchedScriptIndex:
+    """Insieme degli script monitorati con prefiltro di Bloom e conferma esatta su impronte ordinate.
+
+    Aggiunte e rimozioni sono incrementali: finiscono in piccoli insiemi delta che vengono
+    fusi nell'array ordinato quando crescono; il filtro viene ricostruito quando le
+    rimozioni accumulate ne degradano la precisione o quando supera la capacità prevista.
+    """
+
+    def __init__(self, error_rate=0.01):
+        self.error_rate = error_rate
+        self._sorted = array('Q')
+        self._added = set()
+        self._removed = set()
+        self._bloom = BloomFilter(0, error_rate)
+        self._bloom_removed = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _address_fingerprint(address):
+        return script_fingerprint(address_to_scriptpubkey(address))
+
+    def rebuild(self, addresses):
+        """Ricostruisce l'indice da zero a partire dall'elenco completo degli indirizzi."""
+        scripts = []
+        for address in addresses:
+            try:
+                scripts.append(address_to_scriptpubkey(address))
+            except ValueError:
+                continue
+        self.rebuild_scripts(scripts)
+
+    def rebuild_scripts(self, scripts):
+        """Ricostruisce l'indice da zero a partire dagli scriptPubKey (bytes)."""
+        fingerprints = {script_fingerprint(script) for script in scripts}
+        self._sorted = array('Q', sorted(fingerprints))
+        self._added.clear()
+        self._removed.clear()
+        self._count = len(fingerprints)
+        self._rebuild_bloom()
+
+    def _rebuild_bloom(self):
+        """Ricostruisce il filtro di Bloom dimensionandolo sul doppio degli script attuali."""
+        self._bloom = BloomFilter(self._count * 2, self.error_rate)
+        for fingerprint in self.fingerprints():
+            self._bloom.add(fingerprint)
+        self._bloom_removed = 0
+
+    def _in_sorted(self, fingerprint):
+        index = bisect_left(self._sorted, fingerprint)
+        return index < len(self._sorted) and self._sorted[index] == fingerprint
+
+    def _contains_fingerprint(self, fingerprint):
+        if fingerprint in self._removed:
+            return False
+        return fingerprint in self._added or self._in_sorted(fingerprint)
+
+    def add(self, address):
+        """Aggiunge un indirizzo monitorato."""
+        fingerprint = self._address_fingerprint(address)
+        if self._contains_fingerprint(fingerprint):
+            return
+        if fingerprint in self._removed:
+            self._removed.discard(fingerprint)
+        else:
+            self._added.add(fingerprint)
+        self._bloom.add(fingerprint)
+        self._count += 1
+        self._maybe_compact()
+
+    def discard(self, address):
+        """Rimuove un indirizzo non più monitorato."""
+        fingerprint = self._address_fingerprint(address)
+        if not self._contains_fingerprint(fingerprint):
+            return
+        if fingerprint in self._added:
+            self._added.discard(fingerprint)
+        else:
+            self._removed.add(fingerprint)
+        self._count -= 1
+        self._bloom_removed += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Fonde i delta nell'array ordinato e ricostruisce il filtro quando necessario."""
+        if len(self._added) + len(self._removed) > 4096 + len(self._sorted) // 100:
+            merged = sorted(set(self._sorted).difference(self._removed).union(self._added))
+            self._sorted = array('Q', merged)
+            self._added.clear()
+            self._removed.clear()
+        if self._count > self._bloom.capacity or self._bloom_removed > self._bloom.capacity // 10:
+            self._rebuild_bloom()
+
+    def fingerprints(self):
+        """Itera sulle impronte attualmente monitorate."""
+        for fingerprint in self._sorted:
+            if fingerprint not in self._removed:
+                yield fingerprint
+        yield from self._added
+
+    def contains_script(self, script):
+        """Verifica se uno scriptPubKey (bytes) è monitorato."""
+        fingerprint = script_fingerprint(script)
+        if not self._bloom.might_contain(fingerprint):
+            return False
+        return self._contains_fingerprint(fingerprint)
+
+    def match_transactions(self, txs):
+        """Restituisce gli indirizzi monitorati coinvolti (input o output) in una lista di tx Esplora."""
+        matched = set()
+        contains_script = self.contains_script
+        for tx in txs:
+            for out in tx.get('vout', []):
+                if out.get('scriptpubkey') and contains_script(bytes.fromhex(out['scriptpubkey'])):
+                    matched.add(out.get('scriptpubkey_address'))
+            for inp in tx.get('vin', []):
+                prevout = inp.get('prevout')
+                if prevout and prevout.get('scriptpubkey') and contains_script(bytes.fromhex(prevout['scriptpubkey'])):
+                    matched.add(prevout.get('scriptpubkey_address'))
+        matched.discard(None)
+        return matched
+
+    def memory_usage(self):
+        """Stima in byte della memoria occupata da filtro e indice."""
+        return len(self._bloom.bits) + self._sorted.itemsize * len(self._sorted) + 64 * (len(self._added) + len(self._removed))
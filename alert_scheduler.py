@@ -0,0 +1,140 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Schedulazione delle notifiche periodiche: timing wheel gerarchica e calcolo degli orari locali.
+
+La wheel ha tre livelli (minuti dell'ora, ore del giorno, giorni) più una lista di overflow;
+inserimento e cancellazione costano O(1) e ogni elemento viene spostato al più una volta per
+livello man mano che la scadenza si avvicina. advance() restituisce insieme tutti gli elementi
+scaduti in un tick, così l'invio avviene in un unico lotto.
+"""
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+
+class TimingWheel:
+    """Timing wheel gerarchica con risoluzione di tick secondi (predefinita: un minuto)."""
+
+    def __init__(self, now, tick=60, levels=(60, 24, 64)):
+        self.tick = tick
+        self.sizes = levels
+        # Durata in tick di uno slot di ciascun livello
+        self.spans = [1]
+        for size in levels[:-1]:
+            self.spans.append(self.spans[-1] * size)
+        self.wheels = [[{} for _ in range(size)] for size in levels]
+        self.overflow = {}
+        self.entries = {}
+        # Prossimo tick da elaborare
+        self.current = int(now // tick)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def schedule(self, key, when, payload=None):
+        """Programma (o riprogramma) key per il timestamp when."""
+        self.cancel(key)
+        self._place(key, -(-int(when) // self.tick), payload)
+
+    def cancel(self, key):
+        """Rimuove key se programmata; restituisce True se era presente."""
+        position = self.entries.pop(key, None)
+        if position is None:
+            return False
+        level, slot = position
+        bucket = self.overflow if level is None else self.wheels[level][slot]
+        del bucket[key]
+        return True
+
+    def _place(self, key, deadline, payload):
+        deadline = max(deadline, self.current)
+        for level, size in enumerate(self.sizes):
+            span = self.spans[level]
+            # Il livello giusto è il più basso il cui giro comprende sia il tick corrente sia la scadenza
+            if deadline // (span * size) == self.current // (span * size):
+                slot = (deadline // span) % size
+                self.wheels[level][slot][key] = (deadline, payload)
+                self.entries[key] = (level, slot)
+                return
+        self.overflow[key] = (deadline, payload)
+        self.entries[key] = (None, None)
+
+    def _cascade(self, bucket):
+        items = list(bucket.items())
+        bucket.clear()
+        for key, (deadline, payload) in items:
+            del self.entries[key]
+            self._place(key, deadline, payload)
+
+    def advance(self, now):
+        """Elabora i tick fino a now e restituisce [(key, payload)] degli elementi scaduti."""
+        target = int(now // self.tick)
+        due = []
+        while self.current <= target:
+            tick = self.current
+            # All'inizio di un giro si ridistribuisce lo slot corrispondente del livello superiore
+            top = len(self.sizes) - 1
+            if tick % (self.spans[top] * self.sizes[top]) == 0:
+                self._cascade(self.overflow)
+            for level in range(top, 0, -1):
+                if tick % self.spans[level] == 0:
+                    self._cascade(self.wheels[level][(tick // self.spans[level]) % self.sizes[level]])
+            bucket = self.wheels[0][tick % self.sizes[0]]
+            for key, (_, payload) in bucket.items():
+                del self.entries[key]
+                due.append((key, payload))
+            bucket.clear()
+            self.current += 1
+        return due
+
+
+def validate_timezone(name):
+    """Restituisce il nome del fuso orario se valido, altrimenti None."""
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    return name
+
+
+def next_occurrence(frequency, after, tz_name='UTC', hour=7):
+    """Timestamp del primo invio successivo ad after, alle hour:00 dell'ora locale del fuso tz_name.
+
+    daily: ogni giorno; weekly: ogni lunedì; monthly: il primo giorno del mese. Le date sono calcolate
+    sull'ora locale, quindi l'orario resta lo stesso anche al cambio dell'ora legale.
+    """
+    zone = ZoneInfo(tz_name)
+    day = datetime.fromtimestamp(after, zone).date()
+    if frequency == 'weekly':
+        day += timedelta(days=-day.weekday() % 7)
+    elif frequency == 'monthly' and day.day != 1:
+        day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+    while True:
+        candidate = datetime(day.year, day.month, day.day, hour, tzinfo=zone).timestamp()
+        if candidate > after:
+            return int(candidate)
+        if frequency == 'daily':
+            day += timedelta(days=1)
+        elif frequency == 'weekly':
+            day += timedelta(days=7)
+        else:
+            day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
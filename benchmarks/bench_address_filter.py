@@ -0,0 +1,83 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmark del prefiltro degli script monitorati su un blocco sintetico.
+
+Uso: python benchmarks/bench_address_filter.py [script_monitorati] [tx_per_blocco]
+"""
+
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address_filter import WatchedScriptIndex
+
+
+def p2wpkh_script(rng):
+    return b'\x00\x14' + rng.randbytes(20)
+
+
+def synthetic_block(rng, tx_count, watched, hits):
+    """Blocco nel formato Esplora: 2 input e 2 output per tx, `hits` output verso script monitorati."""
+    txs = []
+    for i in range(tx_count):
+        vout = [{'scriptpubkey': p2wpkh_script(rng).hex(), 'scriptpubkey_address': f'out{i}-{n}'} for n in range(2)]
+        vin = [{'prevout': {'scriptpubkey': p2wpkh_script(rng).hex(), 'scriptpubkey_address': f'in{i}-{n}'}} for n in range(2)]
+        txs.append({'txid': f'{i:064x}', 'vin': vin, 'vout': vout})
+    for tx in rng.sample(txs, hits):
+        tx['vout'][0]['scriptpubkey'] = rng.choice(watched).hex()
+    return txs
+
+
+def main():
+    watched_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tx_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    rng = random.Random(42)
+    watched = [p2wpkh_script(rng) for _ in range(watched_count)]
+    block = synthetic_block(rng, tx_count, watched, hits=10)
+
+    start = perf_counter()
+    index = WatchedScriptIndex()
+    index.rebuild_scripts(watched)
+    build_time = perf_counter() - start
+
+    start = perf_counter()
+    matched = index.match_transactions(block)
+    scan_time = perf_counter() - start
+
+    # Confronto con l'approccio ingenuo: un set Python di tutti gli script monitorati
+    start = perf_counter()
+    naive = set(watched)
+    naive_build_time = perf_counter() - start
+    start = perf_counter()
+    naive_matched = {
+        out['scriptpubkey_address'] for tx in block for out in tx['vout']
+        if bytes.fromhex(out['scriptpubkey']) in naive
+    }
+    naive_scan_time = perf_counter() - start
+    naive_memory = sys.getsizeof(naive) + sum(sys.getsizeof(script) for script in watched)
+
+    print(f'Script monitorati: {watched_count}, tx nel blocco: {tx_count}, corrispondenze: {len(matched)}')
+    print(f'Indice: costruzione {build_time:.2f}s, scansione {scan_time * 1000:.1f}ms, memoria {index.memory_usage() / 1e6:.1f} MB')
+    print(f'Set Python: costruzione {naive_build_time:.2f}s, scansione {naive_scan_time * 1000:.1f}ms, memoria {naive_memory / 1e6:.1f} MB')
+    assert matched == naive_matched
+
+
+if __name__ == '__main__':
+    main()
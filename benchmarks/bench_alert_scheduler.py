@@ -0,0 +1,78 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Costo della timing wheel delle notifiche prezzo al crescere del numero di notifiche.
+
+Per ogni dimensione programma le notifiche con fusi orari, ore e frequenze casuali, le
+riprogramma tutte e simula un mese di tick al minuto, misurando il tempo per operazione
+e la dimensione massima di un lotto.
+
+Uso: python benchmarks/bench_alert_scheduler.py [notifiche_massime]
+"""
+
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alert_scheduler import FREQUENCIES, TimingWheel, next_occurrence
+
+TIMEZONES = ['UTC', 'Europe/Rome', 'Europe/London', 'America/New_York', 'America/Los_Angeles', 'Asia/Tokyo', 'Australia/Sydney']
+START = 1_735_689_600  # 2025-01-01 00:00 UTC
+
+
+def run(count, rng):
+    alerts = [(rng.choice(FREQUENCIES), rng.choice(TIMEZONES), rng.randrange(24)) for _ in range(count)]
+    deadlines = [next_occurrence(frequency, START, tz_name, hour) for frequency, tz_name, hour in alerts]
+    wheel = TimingWheel(START)
+
+    started = perf_counter()
+    for key, deadline in enumerate(deadlines):
+        wheel.schedule(key, deadline, key)
+    schedule_us = (perf_counter() - started) / count * 1e6
+
+    started = perf_counter()
+    for key, deadline in enumerate(deadlines):
+        wheel.schedule(key, deadline + 60, key)
+    reschedule_us = (perf_counter() - started) / count * 1e6
+
+    fired = 0
+    largest = 0
+    started = perf_counter()
+    for minute in range(1, 31 * 24 * 60 + 1):
+        now = START + minute * 60
+        due = wheel.advance(now)
+        largest = max(largest, len(due))
+        for key, _ in due:
+            frequency, tz_name, hour = alerts[key]
+            wheel.schedule(key, next_occurrence(frequency, now, tz_name, hour), key)
+        fired += len(due)
+    month_s = perf_counter() - started
+    print(f'{count:8d} notifiche   schedule {schedule_us:5.2f} us   reschedule {reschedule_us:5.2f} us   '
+          f'un mese {month_s:6.2f} s ({fired} invii, lotto massimo {largest})')
+
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(7)
+    for count in sorted({min(size, largest) for size in (1000, 10000, 100000, largest)}):
+        run(count, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Latenza delle query tipiche dei monitor con i diversi profili SQLCipher.
+
+Per ogni profilo crea un database temporaneo con sottoscrizioni sintetiche e misura
+l'apertura (derivazione della chiave) e le istruzioni di un ciclo di monitor_addresses
+e monitor_transactions, commit compresi.
+
+Uso: python benchmarks/bench_db_profiles.py [utenti] [cicli]
+"""
+
+import os
+import random
+import secrets
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlcipher3 import dbapi2 as sqlite3
+
+import db_schema
+from db_schema import ensure_user, ensure_watched_object
+from db_tuning import PROFILES, apply_profile
+
+PASSPHRASE = 'benchmark-passphrase'
+RAW_KEY = secrets.token_hex(32)
+
+SCENARIOS = [
+    ('default', PASSPHRASE, PROFILES['default']),
+    ('tuned', PASSPHRASE, PROFILES['tuned']),
+    ('tuned + chiave grezza', RAW_KEY, dict(PROFILES['tuned'], raw_key=True)),
+]
+
+SUBSCRIBERS_QUERY = ('SELECT o.value, s.user_id, u.chat_id, s.direction, s.created, s.min_amount FROM subscriptions s '
+                     'JOIN watched_objects o ON o.id = s.object_id JOIN users u ON u.id = s.user_id WHERE s.kind = ?')
+
+
+def populate(conn, rng, users):
+    db_schema.migrate(conn)
+    c = conn.cursor()
+    for user in range(users):
+        user_key = ensure_user(c, str(user))
+        for n in range(3):
+            object_id = ensure_watched_object(c, 'address', f'addr{user}-{n}')
+            c.execute('INSERT INTO subscriptions (user_id, object_id, kind, direction) VALUES (?, ?, ?, ?)',
+                      (user_key, object_id, 'address', rng.choice(['send', 'receive'])))
+        object_id = ensure_watched_object(c, 'tx', rng.randbytes(32).hex())
+        c.execute("INSERT INTO subscriptions (user_id, object_id, kind, targets) VALUES (?, ?, 'tx', '1,3,6')", (user_key, object_id))
+        for _ in range(20):
+            c.execute('INSERT INTO notified_transactions (user_id, txid) VALUES (?, ?)', (user_key, rng.randbytes(32).hex()))
+    conn.commit()
+
+
+def monitor_cycle(conn, rng):
+    """Le istruzioni di un ciclo dei monitor, nello stesso ordine e con gli stessi commit."""
+    c = conn.cursor()
+    c.execute(SUBSCRIBERS_QUERY, ('address',))
+    subscriptions = c.fetchall()
+    notified = []
+    for _, user_key, _, _, _, _ in rng.sample(subscriptions, min(200, len(subscriptions))):
+        txid = rng.randbytes(32).hex()
+        c.execute('SELECT 1 FROM notified_transactions WHERE user_id = ? AND txid = ?', (user_key, txid))
+        if not c.fetchone():
+            notified.append((user_key, txid))
+    c.executemany('INSERT OR IGNORE INTO notified_transactions (user_id, txid) VALUES (?, ?)', notified)
+    conn.commit()
+    c.execute('SELECT s.id, u.chat_id, o.value, s.targets, s.reached FROM subscriptions s '
+              "JOIN watched_objects o ON o.id = s.object_id JOIN users u ON u.id = s.user_id WHERE s.kind = 'tx'")
+    for subscription_id, *_ in c.fetchall()[:50]:
+        c.execute('UPDATE subscriptions SET reached = ? WHERE id = ?', ('1', subscription_id))
+    conn.commit()
+
+
+def run_scenario(label, key, profile, users, cycles, workdir):
+    path = os.path.join(workdir, label.replace(' ', '_') + '.db')
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    apply_profile(conn, key, profile)
+    populate(conn, rng, users)
+    conn.close()
+
+    start = perf_counter()
+    conn = sqlite3.connect(path)
+    apply_profile(conn, key, profile)
+    db_schema.migrate(conn)
+    open_ms = (perf_counter() - start) * 1000
+    timings = []
+    for _ in range(cycles):
+        start = perf_counter()
+        monitor_cycle(conn, rng)
+        timings.append((perf_counter() - start) * 1000)
+    conn.close()
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f'{label:24} apertura {open_ms:8.1f} ms   ciclo mediana {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms')
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f'{users} utenti, {cycles} cicli per profilo')
+    with tempfile.TemporaryDirectory() as workdir:
+        for label, key, profile in SCENARIOS:
+            run_scenario(label, key, profile, users, cycles, workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Costo dell'analisi della fee histogram: somma cumulativa una volta per risposta contro somme ripetute.
+
+Per ogni dimensione della histogram misura la costruzione di MempoolHistogram, le interrogazioni
+vsize_above su tutte le fasce di /mempool e lo stesso calcolo fatto sommando la histogram a ogni
+interrogazione, più la memoria occupata da un campione dello storico.
+
+Uso: python benchmarks/bench_mempool_stats.py [iterazioni]
+"""
+
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mempool_stats import FEE_BANDS, MempoolHistogram, MempoolHistory
+
+
+def naive_vsize_above(histogram, fee_rate):
+    return sum(vsize for rate, vsize in histogram if rate >= fee_rate)
+
+
+def run(size, iterations, rng):
+    rates = sorted((round(rng.uniform(1, 500), 2) for _ in range(size)), reverse=True)
+    histogram = [[rate, rng.randrange(1000, 200000)] for rate in rates]
+    mempool = {'count': size * 40, 'fee_histogram': histogram}
+
+    started = perf_counter()
+    for _ in range(iterations):
+        index = MempoolHistogram(mempool)
+    build_us = (perf_counter() - started) / iterations * 1e6
+
+    started = perf_counter()
+    for _ in range(iterations):
+        index.bands()
+    query_us = (perf_counter() - started) / iterations * 1e6
+
+    started = perf_counter()
+    for _ in range(iterations):
+        {band: naive_vsize_above(histogram, band) for band in FEE_BANDS}
+    naive_us = (perf_counter() - started) / iterations * 1e6
+
+    assert index.bands() == {band: float(naive_vsize_above(histogram, band)) for band in FEE_BANDS}
+    print(f'{size:6d} voci histogram   costruzione {build_us:8.1f} us   {len(FEE_BANDS)} interrogazioni {query_us:6.1f} us   '
+          f'somme ripetute {naive_us:8.1f} us')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(7)
+    for size in (50, 500, 5000):
+        run(size, iterations, rng)
+    history = MempoolHistory(1)
+    sample_bytes = 4 + 4 * len(history.fields)
+    print(f'Storico: {sample_bytes} byte per campione, {sample_bytes * 4032 // 1024} KiB per due settimane a 5 minuti')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Confronto tra il JSON Esplora grezzo e TxRecord nel ciclo di confronto degli indirizzi.
+
+Simula un ciclo di monitor_addresses: per ogni indirizzo uno storico di tx e più
+sottoscrittori, con la verifica invio/ricezione ripetuta per ogni tx.
+
+Uso: python benchmarks/bench_tx_model.py [indirizzi] [tx_per_indirizzo]
+"""
+
+import json
+import os
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tx_model import TxRecord
+
+
+def synthetic_tx(rng, address, index):
+    def output(addr):
+        return {
+            'scriptpubkey': '0014' + rng.randbytes(20).hex(),
+            'scriptpubkey_asm': 'OP_0 OP_PUSHBYTES_20 ' + rng.randbytes(20).hex(),
+            'scriptpubkey_type': 'v0_p2wpkh',
+            'scriptpubkey_address': addr,
+            'value': rng.randrange(1000, 10**8),
+        }
+    vin = [{
+        'txid': rng.randbytes(32).hex(), 'vout': 0, 'prevout': output(f'in-{index}-{n}'),
+        'scriptsig': '', 'scriptsig_asm': '', 'witness': [rng.randbytes(72).hex(), rng.randbytes(33).hex()],
+        'is_coinbase': False, 'sequence': 4294967293,
+    } for n in range(3)]
+    vout = [output(f'out-{index}-{n}') for n in range(2)]
+    if index % 2:
+        vout[0]['scriptpubkey_address'] = address
+    else:
+        vin[0]['prevout']['scriptpubkey_address'] = address
+    return {
+        'txid': rng.randbytes(32).hex(), 'version': 2, 'locktime': 0, 'size': 400, 'weight': 1000, 'fee': 500,
+        'vin': vin, 'vout': vout,
+        'status': {'confirmed': True, 'block_height': 800000, 'block_hash': rng.randbytes(32).hex(), 'block_time': 1700000000},
+    }
+
+
+def raw_cycle(histories, subscribers):
+    matches = 0
+    for address, txs in histories.items():
+        for tx in txs:
+            for sub_type in subscribers:
+                is_send = any((inp.get('prevout') or {}).get('scriptpubkey_address') == address for inp in tx.get('vin', []))
+                is_receive = any(out.get('scriptpubkey_address') == address for out in tx.get('vout', []))
+                matches += (sub_type == 'send' and is_send) or (sub_type == 'receive' and is_receive)
+    return matches
+
+
+def record_cycle(histories, subscribers):
+    matches = 0
+    for address, records in histories.items():
+        for tx in records:
+            is_send = tx.sends_from(address)
+            is_receive = tx.receives_on(address)
+            for sub_type in subscribers:
+                matches += (sub_type == 'send' and is_send) or (sub_type == 'receive' and is_receive)
+    return matches
+
+
+def measure(label, build, cycle, subscribers):
+    tracemalloc.start()
+    histories = build()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    start = perf_counter()
+    matches = cycle(histories, subscribers)
+    elapsed = perf_counter() - start
+    print(f'{label}: ciclo {elapsed * 1000:.1f} ms, memoria trattenuta {retained / 1e6:.1f} MB, corrispondenze {matches}')
+    return matches
+
+
+def main():
+    address_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    txs_per_address = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    subscribers = ['send', 'receive', 'send', 'receive']
+    rng = random.Random(42)
+    raw = {
+        f'addr{i}': [synthetic_tx(rng, f'addr{i}', n) for n in range(txs_per_address)]
+        for i in range(address_count)
+    }
+    print(f'{address_count} indirizzi, {txs_per_address} tx per indirizzo, {len(subscribers)} sottoscrittori per indirizzo')
+    # Entrambe le varianti partono dal JSON come arriva dalla rete
+    payloads = {address: json.dumps(txs) for address, txs in raw.items()}
+    before = measure('JSON grezzo', lambda: {a: json.loads(p) for a, p in payloads.items()}, raw_cycle, subscribers)
+    after = measure('TxRecord', lambda: {a: [TxRecord.from_esplora(tx) for tx in json.loads(p)] for a, p in payloads.items()}, record_cycle, subscribers)
+    assert before == after
+
+
+if __name__ == '__main__':
+    main()
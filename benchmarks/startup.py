@@ -0,0 +1,83 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmark dell'avvio: tempo di import di bitrackbot (-X importtime) e apertura differita del database.
+
+Ogni misura gira in un processo Python nuovo, in una cartella temporanea con variabili
+d'ambiente fittizie, così non tocca i database reali.
+
+Uso: python benchmarks/startup.py [--top N] [--max-import-ms MS]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPEN_DB_SCRIPT = '''
+import time
+started = time.perf_counter()
+import bitrackbot
+imported = time.perf_counter()
+bitrackbot.DB_CONN.connection()
+opened = time.perf_counter()
+print(f"{(imported - started) * 1000:.1f} {(opened - imported) * 1000:.1f}")
+'''
+
+
+def run_python(args, workdir):
+    env = dict(os.environ, TELEGRAM_TOKEN='0:benchmark', DB_KEY='benchmark', LIGHTNING_ADDRESS='benchmark')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    return subprocess.run([sys.executable, *args], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr):
+    """Restituisce [(cumulativo_us, self_us, modulo)] dalle righe di -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15, help='moduli da mostrare, per tempo cumulativo')
+    parser.add_argument('--max-import-ms', type=float, help='esce con errore se l\'import supera questa soglia')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        rows = parse_importtime(run_python(['-X', 'importtime', '-c', 'import bitrackbot'], workdir).stderr)
+        import_ms, open_db_ms = map(float, run_python(['-c', OPEN_DB_SCRIPT], workdir).stdout.split())
+
+    total_us = next((cumulative for cumulative, _, name in rows if name.strip() == 'bitrackbot'), 0)
+    print(f'Import di bitrackbot (-X importtime): {total_us / 1000:.1f} ms')
+    print(f'Import misurato a parete: {import_ms:.1f} ms, apertura database differita: {open_db_ms:.1f} ms')
+    print('\nModuli più lenti (cumulativo / proprio, ms):')
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f'{cumulative / 1000:9.1f} {self_us / 1000:9.1f}  {name}')
+    if args.max_import_ms is not None and total_us / 1000 > args.max_import_ms:
+        print(f'\nRegressione: import oltre {args.max_import_ms} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,14 +18,38 @@
 import telegram
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ConversationHandler, MessageHandler, filters, ContextTypes
-import requests
-from sqlcipher3 import dbapi2 as sqlite3
 import os
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from time import time, sleep
 from dotenv import load_dotenv
 import re
+import asyncio
+from math import ceil
+from bisect import bisect_right
+from functools import lru_cache, wraps
 from segwit_addr import decode as segwit_decode
+from caches import BoundedCache, ResponseCache
+from fee_history import FeeHistory, HOUR, DAY, WEEK
+from chain_backends import BLOCK_VSIZE, BackendError, NotFound, NotSupported, build_backend_from_env
+from address_filter import WatchedScriptIndex
+from disk_cache import PersistentCache
+from tx_model import TxRecord
+from lazy import LazyConnection, lazy_module
+from db_tuning import profile_from_env
+import db_schema
+from db_schema import ensure_user, ensure_watched_object, get_channel_state, prune_watched_objects, set_channel_state
+from webhook import run_webhook, webhook_settings_from_env
+from loop_watchdog import profile_loop, watchdog_from_env
+from alert_scheduler import TimingWheel, next_occurrence, validate_timezone
+from tx_eta import MempoolEtaIndex, eta_changed, eta_seconds
+from tx_package import PackageTracker
+from mempool_stats import MempoolHistogram, MempoolHistory, clearing_seconds
+from broadcast import EventPublisher, channels_from_env
+from upstream import session_from_env
+from rate_limit import limiter_from_env
+
+# Import differito: requests serve solo ai job in background
+requests = lazy_module('requests')
 
 # Caricamento delle variabili d'ambiente
 load_dotenv()
@@ -36,8 +60,18 @@ LIGHTNING_ADDRESS = os.getenv('LIGHTNING_ADDRESS')
 if not TOKEN or not DB_KEY or not LIGHTNING_ADDRESS:
     raise ValueError("Variabili d'ambiente TELEGRAM_TOKEN, DB_KEY o LIGHTNING_ADDRESS non definite nel file .env.")
 
-# URL base dell'API di Mempool.space
-MEMPOOL_API_URL = 'https://mempool.space/api'
+# Sorgente dei dati on-chain: Mempool.space (predefinito), istanza self-hosted, Electrum o bitcoind
+# (vedi CHAIN_BACKEND e MEMPOOL_API_URL nel file .env)
+# Sessione HTTP condivisa da backend e prezzi quando il traffico viene registrato o riprodotto
+# (UPSTREAM_RECORD, UPSTREAM_REPLAY: vedi upstream.py e tools/replay.py); altrimenti None
+UPSTREAM_SESSION = session_from_env()
+CHAIN_BACKEND = build_backend_from_env(UPSTREAM_SESSION)
+# Scansione dei nuovi blocchi contro gli indirizzi monitorati (consigliata con backend self-hosted)
+BLOCK_SCAN_ENABLED = os.getenv('BLOCK_SCAN') == '1'
+# Strumentazione dell'event loop (LOOP_WATCHDOG=1) e utenti abilitati ai comandi di amministrazione (/profile)
+LOOP_WATCHDOG = watchdog_from_env()
+ADMIN_CHAT_IDS = {chat_id.strip() for chat_id in os.getenv('ADMIN_CHAT_IDS', '').split(',') if chat_id.strip()}
+MAX_PROFILE_SECONDS = 120
 
 # Stati per le conversazioni
 SEND_ADDRESS_INPUT = 1
@@ -55,6 +89,7 @@ PRICE_THRESHOLD_CURRENCY_INPUT = 12
 PRICE_THRESHOLD_VALUE_INPUT = 13
 CONVERT_CHOICE = 14
 CONVERT_AMOUNT = 15
+ALERT_TIME_INPUT = 16
 
 # Mappa dei comandi
 COMMAND_MAP = {
@@ -72,6 +107,7 @@ COMMAND_MAP = {
     '/fee_forecast': 'fee_forecast',
     '/tx_fee': 'tx_fee',
     '/status': 'status',
+    '/mempool': 'mempool_report',
     '/track_send_mempool': 'track_send_mempool',
     '/track_receive_mempool': 'track_receive_mempool',
     '/track_solo_miner': 'track_solo_miner',
@@ -79,12 +115,20 @@ COMMAND_MAP = {
     '/set_price_alert': 'set_price_alert',
     '/set_price_threshold': 'set_price_threshold',
     '/convert': 'convert',
+    '/digest': 'digest',
 }
 
 
-# Connessione persistente al database
-DB_CONN = sqlite3.connect('subscriptions.db')
-DB_CONN.execute(f"PRAGMA key = '{DB_KEY}'")
+# Profilo SQLCipher (chiave grezza, cifratura, cache, journal) letto da DB_PROFILE e DB_*: vedi docs/database.md
+DB_PROFILE = profile_from_env()
+
+# Connessione persistente al database, aperta al primo utilizzo (di norma dal warm-up in background)
+DB_CONN = LazyConnection('subscriptions.db', DB_KEY, on_connect=lambda: init_db(), profile=DB_PROFILE)
+
+# Cache persistente (cifrata con la stessa chiave) per tx confermate, blocchi profondi e digest di stato
+PERSISTENT_CACHE = PersistentCache(os.getenv('CACHE_DB_PATH', 'cache.db'), DB_KEY, int(os.getenv('CACHE_MAX_MB', '64')) * 1024 * 1024, DB_PROFILE)
+# Profondità minima perché un blocco sia considerato al riparo da riorganizzazioni
+BLOCK_CACHE_MIN_DEPTH = 6
 
 # Funzioni di validazione
 def is_valid_bitcoin_address(address):
@@ -104,39 +148,37 @@ def is_valid_bitcoin_address(address):
             return False
     return False
 
+def parse_address_input(text):
+    """Legge "indirizzo [importo minimo in sats]"; restituisce (indirizzo, minimo) o None se non valido."""
+    parts = text.split()
+    if not parts or len(parts) > 2 or not is_valid_bitcoin_address(parts[0]):
+        return None
+    min_amount = 0
+    if len(parts) == 2:
+        if not parts[1].isdigit():
+            return None
+        min_amount = int(parts[1])
+    return parts[0], min_amount
+
 def is_valid_txid(txid):
     """Valida un transaction ID (txid) Bitcoin."""
     txid = re.sub(r'[^a-fA-F0-9]', '', txid)  # Sanitizzazione
     return len(txid) == 64 and all(c in '0123456789abcdefABCDEF' for c in txid)
 
-# Inizializzazione del database con indici
+# Inizializzazione del database: migrazione allo schema normalizzato (vedi db_schema e docs/database.md)
 def init_db():
-    """Inizializza il database con tabelle e indici per migliorare le prestazioni."""
-    c = DB_CONN.cursor()
-    c.execute('CREATE TABLE IF NOT EXISTS address_subscriptions (user_id TEXT, address TEXT, type TEXT, timestamp INTEGER)')
-    c.execute('CREATE TABLE IF NOT EXISTS fee_thresholds (user_id TEXT, threshold REAL, direction TEXT, notified INTEGER DEFAULT 0)')
-    c.execute('CREATE TABLE IF NOT EXISTS tx_subscriptions (user_id TEXT, txid TEXT, confirmations INTEGER, timestamp INTEGER)')
-    c.execute('CREATE TABLE IF NOT EXISTS notified_transactions (user_id TEXT, txid TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS mempool_address_subscriptions (user_id TEXT, address TEXT, type TEXT, timestamp INTEGER)')
-    c.execute('CREATE TABLE IF NOT EXISTS notified_mempool_transactions (user_id TEXT, txid TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS solo_miner_subscriptions (user_id TEXT, last_checked_height INTEGER)')
-    c.execute('CREATE TABLE IF NOT EXISTS price_thresholds (user_id TEXT, currency TEXT, threshold REAL, notified INTEGER, direction TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS price_alerts (user_id TEXT PRIMARY KEY, frequency TEXT, currency TEXT, next_notification_time INTEGER)')
-    # Aggiunta di indici per velocizzare le query
-    c.execute('CREATE INDEX IF NOT EXISTS idx_user_id ON address_subscriptions(user_id)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_address ON address_subscriptions(address)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_txid ON tx_subscriptions(txid)')
-    DB_CONN.commit()
+    """Porta il database all'ultima versione dello schema e attiva le chiavi esterne."""
+    db_schema.migrate(DB_CONN.connection())
 
 # Comando /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mostra il messaggio di benvenuto con l'elenco dei comandi disponibili."""
     await update.message.reply_text(
         'Ciao! Usa i seguenti comandi:\n'
-        '/track_send <indirizzo> - Monitora invii BTC\n'
-        '/track_receive <indirizzo> - Monitora ricezioni BTC\n'
-        '/track_send_mempool <indirizzo> - Monitora invii non confermati\n'
-        '/track_receive_mempool <indirizzo> - Monitora ricezioni non confermate\n'
+        '/track_send <indirizzo> [minimo sats] - Monitora invii BTC\n'
+        '/track_receive <indirizzo> [minimo sats] - Monitora ricezioni BTC\n'
+        '/track_send_mempool <indirizzo> [minimo sats] - Monitora invii non confermati\n'
+        '/track_receive_mempool <indirizzo> [minimo sats] - Monitora ricezioni non confermate\n'
         '/track_tx <txid> - Monitora transazioni\n'
         '/tx_fee <txid> - Calcola fee transazione\n'
         '/current_fees - Fee attuali\n'
@@ -144,11 +186,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         '/fee_forecast - Previsioni fee\n'
         '/recent_blocks - Statistiche blocchi recenti\n'
         '/status - Stato della rete\n'
+        '/mempool - Analisi della mempool per fee rate\n'
         '/track_solo_miner - Monitora blocchi da solo miner\n'
         '/price - Ottieni il prezzo attuale di Bitcoin\n'
         '/set_price_alert - Imposta notifiche periodiche del prezzo\n'
         '/set_price_threshold - Imposta soglia di prezzo per notifiche\n'
         '/convert <importo> <valuta> - Converti EUR/USD in sats o sats in EUR/USD\n'
+        '/digest - Attiva/disattiva il riepilogo delle notifiche\n'
         '/list_monitors - Lista monitoraggi attivi\n'
         '/delete_monitor - Cancella un monitoraggio attivo\n'
         '/delete_my_data - Cancella tutti i miei dati\n'
@@ -164,97 +208,422 @@ async def donate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # Funzioni API Mempool con cache e rate limiting
-TX_CACHE = {}
+# Storici degli indirizzi come liste di TxRecord
+TX_CACHE = BoundedCache(
+    max_entries=int(os.getenv('TX_CACHE_MAX_ENTRIES', '5000')),
+    max_bytes=int(os.getenv('TX_CACHE_MAX_MB', '32')) * 1024 * 1024,
+    ttl=300,
+)
 LAST_API_CALL = 0
 
-def get_address_transactions(address):
-    """Recupera le transazioni confermate di un indirizzo con cache."""
+def get_address_transactions(address, fresh=False):
+    """Recupera le transazioni di un indirizzo con cache (None in caso di errore).
+
+    Con fresh=True la cache viene ignorata, ad esempio quando il digest di stato è cambiato.
+    """
     global LAST_API_CALL
+    if not fresh:
+        cached = TX_CACHE.get(address)
+        if cached is not None:
+            return cached
+    if time() - LAST_API_CALL < 1:
+        sleep(1 - (time() - LAST_API_CALL))
+    LAST_API_CALL = time()
+    try:
+        data = CHAIN_BACKEND.address_txs(address)
+    except BackendError:
+        return None
+    records = [TxRecord.from_esplora(tx) for tx in data]
+    TX_CACHE.set(address, records, sum(record.estimated_size() for record in records))
+    return records
+
+def get_address_statuses(addresses):
+    """Recupera in batch i digest di stato degli indirizzi ({} se il backend non li supporta)."""
     try:
-        if address in TX_CACHE and time() - TX_CACHE[address]['timestamp'] < 300:
-            return TX_CACHE[address]['data']
-        if time() - LAST_API_CALL < 1:
-            sleep(1 - (time() - LAST_API_CALL))
-        LAST_API_CALL = time()
-        response = requests.get(f'{MEMPOOL_API_URL}/address/{address}/txs')
-        data = response.json() if response.status_code == 200 else []
-        TX_CACHE[address] = {'data': data, 'timestamp': time()}
-        return data
-    except requests.RequestException:
-        return []
+        statuses = CHAIN_BACKEND.address_status_many(addresses)
+    except NotSupported:
+        return {}
+    except BackendError as e:
+        print(f"Errore nel recupero dello stato degli indirizzi: {e}")
+        return {}
+    failed = [status for status in statuses.values() if isinstance(status, BackendError)]
+    if failed:
+        print(f"Stato non disponibile per {len(failed)} indirizzi su {len(statuses)}: {failed[0]}")
+    return {address: status for address, status in statuses.items() if not isinstance(status, BackendError)}
 
 def get_mempool_transactions(address):
-    """Recupera le transazioni non confermate di un indirizzo."""
+    """Recupera le transazioni non confermate di un indirizzo come TxRecord (None in caso di errore)."""
     try:
-        response = requests.get(f'{MEMPOOL_API_URL}/address/{address}/txs/mempool')
-        return response.json() if response.status_code == 200 else []
-    except requests.RequestException:
-        return []
+        return [TxRecord.from_esplora(tx) for tx in CHAIN_BACKEND.address_mempool_txs(address)]
+    except BackendError:
+        return None
 
 def get_transaction_details(txid):
-    """Recupera i dettagli di una transazione specifica."""
+    """Recupera una transazione come TxRecord (le tx confermate restano in cache su disco)."""
+    cached = PERSISTENT_CACHE.get(f'txrec:{txid}')
+    if cached is not None:
+        return TxRecord.from_json(cached)
+    try:
+        record = TxRecord.from_esplora(CHAIN_BACKEND.tx(txid))
+    except BackendError:
+        return None
+    if record.confirmed:
+        PERSISTENT_CACHE.put(f'txrec:{txid}', record.to_json())
+    return record
+
+def get_transaction_status(txid):
+    """Recupera lo stato di conferma di una transazione ({'missing': True} se non più nota)."""
     try:
-        response = requests.get(f'{MEMPOOL_API_URL}/tx/{txid}')
-        return response.json() if response.status_code == 200 else None
-    except requests.RequestException:
+        return CHAIN_BACKEND.tx_status(txid)
+    except NotFound:
+        return {'missing': True}
+    except BackendError:
         return None
 
 def get_last_block_height():
     """Ottiene l'altezza dell'ultimo blocco."""
     try:
-        response = requests.get(f'{MEMPOOL_API_URL}/blocks/tip/height')
-        return response.json() if response.status_code == 200 else None
-    except requests.RequestException:
+        return CHAIN_BACKEND.tip_height()
+    except BackendError:
         return None
 
 def get_block_details(height):
-    """Recupera i dettagli di un blocco specifico."""
+    """Recupera i dettagli di un blocco specifico (i blocchi profondi restano in cache su disco)."""
+    cached = PERSISTENT_CACHE.get(f'block:{height}')
+    if cached is not None:
+        return cached
     try:
-        response = requests.get(f'{MEMPOOL_API_URL}/block/{height}')
-        return response.json() if response.status_code == 200 else None
-    except requests.RequestException:
+        block = CHAIN_BACKEND.block(height)
+    except BackendError:
         return None
+    if LAST_SEEN_TIP_HEIGHT is not None and height <= LAST_SEEN_TIP_HEIGHT - BLOCK_CACHE_MIN_DEPTH:
+        PERSISTENT_CACHE.put(f'block:{height}', block)
+    return block
 
 def get_block_miner(block_details):
     """Estrae il nome del miner da un blocco."""
     return block_details.get('extras', {}).get('pool', {}).get('name', 'Unknown')
 
+def get_block_transactions(height):
+    """Recupera tutte le transazioni di un blocco (None in caso di errore)."""
+    try:
+        return CHAIN_BACKEND.block_txs(height)
+    except BackendError as e:
+        print(f"Errore nel recupero delle transazioni del blocco {height}: {e}")
+        return None
+
 def get_mempool_fees():
     """Ottiene le fee raccomandate dalla mempool."""
     try:
-        response = requests.get(f'{MEMPOOL_API_URL}/v1/fees/recommended')
-        return response.json() if response.status_code == 200 else None
-    except requests.RequestException:
+        return CHAIN_BACKEND.recommended_fees()
+    except BackendError:
         return None
 
-def get_mempool_size():
-    """Ottiene il numero di transazioni nella mempool."""
+def get_mempool_stats():
+    """Ottiene le statistiche della mempool (numero di tx, vsize, fee totali e fee histogram)."""
     try:
-        response = requests.get(f'{MEMPOOL_API_URL}/mempool')
-        return response.json()['count'] if response.status_code == 200 else None
-    except requests.RequestException:
+        return CHAIN_BACKEND.mempool()
+    except BackendError:
         return None
 
-# Funzione per aggiornare la cache dei prezzi
-async def update_price_cache(context: ContextTypes.DEFAULT_TYPE):
-    """Aggiorna la cache dei prezzi di Bitcoin in EUR e USD."""
+def get_recent_blocks():
+    """Recupera gli ultimi blocchi minati."""
+    try:
+        return CHAIN_BACKEND.recent_blocks()
+    except BackendError:
+        return None
+
+def get_mempool_blocks():
+    """Recupera i blocchi proiettati della mempool con i relativi intervalli di fee."""
+    try:
+        return CHAIN_BACKEND.mempool_blocks()
+    except BackendError:
+        return None
+
+def fetch_btc_prices():
+    """Recupera i prezzi di Bitcoin in EUR e USD da CoinDesk, con fallback a Blockchain.com (None se falliscono entrambi)."""
+    http = UPSTREAM_SESSION or requests
     try:
         # Prova con CoinDesk
-        response = requests.get('https://api.coindesk.com/v1/bpi/currentprice.json')
-        data = response.json()
-        context.bot_data['btc_prices']['eur'] = data['bpi']['EUR']['rate_float']
-        context.bot_data['btc_prices']['usd'] = data['bpi']['USD']['rate_float']
-        context.bot_data['last_price_update'] = time()
+        data = http.get('https://api.coindesk.com/v1/bpi/currentprice.json').json()
+        return {'eur': data['bpi']['EUR']['rate_float'], 'usd': data['bpi']['USD']['rate_float']}
     except Exception:
         try:
             # Fallback a Blockchain.com
-            response = requests.get('https://blockchain.info/ticker')
-            data = response.json()
-            context.bot_data['btc_prices']['eur'] = data['EUR']['last']
-            context.bot_data['btc_prices']['usd'] = data['USD']['last']
-            context.bot_data['last_price_update'] = time()
+            data = http.get('https://blockchain.info/ticker').json()
+            return {'eur': data['EUR']['last'], 'usd': data['USD']['last']}
         except Exception as e:
             print(f"Errore fallback aggiornamento cache prezzi: {e}")
+            return None
+
+# Cache condivisa delle risposte per i comandi in sola lettura
+API_CACHE = ResponseCache()
+# TTL in secondi per endpoint; le voci con tag 'block' vengono invalidate a ogni nuovo blocco
+API_CACHE_TTL = {
+    'fees': 15,
+    'mempool': 15,
+    'tip_height': 60,
+    'recent_blocks': 600,
+    'mempool_blocks': 15,
+    'prices': 300,
+}
+API_CACHE_LOADERS = {
+    'fees': get_mempool_fees,
+    'mempool': get_mempool_stats,
+    'tip_height': get_last_block_height,
+    'recent_blocks': get_recent_blocks,
+    'mempool_blocks': get_mempool_blocks,
+    'prices': fetch_btc_prices,
+}
+BLOCK_SCOPED_KEYS = {'tip_height', 'recent_blocks', 'mempool_blocks'}
+LAST_SEEN_TIP_HEIGHT = None
+
+async def cached_api(key):
+    """Legge un endpoint in sola lettura passando dalla cache condivisa."""
+    tags = ('block',) if key in BLOCK_SCOPED_KEYS else ()
+    return await API_CACHE.get(key, API_CACHE_LOADERS[key], API_CACHE_TTL[key], tags)
+
+def on_new_block(height):
+    """Invalida i dati legati al blocco precedente quando viene rilevato un nuovo blocco."""
+    API_CACHE.invalidate_tag('block')
+    API_CACHE.set('tip_height', height, API_CACHE_TTL['tip_height'], ('block',))
+
+# Limiti per utente e per comando sui comandi che interrogano le API (RATE_LIMIT_*: vedi rate_limit.py)
+RATE_LIMITER = limiter_from_env()
+THROTTLED_TEMPLATE = 'Troppe richieste ravvicinate: riprova tra {seconds}s.'
+THROTTLED_STALE_TEMPLATE = '(Risposta dalla cache: troppe richieste ravvicinate, dati aggiornati tra {seconds}s.)'
+
+def rate_limited(command, stale_reply=None):
+    """Applica i limiti di RATE_LIMITER al comando.
+
+    Chi supera il limite riceve, se disponibile, la risposta composta da stale_reply(update, context)
+    con i soli dati già in cache (anche scaduti), senza chiamate alle API; altrimenti un avviso.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            wait = RATE_LIMITER.allow(str(update.effective_user.id), command)
+            if not wait:
+                return await handler(update, context)
+            text = stale_reply(update, context) if stale_reply else None
+            if text:
+                await update.message.reply_text(f'{text.rstrip()}\n\n{THROTTLED_STALE_TEMPLATE.format(seconds=ceil(wait))}')
+            else:
+                await update.message.reply_text(THROTTLED_TEMPLATE.format(seconds=ceil(wait)))
+            return ConversationHandler.END
+        return wrapper
+    return decorator
+
+def stale_api_reply(key, renderer):
+    """Risposta di ripiego per rate_limited: l'ultimo valore in cache dell'endpoint passato a renderer."""
+    def reply(update, context):
+        value = API_CACHE.peek(key)
+        return renderer(value) if value else None
+    return reply
+
+async def watch_chain_tip(context: ContextTypes.DEFAULT_TYPE):
+    """Rileva i nuovi blocchi, invalida la cache delle risposte e scansiona i blocchi se abilitato."""
+    global LAST_SEEN_TIP_HEIGHT
+    height = await asyncio.to_thread(get_last_block_height)
+    if height is None or height == LAST_SEEN_TIP_HEIGHT:
+        return
+    previous_height = LAST_SEEN_TIP_HEIGHT
+    LAST_SEEN_TIP_HEIGHT = height
+    on_new_block(height)
+    if BLOCK_SCAN_ENABLED and previous_height is not None:
+        await asyncio.to_thread(scan_new_blocks, previous_height + 1, height)
+
+# Indice degli script monitorati per la scansione dei blocchi
+WATCHED_SCRIPTS = WatchedScriptIndex()
+# Indirizzi toccati dai blocchi scansionati e non ancora ricontrollati
+DIRTY_ADDRESSES = set()
+# True se una scansione è fallita: il ciclo successivo ricontrolla tutti gli indirizzi
+BLOCK_SCAN_GAP = True
+
+def warm_persistent_cache():
+    """Ricarica all'avvio i digest di stato e le conferme salvati, così il primo ciclo costa come gli altri."""
+    for key, status in PERSISTENT_CACHE.items('status:'):
+        ADDRESS_STATUS[key[len('status:'):]] = status
+    for key, (block_height, block_time) in PERSISTENT_CACHE.items('txstatus:'):
+        CONFIRMED_TX_CACHE[key[len('txstatus:'):]] = (block_height, block_time)
+
+def load_watched_scripts():
+    """Ricostruisce l'indice degli script dagli indirizzi monitorati nel database.
+
+    Solo le sottoscrizioni confermate ('address'): un blocco non contiene tx non confermate, quindi
+    il monitoraggio della mempool deve comunque interrogare i propri indirizzi a ogni ciclo.
+    """
+    c = DB_CONN.cursor()
+    c.execute("SELECT o.value FROM watched_objects o WHERE o.kind = 'address' "
+              "AND EXISTS (SELECT 1 FROM subscriptions s WHERE s.object_id = o.id AND s.kind = 'address')")
+    WATCHED_SCRIPTS.rebuild(row[0] for row in c.fetchall())
+
+def refresh_watched_address(address):
+    """Aggiorna l'indice dopo un'iscrizione o una cancellazione relativa a un indirizzo."""
+    c = DB_CONN.cursor()
+    c.execute("SELECT 1 FROM watched_objects o JOIN subscriptions s ON s.object_id = o.id "
+              "WHERE o.kind = 'address' AND o.value = ? AND s.kind = 'address' LIMIT 1", (address,))
+    if c.fetchone():
+        WATCHED_SCRIPTS.add(address)
+    else:
+        WATCHED_SCRIPTS.discard(address)
+
+def scan_new_blocks(first_height, last_height):
+    """Confronta le tx dei blocchi indicati con gli script monitorati e segna gli indirizzi toccati."""
+    global BLOCK_SCAN_GAP
+    for height in range(first_height, last_height + 1):
+        txs = get_block_transactions(height)
+        if txs is None:
+            BLOCK_SCAN_GAP = True
+            return
+        DIRTY_ADDRESSES.update(WATCHED_SCRIPTS.match_transactions(txs))
+
+# Rendering dei messaggi: il contenuto condiviso viene formattato una sola volta per evento/blocco
+ADDRESS_SEND_TEMPLATE = 'Invio da {address}: {txid} il {time} ({amount:+d} sat)'
+ADDRESS_RECEIVE_TEMPLATE = 'Ricezione su {address}: {txid} il {time} ({amount:+d} sat)'
+MEMPOOL_SEND_TEMPLATE = 'Invio non confermato da {address}: {txid} ({amount:+d} sat)'
+MEMPOOL_RECEIVE_TEMPLATE = 'Ricezione non confermata su {address}: {txid} ({amount:+d} sat)'
+TX_CONFIRMATIONS_TEMPLATE = 'Tx {txid} ha {confirmations} conferme il {time}.'
+TX_ETA_TEMPLATE = 'Stima di conferma: blocco {block} (circa {minutes} minuti), fee rate effettivo {fee_rate:.1f} sat/vB.'
+TX_ETA_BEYOND_TEMPLATE = 'Stima di conferma: oltre i blocchi proiettati, fee rate effettivo {fee_rate:.1f} sat/vB.'
+TX_PACKAGE_TEMPLATE = 'Pacchetto: fee rate propria {fee_rate:.1f} sat/vB, {ancestors} antenati e {descendants} figli non confermati.'
+TX_REPLACED_TEMPLATE = 'Tx {txid} è stata sostituita da {replacement} (RBF o doppia spesa). Monitoraggio terminato.'
+TX_EVICTED_TEMPLATE = 'Tx {txid} non è più in mempool: è stata espulsa o sostituita. Monitoraggio terminato.'
+TX_UNSEEN_TEMPLATE = 'Tx {txid} non è comparsa in mempool per {days} giorni. Monitoraggio terminato.'
+SOLO_MINER_TEMPLATE = 'Blocco minato da "solo miner":\nAltezza: {height}\nHash: {hash}\nTimestamp: {time}'
+PRICE_ALERT_TEMPLATE = 'Prezzo attuale di Bitcoin in {currency}: {price}'
+PRICE_CHANNEL_TEMPLATE = 'Prezzo attuale di Bitcoin:\nEUR: {eur}\nUSD: {usd}'
+FEE_LEVEL_UP_TEMPLATE = 'La fee media è salita a {fee} sat/byte, oltre il livello di {level:g} sat/byte.'
+FEE_LEVEL_DOWN_TEMPLATE = 'La fee media è scesa a {fee} sat/byte, sotto il livello di {level:g} sat/byte.'
+RECENT_BLOCK_LINE_TEMPLATE = 'Blocco {height}: {tx_count} tx, fee totali: {fees:.8f} BTC, Miner: {miner}\n'
+FEE_FORECAST_LINE_TEMPLATE = 'Blocco {index}: {min_fee} - {max_fee} sat/byte\n'
+MEMPOOL_BAND_LINE_TEMPLATE = '- ≥ {band} sat/vB: {vsize:.2f} MvB (blocchi: {blocks}), smaltimento {clearing}\n'
+DIGEST_HEADER_TEMPLATE = 'Riepilogo {title}: {count} movimenti\n'
+DIGEST_TOTALS_TEMPLATE = 'Ricevuti: {received} sat in {receive_count} tx\nInviati: {sent} sat in {send_count} tx'
+# Righe di dettaglio incluse in un riepilogo prima del conteggio delle rimanenti
+DIGEST_MAX_LINES = 20
+
+# Testi già renderizzati, associati all'oggetto dati da cui derivano
+RENDERED_REPLIES = {}
+
+@lru_cache(maxsize=4096)
+def format_timestamp(timestamp):
+    """Formatta un timestamp Unix (i blocchi condividono lo stesso orario per tutte le loro tx)."""
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+def render_once(name, data, renderer):
+    """Restituisce il testo renderizzato per `data`, ricalcolandolo solo quando i dati cambiano."""
+    rendered = RENDERED_REPLIES.get(name)
+    if rendered is not None and rendered[0] is data:
+        return rendered[1]
+    text = renderer(data)
+    RENDERED_REPLIES[name] = (data, text)
+    return text
+
+def render_recent_blocks(blocks):
+    """Compone il messaggio con gli ultimi blocchi minati."""
+    return 'Ultimi blocchi minati:\n' + ''.join(
+        RECENT_BLOCK_LINE_TEMPLATE.format(
+            height=block['height'],
+            tx_count=block['tx_count'],
+            fees=block['extras']['totalFees'] / 100_000_000,
+            miner=get_block_miner(block),
+        )
+        for block in blocks[:5]
+    )
+
+def render_fee_forecast(blocks):
+    """Compone il messaggio con le previsioni fee dei prossimi blocchi."""
+    return 'Previsioni fee per blocchi futuri:\n' + ''.join(
+        FEE_FORECAST_LINE_TEMPLATE.format(index=i, min_fee=round(block['feeRange'][0]), max_fee=round(block['feeRange'][-1]))
+        for i, block in enumerate(blocks[:3], 1)
+    )
+
+def format_min_amount(min_amount):
+    """Descrive il filtro sull'importo minimo di una sottoscrizione ('' se assente)."""
+    return f' (minimo {min_amount} sat)' if min_amount else ''
+
+def render_digest(title, events):
+    """Compone il messaggio di riepilogo di più notifiche con conteggi e importi."""
+    totals = {'send': [0, 0], 'receive': [0, 0]}
+    for _, kind, amount in events:
+        if kind in totals:
+            totals[kind][0] += 1
+            totals[kind][1] += amount or 0
+    lines = [text for text, _, _ in events[:DIGEST_MAX_LINES]]
+    if len(events) > DIGEST_MAX_LINES:
+        lines.append(f'... e altri {len(events) - DIGEST_MAX_LINES}')
+    return (
+        DIGEST_HEADER_TEMPLATE.format(title=title, count=len(events))
+        + '\n'.join(lines) + '\n'
+        + DIGEST_TOTALS_TEMPLATE.format(
+            received=totals['receive'][1], receive_count=totals['receive'][0],
+            sent=totals['send'][1], send_count=totals['send'][0],
+        )
+    )
+
+def get_digest_users():
+    """Restituisce gli utenti che hanno attivato il riepilogo delle notifiche."""
+    c = DB_CONN.cursor()
+    c.execute('SELECT chat_id FROM users WHERE digest = 1')
+    return {row[0] for row in c.fetchall()}
+
+class NotificationBatch:
+    """Notifiche di un ciclo di monitoraggio: chi ha attivato il riepilogo riceve un solo messaggio."""
+
+    def __init__(self, title):
+        self.title = title
+        self.events = {}
+
+    def add(self, user_id, text, kind=None, amount=None):
+        self.events.setdefault(user_id, []).append((text, kind, amount))
+
+    async def flush(self, bot):
+        """Invia le notifiche raccolte: un messaggio per evento o un riepilogo per utente."""
+        if not self.events:
+            return
+        digest_users = get_digest_users()
+        for user_id, events in self.events.items():
+            if user_id in digest_users and len(events) > 1:
+                await bot.send_message(chat_id=user_id, text=render_digest(self.title, events))
+                continue
+            for text, _, _ in events:
+                await bot.send_message(chat_id=user_id, text=text)
+        self.events = {}
+
+# Eventi condivisi: pubblicati una sola volta sul canale del loro tipo, se configurato (vedi broadcast.py)
+EVENT_PUBLISHER = EventPublisher(channels_from_env())
+
+# Comando /digest
+async def digest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Attiva o disattiva il riepilogo delle notifiche (/digest on, /digest off o senza argomenti per invertire)."""
+    user_id = str(update.effective_user.id)
+    c = DB_CONN.cursor()
+    user_key = ensure_user(c, user_id)
+    c.execute('SELECT digest FROM users WHERE id = ?', (user_key,))
+    enabled = not c.fetchone()[0]
+    if context.args and context.args[0].lower() in ('on', 'off'):
+        enabled = context.args[0].lower() == 'on'
+    c.execute('UPDATE users SET digest = ? WHERE id = ?', (int(enabled), user_key))
+    DB_CONN.commit()
+    if enabled:
+        await update.message.reply_text('Riepilogo attivo: le notifiche di indirizzi dello stesso controllo arriveranno in un unico messaggio.')
+    else:
+        await update.message.reply_text('Riepilogo disattivato: riceverai un messaggio per ogni transazione.')
+
+# Funzione per aggiornare la cache dei prezzi
+async def update_price_cache(context: ContextTypes.DEFAULT_TYPE):
+    """Aggiorna la cache dei prezzi di Bitcoin in EUR e USD."""
+    # Un aggiornamento già in corso (es. da /price) viene condiviso invece di essere ripetuto
+    API_CACHE.expire('prices')
+    await refresh_prices(context)
+
+async def refresh_prices(context):
+    """Porta in bot_data i prezzi della cache condivisa, ricaricandoli se scaduti."""
+    prices = await cached_api('prices')
+    if prices:
+        context.bot_data['btc_prices'].update(prices)
+        context.bot_data['last_price_update'] = time()
 
 # Gestione conversazioni
 async def end_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -269,46 +638,61 @@ async def end_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     context.user_data.clear()
     return ConversationHandler.END
 
+def add_subscription(user_id, kind, value, direction='', min_amount=0, targets=''):
+    """Salva una sottoscrizione (indirizzo, mempool o tx); se esiste già ne aggiorna minimo e soglie."""
+    c = DB_CONN.cursor()
+    user_key = ensure_user(c, user_id)
+    object_id = ensure_watched_object(c, 'tx' if kind == 'tx' else 'address', value)
+    c.execute('INSERT INTO subscriptions (user_id, object_id, kind, direction, min_amount, created, targets) VALUES (?, ?, ?, ?, ?, ?, ?) '
+              'ON CONFLICT (user_id, object_id, kind, direction) DO UPDATE SET min_amount = excluded.min_amount, targets = excluded.targets',
+              (user_key, object_id, kind, direction, min_amount, int(time()), targets))
+    DB_CONN.commit()
+
+def add_threshold(user_id, kind, value, direction, currency=''):
+    """Salva una soglia fee o prezzo; una soglia identica già notificata torna attiva."""
+    c = DB_CONN.cursor()
+    user_key = ensure_user(c, user_id)
+    c.execute('INSERT INTO thresholds (user_id, kind, currency, value, direction) VALUES (?, ?, ?, ?, ?) '
+              'ON CONFLICT (user_id, kind, currency, value, direction) DO UPDATE SET notified = 0',
+              (user_key, kind, currency, value, direction))
+    DB_CONN.commit()
+
 # Comando /track_send
 async def track_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Avvia il monitoraggio degli invii da un indirizzo Bitcoin."""
     context.user_data.clear()
-    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per invii:')
+    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per invii (opzionale: importo minimo in sats, es. "bc1... 100000"):')
     return SEND_ADDRESS_INPUT
 
 async def set_send_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta l'indirizzo per il monitoraggio degli invii."""
-    address = update.message.text.strip()
-    if not is_valid_bitcoin_address(address):
-        await update.message.reply_text('Indirizzo non valido. Riprova.')
+    parsed = parse_address_input(update.message.text.strip())
+    if parsed is None:
+        await update.message.reply_text('Indirizzo o importo non valido. Riprova.')
         return SEND_ADDRESS_INPUT
-    user_id = str(update.effective_user.id)
-    timestamp = int(time())
-    c = DB_CONN.cursor()
-    c.execute('INSERT INTO address_subscriptions VALUES (?, ?, ?, ?)', (user_id, address, 'send', timestamp))
-    DB_CONN.commit()
-    await update.message.reply_text(f'Monitoraggio invio avviato per {address}.')
+    address, min_amount = parsed
+    add_subscription(str(update.effective_user.id), 'address', address, 'send', min_amount)
+    refresh_watched_address(address)
+    await update.message.reply_text(f'Monitoraggio invio avviato per {address}{format_min_amount(min_amount)}.')
     return ConversationHandler.END
 
 # Comando /track_receive
 async def track_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Avvia il monitoraggio delle ricezioni su un indirizzo Bitcoin."""
     context.user_data.clear()
-    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per ricezioni:')
+    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per ricezioni (opzionale: importo minimo in sats, es. "bc1... 100000"):')
     return RECEIVE_ADDRESS_INPUT
 
 async def set_receive_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta l'indirizzo per il monitoraggio delle ricezioni."""
-    address = update.message.text.strip()
-    if not is_valid_bitcoin_address(address):
-        await update.message.reply_text('Indirizzo non valido. Riprova.')
+    parsed = parse_address_input(update.message.text.strip())
+    if parsed is None:
+        await update.message.reply_text('Indirizzo o importo non valido. Riprova.')
         return RECEIVE_ADDRESS_INPUT
-    user_id = str(update.effective_user.id)
-    timestamp = int(time())
-    c = DB_CONN.cursor()
-    c.execute('INSERT INTO address_subscriptions VALUES (?, ?, ?, ?)', (user_id, address, 'receive', timestamp))
-    DB_CONN.commit()
-    await update.message.reply_text(f'Monitoraggio ricezione avviato per {address}.')
+    address, min_amount = parsed
+    add_subscription(str(update.effective_user.id), 'address', address, 'receive', min_amount)
+    refresh_watched_address(address)
+    await update.message.reply_text(f'Monitoraggio ricezione avviato per {address}{format_min_amount(min_amount)}.')
     return ConversationHandler.END
 
 # Comando /track_tx
@@ -325,108 +709,481 @@ async def set_tx_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text('TxID non valido. Riprova.')
         return TX_ID_INPUT
     context.user_data['txid'] = txid
-    await update.message.reply_text('Numero di conferme desiderate?')
+    await update.message.reply_text(
+        'Numero di conferme desiderate?\n'
+        'Puoi indicarne più di uno (es. 1,3,6) e usare 0 per essere avvisato quando la tx entra in mempool.'
+    )
     return TX_CONFIRMATIONS_INPUT
 
+def parse_confirmation_thresholds(text):
+    """Converte un elenco di soglie di conferma (es. "0,1,3,6") in una lista ordinata di interi."""
+    thresholds = sorted({int(value) for value in re.split(r'[\s,;]+', text.strip()) if value})
+    if not thresholds or thresholds[0] < 0:
+        raise ValueError('Soglie non valide')
+    return thresholds
+
+def format_tx_thresholds(thresholds):
+    """Formatta le soglie di una tx monitorata per i messaggi all'utente."""
+    return ', '.join('mempool' if threshold == TX_EVENT_MEMPOOL else str(threshold) for threshold in thresholds)
+
 async def set_tx_confirmations(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Imposta il numero di conferme per il monitoraggio della transazione."""
+    """Imposta le soglie di conferma per il monitoraggio della transazione."""
     try:
-        confirmations = int(update.message.text)
-        if confirmations <= 0:
-            await update.message.reply_text('Numero positivo richiesto.')
-            return TX_CONFIRMATIONS_INPUT
-        user_id = str(update.effective_user.id)
+        thresholds = parse_confirmation_thresholds(update.message.text)
         txid = context.user_data['txid']
-        timestamp = int(time())
-        c = DB_CONN.cursor()
-        c.execute('INSERT INTO tx_subscriptions VALUES (?, ?, ?, ?)', (user_id, txid, confirmations, timestamp))
-        DB_CONN.commit()
-        await update.message.reply_text(f'Monitoraggio tx {txid} per {confirmations} conferme.')
+        add_subscription(str(update.effective_user.id), 'tx', txid, targets=','.join(map(str, thresholds)))
+        await update.message.reply_text(f'Monitoraggio tx {txid} per le soglie: {format_tx_thresholds(thresholds)}.')
         return ConversationHandler.END
     except ValueError:
         await update.message.reply_text('Numero non valido. Riprova.')
         return TX_CONFIRMATIONS_INPUT
 
 # Funzioni di monitoraggio
+# Sottoscrizioni di un tipo con indirizzo e destinatario: letta dall'indice coprente idx_subscriptions_monitor
+SUBSCRIBERS_QUERY = ('SELECT o.value, s.user_id, u.chat_id, s.direction, s.created, s.min_amount FROM subscriptions s '
+                     'JOIN watched_objects o ON o.id = s.object_id JOIN users u ON u.id = s.user_id WHERE s.kind = ?')
+
+# Digest di stato di ciascun indirizzo all'ultimo controllo completo
+ADDRESS_STATUS = {}
+
 async def monitor_addresses(context: ContextTypes.DEFAULT_TYPE):
     """Monitora gli indirizzi per invii e ricezioni confermati."""
     c = DB_CONN.cursor()
-    c.execute('SELECT user_id, address, type, timestamp FROM address_subscriptions')
-    subscriptions = c.fetchall()
+    c.execute(SUBSCRIBERS_QUERY, ('address',))
+    subscriptions_by_address = {}
+    for address, user_key, user_id, sub_type, activation_timestamp, min_amount in c.fetchall():
+        subscriptions_by_address.setdefault(address, []).append((user_key, user_id, sub_type, activation_timestamp, min_amount))
+    global BLOCK_SCAN_GAP
+    for address in list(ADDRESS_STATUS):
+        if address not in subscriptions_by_address:
+            del ADDRESS_STATUS[address]
+            PERSISTENT_CACHE.delete(f'status:{address}')
+            TX_CACHE.invalidate(address)
+    TX_CACHE.purge_expired()
+    # Con la scansione dei blocchi attiva si ricontrollano solo gli indirizzi nuovi o toccati
+    # da un blocco; dopo una scansione fallita si ricontrolla tutto
+    to_check = list(subscriptions_by_address)
+    if BLOCK_SCAN_ENABLED:
+        # La scansione gira in un thread: si rimuovono solo gli indirizzi letti qui
+        dirty = set(DIRTY_ADDRESSES)
+        DIRTY_ADDRESSES.difference_update(dirty)
+        if BLOCK_SCAN_GAP:
+            BLOCK_SCAN_GAP = False
+        else:
+            to_check = [address for address in to_check if address in dirty or address not in ADDRESS_STATUS]
+    # Un digest invariato significa nessuna nuova tx: lo storico completo non viene scaricato
+    statuses = await asyncio.to_thread(get_address_statuses, to_check)
     notified_list = []
-    for user_id, address, sub_type, activation_timestamp in subscriptions:
-        txs = get_address_transactions(address)
+    batch = NotificationBatch('indirizzi')
+    for address in to_check:
+        subscribers = subscriptions_by_address[address]
+        status = statuses.get(address)
+        if status is not None and ADDRESS_STATUS.get(address) == status:
+            continue
+        txs = get_address_transactions(address, fresh=status is not None)
+        if txs is None:
+            continue
         for tx in txs:
-            txid = tx['txid']
-            c.execute('SELECT 1 FROM notified_transactions WHERE user_id = ? AND txid = ?', (user_id, txid))
-            if c.fetchone():
+            if not tx.confirmed:
                 continue
-            tx_details = get_transaction_details(txid)
-            if tx_details and tx_details.get('status', {}).get('confirmed', False):
-                block_time = tx_details["status"]["block_time"]
+            txid = tx.txid
+            block_time = tx.block_time
+            # Variazione netta dell'indirizzo, calcolata una volta per tx e condivisa da tutti i sottoscrittori;
+            # il suo segno decide il verso, a cui si applicano l'importo minimo e i totali del riepilogo
+            net_value = tx.net_value(address)
+            direction = tx.direction(address)
+            amount = -net_value if direction == 'send' else net_value
+            for user_key, user_id, sub_type, activation_timestamp, min_amount in subscribers:
                 if block_time < activation_timestamp:
                     continue
-                block_time_str = datetime.fromtimestamp(block_time).strftime('%Y-%m-%d %H:%M:%S')
-                if sub_type == 'send' and any(inp['prevout']['scriptpubkey_address'] == address for inp in tx_details.get('vin', [])):
-                    await context.bot.send_message(chat_id=user_id, text=f'Invio da {address}: {txid} il {block_time_str}')
-                    notified_list.append((user_id, txid))
-                elif sub_type == 'receive' and any(out['scriptpubkey_address'] == address for out in tx_details.get('vout', [])):
-                    await context.bot.send_message(chat_id=user_id, text=f'Ricezione su {address}: {txid} il {block_time_str}')
-                    notified_list.append((user_id, txid))
+                if sub_type != direction or amount < min_amount:
+                    continue
+                c.execute('SELECT 1 FROM notified_transactions WHERE user_id = ? AND txid = ?', (user_key, txid))
+                if c.fetchone():
+                    continue
+                template = ADDRESS_SEND_TEMPLATE if sub_type == 'send' else ADDRESS_RECEIVE_TEMPLATE
+                text = template.format(address=address, txid=txid, time=format_timestamp(block_time), amount=net_value)
+                batch.add(user_id, text, sub_type, amount)
+                notified_list.append((user_key, txid))
+        if status is not None and ADDRESS_STATUS.get(address) != status:
+            ADDRESS_STATUS[address] = status
+            PERSISTENT_CACHE.put(f'status:{address}', status)
+    await batch.flush(context.bot)
     if notified_list:
-        c.executemany('INSERT INTO notified_transactions VALUES (?, ?)', notified_list)
+        c.executemany('INSERT OR IGNORE INTO notified_transactions (user_id, txid) VALUES (?, ?)', notified_list)
         DB_CONN.commit()
+    await asyncio.to_thread(PERSISTENT_CACHE.commit)
+
+# Motore di monitoraggio delle transazioni: ogni txid viene risolto una sola volta per ciclo
+TX_EVENT_MEMPOOL = 0
+# Altezza e orario di conferma delle tx monitorate già confermate (non serve interrogarle di nuovo)
+CONFIRMED_TX_CACHE = {}
+# Altezza del tip all'ultima risoluzione delle tx già viste in mempool
+TX_LAST_RESOLVED_TIP = {}
+
+def resolve_tracked_tx(txid, tip_height):
+    """Restituisce (stato, conferme, block_time) di una tx monitorata, o None in caso di errore."""
+    if txid in CONFIRMED_TX_CACHE:
+        block_height, block_time = CONFIRMED_TX_CACHE[txid]
+        return 'confirmed', tip_height - block_height + 1, block_time
+    tx_status = get_transaction_status(txid)
+    if tx_status is None:
+        return None
+    if tx_status.get('missing'):
+        return 'missing', 0, None
+    if tx_status.get('confirmed'):
+        CONFIRMED_TX_CACHE[txid] = (tx_status['block_height'], tx_status['block_time'])
+        PERSISTENT_CACHE.put(f'txstatus:{txid}', CONFIRMED_TX_CACHE[txid])
+        return 'confirmed', tip_height - tx_status['block_height'] + 1, tx_status['block_time']
+    return 'mempool', 0, None
+
+# Pacchetti delle tx monitorate (antenati e figli CPFP), con cache condivisa tra tx che hanno genitori comuni
+TX_PACKAGES = PackageTracker(CHAIN_BACKEND)
+# Fee rate proprio ed effettivo per txid, ricalcolato al primo passaggio in mempool e a ogni nuovo blocco
+TX_PACKAGE_INFO = {}
+# Tip dell'ultimo ricalcolo dei pacchetti
+TX_PACKAGE_TIP = None
+# Tx mai viste in mempool: il monitoraggio termina dopo questo tempo dalla sottoscrizione
+TX_UNSEEN_MAX_AGE = int(os.getenv('TX_UNSEEN_MAX_AGE_DAYS', '14')) * DAY
+# Ultimo indice di blocco stimato per txid (0 = prossimo blocco, None = oltre la proiezione)
+TX_ETA = {}
+# Variazione minima, in blocchi, che genera una notifica ai sottoscrittori della mempool (0 = disattivato)
+TX_ETA_NOTIFY_BLOCKS = int(os.getenv('TX_ETA_NOTIFY_BLOCKS', '3'))
+# Indice dei blocchi proiettati, ricostruito solo quando la risposta in cache cambia
+ETA_INDEX = (None, None)
+
+def get_eta_index(blocks):
+    """Restituisce l'indice di stima per la risposta mempool_blocks corrente."""
+    global ETA_INDEX
+    if ETA_INDEX[0] is not blocks:
+        ETA_INDEX = (blocks, MempoolEtaIndex(blocks))
+    return ETA_INDEX[1]
+
+def render_tx_eta(info, position):
+    """Compone la riga con la stima di conferma (e il dettaglio del pacchetto, se la tx ne fa parte)."""
+    if position is None:
+        text = TX_ETA_BEYOND_TEMPLATE.format(fee_rate=info.effective_rate)
+    else:
+        text = TX_ETA_TEMPLATE.format(block=position + 1, minutes=eta_seconds(position) // 60, fee_rate=info.effective_rate)
+    if info.ancestors or info.descendants:
+        text += '\n' + TX_PACKAGE_TEMPLATE.format(fee_rate=info.fee_rate, ancestors=info.ancestors, descendants=info.descendants)
+    return text
+
+def find_replacement(txid):
+    """Txid che ha sostituito una tx monitorata, o None se è stata espulsa (o non è determinabile)."""
+    try:
+        return CHAIN_BACKEND.tx_replacement(txid)
+    except NotSupported:
+        pass
+    except BackendError as e:
+        print(f"Errore nella lettura delle sostituzioni di {txid}: {e}")
+    # Senza storico RBF si cerca una tx che spende gli stessi output (dalla cache dei pacchetti)
+    try:
+        return TX_PACKAGES.conflict(txid)
+    except BackendError as e:
+        print(f"Errore nella ricerca dei conflitti di {txid}: {e}")
+        return None
+
+def parse_stored_thresholds(targets):
+    """Legge le soglie salvate di una sottoscrizione tx."""
+    return [int(value) for value in targets.split(',')]
 
 async def monitor_transactions(context: ContextTypes.DEFAULT_TYPE):
-    """Monitora le transazioni per il numero di conferme specificato."""
+    """Monitora le transazioni ed emette le soglie di conferma man mano che vengono superate."""
     c = DB_CONN.cursor()
-    c.execute('SELECT user_id, txid, confirmations, timestamp FROM tx_subscriptions')
-    subscriptions = c.fetchall()
-    for user_id, txid, target_confirmations, activation_timestamp in subscriptions:
-        tx_details = get_transaction_details(txid)
-        if tx_details and tx_details.get('status', {}).get('confirmed', False):
-            block_time = tx_details["status"]["block_time"]
-            if block_time < activation_timestamp:
+    c.execute('SELECT s.id, u.chat_id, o.value, s.targets, s.reached, s.created FROM subscriptions s '
+              "JOIN watched_objects o ON o.id = s.object_id JOIN users u ON u.id = s.user_id WHERE s.kind = 'tx'")
+    subscriptions_by_txid = {}
+    for row in c.fetchall():
+        subscriptions_by_txid.setdefault(row[2], []).append(row)
+    for txid in list(CONFIRMED_TX_CACHE):
+        if txid not in subscriptions_by_txid:
+            del CONFIRMED_TX_CACHE[txid]
+            PERSISTENT_CACHE.delete(f'txstatus:{txid}')
+    for cache in (TX_LAST_RESOLVED_TIP, TX_PACKAGE_INFO, TX_ETA):
+        for txid in list(cache):
+            if txid not in subscriptions_by_txid:
+                del cache[txid]
+    # Il tracker può essere occupato da una ricerca di /tx_fee in un altro thread: l'attesa non blocca il loop
+    await asyncio.to_thread(TX_PACKAGES.retain, subscriptions_by_txid)
+    tip_height = get_last_block_height()
+    if tip_height is None:
+        return
+    resolved_by_txid = {}
+    for txid, rows in subscriptions_by_txid.items():
+        all_seen = all(str(TX_EVENT_MEMPOOL) in row[4].split(',') for row in rows)
+        # Una tx già vista in mempool può cambiare stato solo con un nuovo blocco
+        if all_seen and txid not in CONFIRMED_TX_CACHE and TX_LAST_RESOLVED_TIP.get(txid) == tip_height:
+            resolved_by_txid[txid] = ('mempool', 0, None)
+        else:
+            resolved = resolve_tracked_tx(txid, tip_height)
+            if resolved is None:
+                continue
+            TX_LAST_RESOLVED_TIP[txid] = tip_height
+            resolved_by_txid[txid] = resolved
+    # Pacchetti ricalcolati in un'unica passata batch per le tx nuove in mempool e dopo ogni blocco
+    in_mempool = [txid for txid, resolved in resolved_by_txid.items() if resolved[0] == 'mempool']
+    global TX_PACKAGE_TIP
+    outdated = [txid for txid in in_mempool if txid not in TX_PACKAGE_INFO or TX_PACKAGE_TIP != tip_height]
+    TX_PACKAGE_TIP = tip_height
+    if outdated:
+        try:
+            TX_PACKAGE_INFO.update(await asyncio.to_thread(TX_PACKAGES.refresh, outdated, tip_height))
+        except BackendError as e:
+            print(f"Errore nel calcolo dei pacchetti delle tx monitorate: {e}")
+    # Blocchi proiettati letti una volta per ciclo: la stima di ogni tx è una bisezione sull'indice
+    mempool_blocks = await cached_api('mempool_blocks')
+    eta_index = get_eta_index(mempool_blocks) if mempool_blocks else None
+    retired = False
+    for txid, (state, confirmations, block_time) in resolved_by_txid.items():
+        rows = subscriptions_by_txid[txid]
+        all_seen = all(str(TX_EVENT_MEMPOOL) in row[4].split(',') for row in rows)
+        eta_text = None
+        if state != 'mempool':
+            TX_PACKAGE_INFO.pop(txid, None)
+            TX_ETA.pop(txid, None)
+        elif eta_index is not None and txid in TX_PACKAGE_INFO:
+            info = TX_PACKAGE_INFO[txid]
+            position = eta_index.block_position(info.effective_rate)
+            eta_text = render_tx_eta(info, position)
+            previous = TX_ETA.get(txid, position)
+            TX_ETA[txid] = position
+            # Notifica ai sottoscrittori della mempool quando la stima si sposta in modo rilevante (anche per un CPFP)
+            if TX_ETA_NOTIFY_BLOCKS and all_seen and eta_changed(previous, position, TX_ETA_NOTIFY_BLOCKS):
+                for _, user_id, _, targets, _, _ in rows:
+                    if TX_EVENT_MEMPOOL in parse_stored_thresholds(targets):
+                        await context.bot.send_message(chat_id=user_id, text=f'Tx {txid}: stima aggiornata.\n{eta_text}')
+        # Una tx sparita viene confrontata una sola volta con lo storico RBF o con le spese dei suoi input
+        replacement = None
+        if state == 'missing' and (any(str(TX_EVENT_MEMPOOL) in row[4].split(',') for row in rows) or txid in TX_PACKAGES.txs):
+            replacement = await asyncio.to_thread(find_replacement, txid)
+        # Il testo della conferma è identico per tutti i sottoscrittori della tx
+        confirmations_text = None
+        if state == 'confirmed':
+            confirmations_text = TX_CONFIRMATIONS_TEMPLATE.format(txid=txid, confirmations=confirmations, time=format_timestamp(block_time))
+        for subscription_id, user_id, _, targets, reached, created in rows:
+            thresholds = parse_stored_thresholds(targets)
+            reached = {int(value) for value in reached.split(',') if value}
+            if state == 'missing':
+                # Sostituita, espulsa dopo essere stata vista, o mai comparsa entro TX_UNSEEN_MAX_AGE
+                if replacement:
+                    text = TX_REPLACED_TEMPLATE.format(txid=txid, replacement=replacement)
+                elif TX_EVENT_MEMPOOL in reached:
+                    text = TX_EVICTED_TEMPLATE.format(txid=txid)
+                elif created and time() - created > TX_UNSEEN_MAX_AGE:
+                    text = TX_UNSEEN_TEMPLATE.format(txid=txid, days=TX_UNSEEN_MAX_AGE // DAY)
+                else:
+                    continue
+                await context.bot.send_message(chat_id=user_id, text=text)
+                c.execute('DELETE FROM subscriptions WHERE id = ?', (subscription_id,))
+                retired = True
+                continue
+            crossed = {TX_EVENT_MEMPOOL}
+            if state == 'confirmed':
+                crossed.update(threshold for threshold in thresholds if 0 < threshold <= confirmations)
+            newly_crossed = crossed - reached
+            if not newly_crossed:
                 continue
-            block_height = tx_details['status'].get('block_height', 0)
-            try:
-                latest_block_height = requests.get(f'{MEMPOOL_API_URL}/blocks/tip/height').json()
-                confirmations = latest_block_height - block_height + 1
-                if confirmations >= target_confirmations:
-                    block_time_str = datetime.fromtimestamp(block_time).strftime('%Y-%m-%d %H:%M:%S')
-                    await context.bot.send_message(chat_id=user_id, text=f'Tx {txid} ha {confirmations} conferme il {block_time_str}.')
-                    c.execute('DELETE FROM tx_subscriptions WHERE user_id = ? AND txid = ?', (user_id, txid))
-                    DB_CONN.commit()
-            except (requests.RequestException, ValueError):
-                pass
+            # Tx già confermata quando l'utente si è iscritto: le soglie superate prima dell'iscrizione
+            # vengono registrate alla prima lettura senza notifica, quelle successive sono notificate
+            already_passed = state == 'confirmed' and not reached and created and block_time is not None and block_time < created
+            if state == 'mempool' and TX_EVENT_MEMPOOL in thresholds:
+                text = f'Tx {txid} è in mempool, in attesa di conferma.'
+                await context.bot.send_message(chat_id=user_id, text=f'{text}\n{eta_text}' if eta_text else text)
+            reached |= newly_crossed
+            # Una tx vista per la prima volta già confermata ha saltato l'evento mempool: la conferma
+            # lo sostituisce, e non manca mai se la sottoscrizione si chiude subito
+            first_seen_confirmed = state == 'confirmed' and not reached - newly_crossed
+            if (not already_passed and any(threshold in thresholds and threshold > 0 for threshold in newly_crossed)) or \
+                    (first_seen_confirmed and (TX_EVENT_MEMPOOL in thresholds or thresholds[-1] in reached)):
+                await context.bot.send_message(chat_id=user_id, text=confirmations_text)
+            if thresholds[-1] in reached:
+                c.execute('DELETE FROM subscriptions WHERE id = ?', (subscription_id,))
+                retired = True
+            else:
+                c.execute('UPDATE subscriptions SET reached = ? WHERE id = ?', (','.join(map(str, sorted(reached))), subscription_id))
+    if retired:
+        prune_watched_objects(c)
+    DB_CONN.commit()
+    await asyncio.to_thread(PERSISTENT_CACHE.commit)
+
+# Storico delle fee: un campione per ciclo di monitor_fees (5 minuti), due settimane di capacità
+FEE_HISTORY_PATH = 'fee_history.bin'
+FEE_HISTORY_CAPACITY = 2 * WEEK // 300
+FEE_HISTORY = FeeHistory.load(FEE_HISTORY_PATH, FEE_HISTORY_CAPACITY)
+# Finestra e numero minimo di campioni per le soglie relative (es. "10%" = 10% più basso della settimana)
+FEE_PERCENTILE_WINDOW = WEEK
+FEE_PERCENTILE_MIN_SAMPLES = DAY // 300
+
+def is_fee_percentile_reached(current_fee, percentile):
+    """Verifica se la fee attuale rientra nel percentile più basso della finestra configurata."""
+    if len(FEE_HISTORY.window('half_hour', FEE_PERCENTILE_WINDOW)) < FEE_PERCENTILE_MIN_SAMPLES:
+        return False
+    return current_fee <= FEE_HISTORY.percentile('half_hour', percentile, FEE_PERCENTILE_WINDOW)
+
+def render_fee_history_summary():
+    """Compone il riepilogo dello storico fee per /fee_forecast (vuoto se non ci sono campioni)."""
+    lines = []
+    for label, seconds in (('Ultime 24h', DAY), ('Ultima settimana', WEEK)):
+        min_max = FEE_HISTORY.min_max('half_hour', seconds)
+        if min_max:
+            median = FEE_HISTORY.percentile('half_hour', 50, seconds)
+            lines.append(f'- {label}: min {min_max[0]:g}, mediana {median:g}, max {min_max[1]:g} sat/byte\n')
+    if not lines:
+        return ''
+    current_fee = FEE_HISTORY.latest('half_hour')
+    rank = FEE_HISTORY.percentile_rank('half_hour', current_fee, WEEK)
+    lines.append(f'- Fee attuale ({current_fee:g} sat/byte): percentile {rank:.0f} della settimana\n')
+    return '\nStorico fee media:\n' + ''.join(lines)
+
+# Storico della mempool: vsize cumulativa per fascia di fee, campionata insieme alle fee
+MEMPOOL_HISTORY_PATH = 'mempool_history.bin'
+MEMPOOL_HISTORY = MempoolHistory.load(MEMPOOL_HISTORY_PATH, FEE_HISTORY_CAPACITY)
+# Finestra su cui si misura la crescita della coda per i tempi di smaltimento
+MEMPOOL_TREND_WINDOW = HOUR
+# Copertura minima della finestra perché una variazione venga mostrata da /mempool
+MEMPOOL_TREND_MIN_COVERAGE = 0.75
+# Fasce mostrate da /mempool (tutte presenti nello storico)
+MEMPOOL_REPORT_BANDS = (100, 50, 20, 10, 5, 2, 1)
+# Histogram della risposta /mempool corrente, ricostruita solo quando la risposta in cache cambia
+MEMPOOL_HISTOGRAM = (None, None)
+
+def get_mempool_histogram(mempool):
+    """Restituisce l'analisi della fee histogram per la risposta mempool corrente."""
+    global MEMPOOL_HISTOGRAM
+    if MEMPOOL_HISTOGRAM[0] is not mempool:
+        MEMPOOL_HISTOGRAM = (mempool, MempoolHistogram(mempool))
+    return MEMPOOL_HISTOGRAM[1]
+
+def format_clearing_time(seconds):
+    """Descrive il tempo stimato di smaltimento di una fascia."""
+    if seconds is None:
+        return 'non stimabile (la coda cresce più in fretta dei blocchi)'
+    if seconds < 90:
+        return 'entro il prossimo blocco'
+    if seconds < HOUR:
+        return f'circa {round(seconds / 60)} minuti'
+    if seconds < 2 * DAY:
+        return f'circa {seconds / HOUR:.1f} ore'
+    return f'circa {seconds / DAY:.1f} giorni'
+
+def render_mempool_summary(histogram):
+    """Compone le righe di /status sulla mempool: dimensione, tendenza e fee per il prossimo blocco."""
+    count = f'{histogram.count} transazioni, ' if histogram.count is not None else ''
+    text = f'- Mempool: {count}{histogram.vsize / 1e6:.1f} MvB\n'
+    change = MEMPOOL_HISTORY.change('vsize', MEMPOOL_TREND_WINDOW)
+    if change is not None and change[1] >= MEMPOOL_TREND_MIN_COVERAGE * MEMPOOL_TREND_WINDOW:
+        text += f'- Variazione ultima ora: {change[0] / 1e6:+.2f} MvB\n'
+    next_block_rate = histogram.min_rate_for_blocks(1)
+    if next_block_rate is not None:
+        text += f'- Fee minima per il prossimo blocco: circa {next_block_rate:g} sat/vB\n'
+    return text
+
+def render_mempool_report(mempool):
+    """Compone il messaggio di /mempool: vsize sopra ogni fascia, tempi di smaltimento e tendenze."""
+    histogram = get_mempool_histogram(mempool)
+    text = 'Analisi della mempool:\n' + render_mempool_summary(histogram)
+    if not histogram:
+        return text + 'Fee histogram non disponibile con questa sorgente dati.'
+    text += '\nVsize in attesa per fee rate (smaltimento al ritmo dell\'ultima ora):\n'
+    for band in MEMPOOL_REPORT_BANDS:
+        above = histogram.vsize_above(band)
+        seconds = clearing_seconds(above, MEMPOOL_HISTORY.growth(f'above_{band}', MEMPOOL_TREND_WINDOW))
+        text += MEMPOOL_BAND_LINE_TEMPLATE.format(band=band, vsize=above / 1e6, blocks=ceil(above / BLOCK_VSIZE), clearing=format_clearing_time(seconds))
+    trend = []
+    for label, seconds in (('Ultima ora', HOUR), ('Ultime 24h', DAY), ('Ultima settimana', WEEK)):
+        change = MEMPOOL_HISTORY.change('vsize', seconds)
+        if change is not None and change[1] >= MEMPOOL_TREND_MIN_COVERAGE * seconds:
+            trend.append(f'- {label}: {change[0] / 1e6:+.2f} MvB\n')
+    if trend:
+        text += '\nVariazione della mempool:\n' + ''.join(trend)
+    return text
+
+# Livelli della fee media annunciati sul canale delle fee quando vengono attraversati
+FEE_CHANNEL_LEVELS = sorted(float(value) for value in os.getenv('FEE_CHANNEL_LEVELS', '2,5,10,20,50,100').split(','))
+
+def load_channel_state(name):
+    """Stato del canale dal database; le versioni precedenti lo tenevano nella cache persistente."""
+    value = get_channel_state(DB_CONN.cursor(), name)
+    return PERSISTENT_CACHE.get(f'channel:{name}') if value is None else value
+
+def save_channel_state(name, value):
+    set_channel_state(DB_CONN.cursor(), name, value)
+    DB_CONN.commit()
+
+async def publish_fee_level(bot, current_fee):
+    """Pubblica sul canale delle fee l'attraversamento di uno dei livelli configurati."""
+    if EVENT_PUBLISHER.channel('fee') is None:
+        return
+    level = bisect_right(FEE_CHANNEL_LEVELS, current_fee)
+    previous = load_channel_state('fee_level')
+    if previous == level:
+        return
+    if previous is not None:
+        if level > previous:
+            text = FEE_LEVEL_UP_TEMPLATE.format(fee=current_fee, level=FEE_CHANNEL_LEVELS[level - 1])
+        else:
+            text = FEE_LEVEL_DOWN_TEMPLATE.format(fee=current_fee, level=FEE_CHANNEL_LEVELS[level])
+        await EVENT_PUBLISHER.publish(bot, 'fee', text)
+    save_channel_state('fee_level', level)
 
 async def monitor_fees(context: ContextTypes.DEFAULT_TYPE):
     """Monitora le fee medie rispetto alle soglie impostate, considerando la direzione."""
     c = DB_CONN.cursor()
-    c.execute('SELECT user_id, threshold, direction FROM fee_thresholds WHERE notified = 0')
+    c.execute("SELECT t.id, u.chat_id, t.value, t.direction FROM thresholds t JOIN users u ON u.id = t.user_id "
+              "WHERE t.kind = 'fee' AND t.notified = 0")
     thresholds = c.fetchall()
-    fees = get_mempool_fees()
+    mempool = await cached_api('mempool')
+    if mempool:
+        MEMPOOL_HISTORY.sample(get_mempool_histogram(mempool), time())
+        MEMPOOL_HISTORY.save(MEMPOOL_HISTORY_PATH)
+    fees = await cached_api('fees')
     if fees:
+        FEE_HISTORY.sample(fees, await cached_api('mempool_blocks'))
+        FEE_HISTORY.save(FEE_HISTORY_PATH)
         current_fee = fees['halfHourFee']
-        for user_id, threshold, direction in thresholds:
-            if (direction == 'below' and current_fee < threshold) or (direction == 'above' and current_fee > threshold):
+        await publish_fee_level(context.bot, current_fee)
+        for threshold_id, user_id, threshold, direction in thresholds:
+            if direction == 'percentile':
+                if is_fee_percentile_reached(current_fee, threshold):
+                    await context.bot.send_message(chat_id=user_id,
+                                                  text=f'La fee media è ora {current_fee} sat/byte, nel {threshold:g}% più basso dell\'ultima settimana.')
+                    c.execute('UPDATE thresholds SET notified = 1 WHERE id = ?', (threshold_id,))
+            elif (direction == 'below' and current_fee < threshold) or (direction == 'above' and current_fee > threshold):
                 await context.bot.send_message(chat_id=user_id,
                                               text=f'La fee media è ora {current_fee} sat/byte, che è {direction} la tua soglia di {threshold} sat/byte.')
-                c.execute('UPDATE fee_thresholds SET notified = 1 WHERE user_id = ? AND threshold = ? AND direction = ?',
-                          (user_id, threshold, direction))
+                c.execute('UPDATE thresholds SET notified = 1 WHERE id = ?', (threshold_id,))
         DB_CONN.commit()
 
 # Comando /set_fee_threshold
 async def set_fee_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta una soglia per le fee medie."""
     context.user_data.clear()
-    await update.message.reply_text('Inserisci la soglia fee media (sat/byte):')
+    channel = EVENT_PUBLISHER.channel('fee')
+    note = ''
+    if channel is not None:
+        levels = ', '.join(f'{level:g}' for level in FEE_CHANNEL_LEVELS)
+        note = f'I passaggi della fee media per {levels} sat/byte vengono pubblicati {channel.describe()}.\n\n'
+    await update.message.reply_text(
+        note +
+        'Inserisci la soglia fee media (sat/byte)\n'
+        'oppure una percentuale (es. 10%) per essere avvisato quando la fee è nel 10% più basso della settimana:'
+    )
     return FEE_THRESHOLD_INPUT
 
 async def set_fee_threshold_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Salva la soglia fee specificata dall'utente, considerando la fee attuale."""
     try:
-        threshold = float(update.message.text)
+        text = update.message.text.strip()
+        if text.endswith('%'):
+            percentile = float(text[:-1])
+            if not 0 < percentile < 100:
+                await update.message.reply_text('Percentuale compresa tra 0 e 100 richiesta.')
+                return FEE_THRESHOLD_INPUT
+            add_threshold(str(update.effective_user.id), 'fee', percentile, 'percentile')
+            await update.message.reply_text(f'Soglia fee impostata: riceverai una notifica quando la fee media sarà nel {percentile:g}% più basso dell\'ultima settimana.')
+            return ConversationHandler.END
+        threshold = float(text)
         if threshold <= 0:
             await update.message.reply_text('Numero positivo richiesto.')
             return FEE_THRESHOLD_INPUT
@@ -443,27 +1200,29 @@ async def set_fee_threshold_value(update: Update, context: ContextTypes.DEFAULT_
         else:
             direction = 'below'
             message = f'Soglia fee impostata a {threshold} sat/byte. Riceverai una notifica quando la fee scende sotto questa soglia.'
-        c = DB_CONN.cursor()
-        c.execute('INSERT OR REPLACE INTO fee_thresholds (user_id, threshold, direction, notified) VALUES (?, ?, ?, 0)',
-                  (user_id, threshold, direction))
-        DB_CONN.commit()
+        add_threshold(user_id, 'fee', threshold, direction)
         await update.message.reply_text(message)
         return ConversationHandler.END
     except ValueError:
         await update.message.reply_text('Numero non valido. Riprova.')
         return FEE_THRESHOLD_INPUT
 
+def render_current_fees(fees):
+    """Compone il messaggio di /current_fees."""
+    return (
+        f'Fee attuali:\n'
+        f'- Bassa: {fees["hourFee"]} sat/byte\n'
+        f'- Media: {fees["halfHourFee"]} sat/byte\n'
+        f'- Alta: {fees["fastestFee"]} sat/byte'
+    )
+
 # Comando /current_fees
+@rate_limited('current_fees', stale_api_reply('fees', render_current_fees))
 async def current_fees(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mostra le fee attuali raccomandate."""
-    fees = get_mempool_fees()
+    fees = await cached_api('fees')
     if fees:
-        await update.message.reply_text(
-            f'Fee attuali:\n'
-            f'- Bassa: {fees["hourFee"]} sat/byte\n'
-            f'- Media: {fees["halfHourFee"]} sat/byte\n'
-            f'- Alta: {fees["fastestFee"]} sat/byte'
-        )
+        await update.message.reply_text(render_current_fees(fees))
     else:
         await update.message.reply_text('Impossibile ottenere le fee.')
 
@@ -472,77 +1231,84 @@ async def delete_my_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancella tutti i dati dell'utente dal database."""
     user_id = str(update.effective_user.id)
     c = DB_CONN.cursor()
-    c.execute('DELETE FROM address_subscriptions WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM fee_thresholds WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM tx_subscriptions WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM notified_transactions WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM mempool_address_subscriptions WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM notified_mempool_transactions WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM solo_miner_subscriptions WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM price_alerts WHERE user_id = ?', (user_id,))
-    c.execute('DELETE FROM price_thresholds WHERE user_id = ?', (user_id,))
+    c.execute("SELECT DISTINCT o.value FROM users u JOIN subscriptions s ON s.user_id = u.id "
+              "JOIN watched_objects o ON o.id = s.object_id WHERE u.chat_id = ? AND s.kind = 'address'", (user_id,))
+    addresses = [row[0] for row in c.fetchall()]
+    c.execute('SELECT id FROM users WHERE chat_id = ?', (user_id,))
+    user = c.fetchone()
+    if user:
+        PRICE_ALERT_WHEEL.cancel(user[0])
+    # Sottoscrizioni, soglie, notifiche e impostazioni vengono cancellate a cascata
+    c.execute('DELETE FROM users WHERE chat_id = ?', (user_id,))
+    prune_watched_objects(c)
     DB_CONN.commit()
+    for address in addresses:
+        refresh_watched_address(address)
     await update.message.reply_text('Dati cancellati.')
 
-# Comando /list_monitors
-async def list_monitors(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Elenca tutti i monitoraggi attivi dell'utente."""
-    user_id = str(update.effective_user.id)
+# Elenco dei monitoraggi di un utente: sezioni nell'ordine di visualizzazione
+MONITOR_SECTIONS = [
+    ('address', 'Indirizzi (confermate)'),
+    ('tx', 'Transazioni'),
+    ('fee', 'Soglie fee'),
+    ('mempool', 'Indirizzi (non confermate)'),
+    ('solo_miner', 'Monitoraggio solo miner'),
+    ('price_alert', 'Notifiche prezzo'),
+    ('price_threshold', 'Soglie prezzo'),
+]
+MONITOR_SECTION_ORDER = {section: position for position, (section, _) in enumerate(MONITOR_SECTIONS)}
+
+# Una sola query per tutti i monitoraggi dell'utente: (sezione, chiave, valore, dettaglio, minimo)
+USER_MONITORS_QUERY = '''
+    SELECT s.kind, s.id, o.value, CASE s.kind WHEN 'tx' THEN s.targets ELSE s.direction END, s.min_amount
+    FROM users u JOIN subscriptions s ON s.user_id = u.id JOIN watched_objects o ON o.id = s.object_id
+    WHERE u.chat_id = :user_id
+    UNION ALL
+    SELECT CASE t.kind WHEN 'fee' THEN 'fee' ELSE 'price_threshold' END, t.id,
+           CASE t.kind WHEN 'fee' THEN t.value ELSE t.currency END, CASE t.kind WHEN 'fee' THEN t.direction ELSE t.value END, 0
+    FROM users u JOIN thresholds t ON t.user_id = u.id
+    WHERE u.chat_id = :user_id AND (t.kind = 'fee' OR t.notified = 0)
+    UNION ALL
+    SELECT 'solo_miner', m.user_id, 'Monitoraggio solo miner', NULL, 0
+    FROM users u JOIN solo_miner_subscriptions m ON m.user_id = u.id WHERE u.chat_id = :user_id
+    UNION ALL
+    SELECT 'price_alert', p.user_id, p.frequency, p.currency, 0
+    FROM users u JOIN price_alerts p ON p.user_id = u.id WHERE u.chat_id = :user_id
+'''
+
+def get_user_monitors(user_id):
+    """Restituisce i monitoraggi dell'utente come (sezione, chiave, valore, dettaglio), nell'ordine di visualizzazione."""
     c = DB_CONN.cursor()
-    c.execute('SELECT address, type FROM address_subscriptions WHERE user_id = ?', (user_id,))
-    address_subs = c.fetchall()
-    c.execute('SELECT txid, confirmations FROM tx_subscriptions WHERE user_id = ?', (user_id,))
-    tx_subs = c.fetchall()
-    c.execute('SELECT threshold FROM fee_thresholds WHERE user_id = ?', (user_id,))
-    fee_thresholds = c.fetchall()
-    c.execute('SELECT address, type FROM mempool_address_subscriptions WHERE user_id = ?', (user_id,))
-    mempool_subs = c.fetchall()
-    c.execute('SELECT last_checked_height FROM solo_miner_subscriptions WHERE user_id = ?', (user_id,))
-    solo_miner_subs = c.fetchall()
-    c.execute('SELECT frequency, currency FROM price_alerts WHERE user_id = ?', (user_id,))
-    price_alert = c.fetchone()
-    c.execute('SELECT currency, threshold FROM price_thresholds WHERE user_id = ? AND notified = 0', (user_id,))
-    price_thresholds = c.fetchall()
-
-    all_monitors = []
-    if address_subs:
-        all_monitors.extend([('address', addr, typ) for addr, typ in address_subs])
-    if tx_subs:
-        all_monitors.extend([('tx', txid, conf) for txid, conf in tx_subs])
-    if fee_thresholds:
-        all_monitors.extend([('fee', threshold[0], None) for threshold in fee_thresholds])
-    if mempool_subs:
-        all_monitors.extend([('mempool', addr, typ) for addr, typ in mempool_subs])
-    if solo_miner_subs:
-        all_monitors.append(('solo_miner', 'Monitoraggio solo miner', None))
-    if price_alert:
-        all_monitors.append(('price_alert', price_alert[0], price_alert[1]))
-    if price_thresholds:
-        all_monitors.extend([('price_threshold', currency, threshold) for currency, threshold in price_thresholds])
-
-    if not all_monitors:
-        await update.message.reply_text('Nessun monitoraggio attivo.')
-        return
-
+    c.execute(USER_MONITORS_QUERY, {'user_id': user_id})
+    monitors = []
+    for section, key, val1, val2, min_amount in c.fetchall():
+        if section in ('address', 'mempool'):
+            val2 += format_min_amount(min_amount)
+        elif section == 'tx':
+            val2 = format_tx_thresholds(parse_stored_thresholds(val2))
+        monitors.append((section, key, val1, val2))
+    monitors.sort(key=lambda monitor: (MONITOR_SECTION_ORDER[monitor[0]], monitor[1]))
+    return monitors
+
+def render_monitor_list(all_monitors):
+    """Compone l'elenco numerato dei monitoraggi, raggruppati per sezione."""
     message = 'Monitoraggi attivi:\n'
     index = 1
-    for section, title in [
-        ('address', 'Indirizzi (confermate)'),
-        ('tx', 'Transazioni'),
-        ('fee', 'Soglie fee'),
-        ('mempool', 'Indirizzi (non confermate)'),
-        ('solo_miner', 'Monitoraggio solo miner'),
-        ('price_alert', 'Notifiche prezzo'),
-        ('price_threshold', 'Soglie prezzo')
-    ]:
+    for section, title in MONITOR_SECTIONS:
         if any(m[0] == section for m in all_monitors):
             message += f'{title}:\n'
-            for typ, val1, val2 in all_monitors:
+            for typ, _, val1, val2 in all_monitors:
                 if typ == section:
                     if section == 'address' or section == 'mempool':
                         message += f'{index}. {val1}, Tipo: {val2}\n'
+                    elif section == 'tx' and val1 in TX_ETA:
+                        position = TX_ETA[val1]
+                        eta = f'blocco {position + 1}' if position is not None else 'oltre i blocchi proiettati'
+                        message += f'{index}. {val1}, Conferme: {val2}, Stima: {eta}\n'
                     elif section == 'tx':
                         message += f'{index}. {val1}, Conferme: {val2}\n'
+                    elif section == 'fee' and val2 == 'percentile':
+                        message += f'{index}. {val1:g}% più basso della settimana\n'
                     elif section == 'fee':
                         message += f'{index}. {val1} sat/byte\n'
                     elif section == 'solo_miner':
@@ -553,81 +1319,27 @@ async def list_monitors(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         message += f'{index}. Valuta: {val1}, Soglia: {val2}\n'
                     index += 1
             message += '\n'
-    await update.message.reply_text(message)
+    return message
+
+# Comando /list_monitors
+async def list_monitors(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Elenca tutti i monitoraggi attivi dell'utente."""
+    all_monitors = get_user_monitors(str(update.effective_user.id))
+    if not all_monitors:
+        await update.message.reply_text('Nessun monitoraggio attivo.')
+        return
+    await update.message.reply_text(render_monitor_list(all_monitors))
 
 # Comando /delete_monitor
 async def delete_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Permette all'utente di cancellare un monitoraggio attivo."""
     context.user_data.clear()
-    user_id = str(update.effective_user.id)
-    c = DB_CONN.cursor()
-    c.execute('SELECT address, type FROM address_subscriptions WHERE user_id = ?', (user_id,))
-    address_subs = c.fetchall()
-    c.execute('SELECT txid, confirmations FROM tx_subscriptions WHERE user_id = ?', (user_id,))
-    tx_subs = c.fetchall()
-    c.execute('SELECT threshold FROM fee_thresholds WHERE user_id = ?', (user_id,))
-    fee_thresholds = c.fetchall()
-    c.execute('SELECT address, type FROM mempool_address_subscriptions WHERE user_id = ?', (user_id,))
-    mempool_subs = c.fetchall()
-    c.execute('SELECT last_checked_height FROM solo_miner_subscriptions WHERE user_id = ?', (user_id,))
-    solo_miner_subs = c.fetchall()
-    c.execute('SELECT frequency, currency FROM price_alerts WHERE user_id = ?', (user_id,))
-    price_alert = c.fetchone()
-    c.execute('SELECT currency, threshold FROM price_thresholds WHERE user_id = ? AND notified = 0', (user_id,))
-    price_thresholds = c.fetchall()
-
-    all_monitors = []
-    if address_subs:
-        all_monitors.extend([('address', addr, typ) for addr, typ in address_subs])
-    if tx_subs:
-        all_monitors.extend([('tx', txid, conf) for txid, conf in tx_subs])
-    if fee_thresholds:
-        all_monitors.extend([('fee', threshold[0], None) for threshold in fee_thresholds])
-    if mempool_subs:
-        all_monitors.extend([('mempool', addr, typ) for addr, typ in mempool_subs])
-    if solo_miner_subs:
-        all_monitors.append(('solo_miner', 'Monitoraggio solo miner', None))
-    if price_alert:
-        all_monitors.append(('price_alert', price_alert[0], price_alert[1]))
-    if price_thresholds:
-        all_monitors.extend([('price_threshold', currency, threshold) for currency, threshold in price_thresholds])
-
+    all_monitors = get_user_monitors(str(update.effective_user.id))
     if not all_monitors:
         await update.message.reply_text('Nessun monitoraggio da cancellare.')
         return ConversationHandler.END
-
-    message = 'Monitoraggi attivi:\n'
-    index = 1
-    for section, title in [
-        ('address', 'Indirizzi (confermate)'),
-        ('tx', 'Transazioni'),
-        ('fee', 'Soglie fee'),
-        ('mempool', 'Indirizzi (non confermate)'),
-        ('solo_miner', 'Monitoraggio solo miner'),
-        ('price_alert', 'Notifiche prezzo'),
-        ('price_threshold', 'Soglie prezzo')
-    ]:
-        if any(m[0] == section for m in all_monitors):
-            message += f'{title}:\n'
-            for typ, val1, val2 in all_monitors:
-                if typ == section:
-                    if section == 'address' or section == 'mempool':
-                        message += f'{index}. {val1}, Tipo: {val2}\n'
-                    elif section == 'tx':
-                        message += f'{index}. {val1}, Conferme: {val2}\n'
-                    elif section == 'fee':
-                        message += f'{index}. {val1} sat/byte\n'
-                    elif section == 'solo_miner':
-                        message += f'{index}. {val1}\n'
-                    elif section == 'price_alert':
-                        message += f'{index}. Frequenza: {val1}, Valuta: {val2}\n'
-                    elif section == 'price_threshold':
-                        message += f'{index}. Valuta: {val1}, Soglia: {val2}\n'
-                    index += 1
-            message += '\n'
-
     context.user_data['all_monitors'] = all_monitors
-    await update.message.reply_text(message + 'Inserisci il numero da cancellare:')
+    await update.message.reply_text(render_monitor_list(all_monitors) + 'Inserisci il numero da cancellare:')
     return DELETE_MONITOR_INPUT
 
 async def set_delete_monitor_number(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -638,24 +1350,23 @@ async def set_delete_monitor_number(update: Update, context: ContextTypes.DEFAUL
         if monitor_number < 0 or monitor_number >= len(all_monitors):
             await update.message.reply_text('Numero non valido. Riprova.')
             return DELETE_MONITOR_INPUT
-        typ, val1, val2 = all_monitors[monitor_number]
+        typ, key, val1, _ = all_monitors[monitor_number]
         user_id = str(update.effective_user.id)
         c = DB_CONN.cursor()
-        if typ == 'address':
-            c.execute('DELETE FROM address_subscriptions WHERE user_id = ? AND address = ? AND type = ?', (user_id, val1, val2))
-        elif typ == 'tx':
-            c.execute('DELETE FROM tx_subscriptions WHERE user_id = ? AND txid = ?', (user_id, val1))
-        elif typ == 'fee':
-            c.execute('DELETE FROM fee_thresholds WHERE user_id = ? AND threshold = ?', (user_id, val1))
-        elif typ == 'mempool':
-            c.execute('DELETE FROM mempool_address_subscriptions WHERE user_id = ? AND address = ? AND type = ?', (user_id, val1, val2))
+        # Le chiavi sono intere: la cancellazione è per chiave primaria, limitata alle righe dell'utente
+        if typ in ('address', 'mempool', 'tx'):
+            c.execute('DELETE FROM subscriptions WHERE id = ? AND user_id = (SELECT id FROM users WHERE chat_id = ?)', (key, user_id))
+            prune_watched_objects(c)
+        elif typ in ('fee', 'price_threshold'):
+            c.execute('DELETE FROM thresholds WHERE id = ? AND user_id = (SELECT id FROM users WHERE chat_id = ?)', (key, user_id))
         elif typ == 'solo_miner':
-            c.execute('DELETE FROM solo_miner_subscriptions WHERE user_id = ?', (user_id,))
+            c.execute('DELETE FROM solo_miner_subscriptions WHERE user_id = (SELECT id FROM users WHERE chat_id = ?)', (user_id,))
         elif typ == 'price_alert':
-            c.execute('DELETE FROM price_alerts WHERE user_id = ?', (user_id,))
-        elif typ == 'price_threshold':
-            c.execute('DELETE FROM price_thresholds WHERE user_id = ? AND currency = ? AND threshold = ?', (user_id, val1, val2))
+            c.execute('DELETE FROM price_alerts WHERE user_id = (SELECT id FROM users WHERE chat_id = ?)', (user_id,))
+            PRICE_ALERT_WHEEL.cancel(key)
         DB_CONN.commit()
+        if typ == 'address':
+            refresh_watched_address(val1)
         await update.message.reply_text(f'Monitoraggio {typ} cancellato.')
         return ConversationHandler.END
     except ValueError:
@@ -669,262 +1380,353 @@ async def tx_fee(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text('Inserisci l\'ID della transazione (txid) per calcolare la fee:')
     return TX_FEE_INPUT
 
+# Risposte di /tx_fee per txid: le richieste concorrenti sulla stessa tx condividono una sola ricerca
+TX_FEE_REPLIES = ResponseCache(max_entries=1000)
+TX_FEE_REPLY_TTL = 30
+
+def render_tx_fee(txid, tip_height):
+    """Compone la risposta di /tx_fee (None se la transazione non è stata trovata); bloccante."""
+    tx_details = get_transaction_details(txid)
+    if not tx_details:
+        return None
+    fee = tx_details.fee
+    if fee is None or fee < 0:
+        return "Dati transazione incompleti o errati."
+    message = f"Fee pagata per tx {txid}: {fee} sat"
+    if tx_details.vsize:
+        message += f"\nFee rate: {fee / tx_details.vsize:.1f} sat/vB"
+    if not tx_details.confirmed and tip_height is not None:
+        # Pacchetto calcolato con la cache condivisa con il monitoraggio
+        try:
+            info = TX_PACKAGES.refresh([txid], tip_height).get(txid)
+        except BackendError as e:
+            print(f"Errore nel calcolo del pacchetto di {txid}: {e}")
+            info = None
+        if info is not None and (info.ancestors or info.descendants):
+            message += '\n' + f"Fee rate effettivo: {info.effective_rate:.1f} sat/vB\n" + TX_PACKAGE_TEMPLATE.format(
+                fee_rate=info.fee_rate, ancestors=info.ancestors, descendants=info.descendants)
+    return message
+
+@rate_limited('tx_fee', lambda update, context: TX_FEE_REPLIES.peek(update.message.text.strip()))
 async def set_tx_fee_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Elabora il txid e calcola la fee della transazione."""
     txid = update.message.text.strip()
     if not is_valid_txid(txid):
         await update.message.reply_text('TxID non valido. Riprova.')
         return TX_FEE_INPUT
-    tx_details = get_transaction_details(txid)
-    if tx_details:
-        input_sum = sum(inp['prevout']['value'] for inp in tx_details['vin'] if 'prevout' in inp)
-        output_sum = sum(out['value'] for out in tx_details['vout'])
-        fee = input_sum - output_sum
-        if fee >= 0:
-            await update.message.reply_text(f"Fee pagata per tx {txid}: {fee} sat")
-        else:
-            await update.message.reply_text("Dati transazione incompleti o errati.")
-    else:
-        await update.message.reply_text("Impossibile ottenere i dettagli della transazione.")
+    tip_height = await cached_api('tip_height')
+    message = await TX_FEE_REPLIES.get(txid, lambda: render_tx_fee(txid, tip_height), TX_FEE_REPLY_TTL)
+    await update.message.reply_text(message or "Impossibile ottenere i dettagli della transazione.")
     return ConversationHandler.END
 
 # Comando /recent_blocks
+@rate_limited('recent_blocks', stale_api_reply('recent_blocks', lambda blocks: render_once('recent_blocks', blocks, render_recent_blocks)))
 async def recent_blocks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mostra informazioni sugli ultimi blocchi minati."""
-    try:
-        response = requests.get(f'{MEMPOOL_API_URL}/v1/blocks')
-        if response.status_code == 200:
-            blocks = response.json()
-            message = "Ultimi blocchi minati:\n"
-            for block in blocks[:5]:
-                height = block['height']
-                tx_count = block['tx_count']
-                total_fees_btc = block['extras']['totalFees'] / 100_000_000
-                miner = get_block_miner(block)
-                message += f"Blocco {height}: {tx_count} tx, fee totali: {total_fees_btc:.8f} BTC, Miner: {miner}\n"
-            await update.message.reply_text(message)
-        else:
-            await update.message.reply_text("Impossibile ottenere i dati dei blocchi.")
-    except requests.RequestException:
-        await update.message.reply_text("Errore di rete.")
+    blocks = await cached_api('recent_blocks')
+    if blocks:
+        await update.message.reply_text(render_once('recent_blocks', blocks, render_recent_blocks))
+    else:
+        await update.message.reply_text("Impossibile ottenere i dati dei blocchi.")
+
+def render_fee_forecast_reply(blocks):
+    """Compone il messaggio di /fee_forecast: previsioni e storico delle fee."""
+    return render_once('fee_forecast', blocks, render_fee_forecast) + render_fee_history_summary()
 
 # Comando /fee_forecast
+@rate_limited('fee_forecast', stale_api_reply('mempool_blocks', render_fee_forecast_reply))
 async def fee_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mostra le previsioni delle fee per i prossimi blocchi."""
-    try:
-        response = requests.get(f'{MEMPOOL_API_URL}/v1/fees/mempool-blocks')
-        if response.status_code == 200:
-            blocks = response.json()
-            message = "Previsioni fee per blocchi futuri:\n"
-            for i, block in enumerate(blocks[:3], 1):
-                fee_range = block['feeRange']
-                min_fee = round(fee_range[0])
-                max_fee = round(fee_range[-1])
-                message += f"Blocco {i}: {min_fee} - {max_fee} sat/byte\n"
-            await update.message.reply_text(message)
-        else:
-            await update.message.reply_text("Impossibile ottenere le previsioni fee.")
-    except requests.RequestException:
-        await update.message.reply_text("Errore di rete.")
+    blocks = await cached_api('mempool_blocks')
+    if blocks:
+        await update.message.reply_text(render_fee_forecast_reply(blocks))
+    else:
+        await update.message.reply_text("Impossibile ottenere le previsioni fee.")
 
-# Comando /status
-async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Mostra lo stato attuale della rete Bitcoin."""
-    fees = get_mempool_fees()
-    mempool_size = get_mempool_size()
-    tip_height = get_last_block_height()
+def render_status(fees, mempool, tip_height):
+    """Compone il messaggio di /status."""
     message = "Stato rete Bitcoin:\n"
     message += f"- Fee attuali: {fees['hourFee']}/{fees['halfHourFee']}/{fees['fastestFee']} sat/byte\n" if fees else "- Impossibile ottenere le fee.\n"
-    message += f"- Mempool: {mempool_size} transazioni\n" if mempool_size is not None else "- Impossibile ottenere la dimensione della mempool.\n"
+    message += render_mempool_summary(get_mempool_histogram(mempool)) if mempool else "- Impossibile ottenere la dimensione della mempool.\n"
     message += f"- Ultimo blocco: altezza {tip_height}\n" if tip_height is not None else "- Impossibile ottenere l'altezza del blocco.\n"
-    await update.message.reply_text(message)
+    return message
+
+def stale_status_reply(update, context):
+    """Risposta di ripiego di /status con i dati in cache."""
+    cached = [API_CACHE.peek(key) for key in ('fees', 'mempool', 'tip_height')]
+    return render_status(*cached) if any(value is not None for value in cached) else None
+
+# Comando /status
+@rate_limited('status', stale_status_reply)
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostra lo stato attuale della rete Bitcoin."""
+    fees, mempool, tip_height = await asyncio.gather(
+        cached_api('fees'), cached_api('mempool'), cached_api('tip_height'))
+    await update.message.reply_text(render_status(fees, mempool, tip_height))
+
+# Comando /mempool
+@rate_limited('mempool', stale_api_reply('mempool', render_mempool_report))
+async def mempool_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostra la mempool per fascia di fee rate con tempi di smaltimento e tendenze."""
+    mempool = await cached_api('mempool')
+    if mempool:
+        await update.message.reply_text(render_mempool_report(mempool))
+    else:
+        await update.message.reply_text("Impossibile ottenere i dati della mempool.")
 
 # Comando /track_send_mempool
 async def track_send_mempool(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Avvia il monitoraggio degli invii non confermati da un indirizzo."""
     context.user_data.clear()
-    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per invii non confermati:')
+    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per invii non confermati (opzionale: importo minimo in sats, es. "bc1... 100000"):')
     return SEND_ADDRESS_INPUT_MEMPOOL
 
 async def set_send_address_mempool(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta l'indirizzo per il monitoraggio degli invii non confermati."""
-    address = update.message.text.strip()
-    if not is_valid_bitcoin_address(address):
-        await update.message.reply_text('Indirizzo non valido. Riprova.')
+    parsed = parse_address_input(update.message.text.strip())
+    if parsed is None:
+        await update.message.reply_text('Indirizzo o importo non valido. Riprova.')
         return SEND_ADDRESS_INPUT_MEMPOOL
-    user_id = str(update.effective_user.id)
-    timestamp = int(time())
-    c = DB_CONN.cursor()
-    c.execute('INSERT INTO mempool_address_subscriptions VALUES (?, ?, ?, ?)', (user_id, address, 'send', timestamp))
-    DB_CONN.commit()
-    await update.message.reply_text(f'Monitoraggio invio non confermato avviato per {address}.')
+    address, min_amount = parsed
+    add_subscription(str(update.effective_user.id), 'mempool', address, 'send', min_amount)
+    await update.message.reply_text(f'Monitoraggio invio non confermato avviato per {address}{format_min_amount(min_amount)}.')
     return ConversationHandler.END
 
 # Comando /track_receive_mempool
 async def track_receive_mempool(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Avvia il monitoraggio delle ricezioni non confermate su un indirizzo."""
     context.user_data.clear()
-    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per ricezioni non confermate:')
+    await update.message.reply_text('Inserisci l\'indirizzo BTC da monitorare per ricezioni non confermate (opzionale: importo minimo in sats, es. "bc1... 100000"):')
     return RECEIVE_ADDRESS_INPUT_MEMPOOL
 
 async def set_receive_address_mempool(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta l'indirizzo per il monitoraggio delle ricezioni non confermate."""
-    address = update.message.text.strip()
-    if not is_valid_bitcoin_address(address):
-        await update.message.reply_text('Indirizzo non valido. Riprova.')
+    parsed = parse_address_input(update.message.text.strip())
+    if parsed is None:
+        await update.message.reply_text('Indirizzo o importo non valido. Riprova.')
         return RECEIVE_ADDRESS_INPUT_MEMPOOL
-    user_id = str(update.effective_user.id)
-    timestamp = int(time())
-    c = DB_CONN.cursor()
-    c.execute('INSERT INTO mempool_address_subscriptions VALUES (?, ?, ?, ?)', (user_id, address, 'receive', timestamp))
-    DB_CONN.commit()
-    await update.message.reply_text(f'Monitoraggio ricezione non confermata avviato per {address}.')
+    address, min_amount = parsed
+    add_subscription(str(update.effective_user.id), 'mempool', address, 'receive', min_amount)
+    await update.message.reply_text(f'Monitoraggio ricezione non confermata avviato per {address}{format_min_amount(min_amount)}.')
     return ConversationHandler.END
 
 # Monitoraggio mempool
+# Snapshot in memoria delle transazioni non confermate viste per ciascun indirizzo
+MEMPOOL_SNAPSHOTS = {}
+# Sottoscrittori già allineati allo snapshot di ciascun indirizzo
+MEMPOOL_SNAPSHOT_SUBSCRIBERS = {}
+
+def diff_mempool_snapshot(address, txs):
+    """Aggiorna lo snapshot mempool di un indirizzo e restituisce (transazioni nuove, tutte le transazioni)."""
+    previous = MEMPOOL_SNAPSHOTS.get(address, set())
+    current = {tx.txid: tx for tx in txs}
+    MEMPOOL_SNAPSHOTS[address] = set(current)
+    return [tx for txid, tx in current.items() if txid not in previous], list(current.values())
+
+def prune_notified_mempool_transactions(c, live_txids):
+    """Rimuove le notifiche di transazioni uscite dalla mempool (confermate, sostituite o espulse)."""
+    c.execute('SELECT DISTINCT txid FROM notified_mempool_transactions')
+    stale = [(txid,) for (txid,) in c.fetchall() if txid not in live_txids]
+    if stale:
+        c.executemany('DELETE FROM notified_mempool_transactions WHERE txid = ?', stale)
+    return len(stale)
+
 async def monitor_mempool_addresses(context: ContextTypes.DEFAULT_TYPE):
     """Monitora gli indirizzi per invii e ricezioni non confermati nella mempool."""
     c = DB_CONN.cursor()
-    c.execute('SELECT user_id, address, type, timestamp FROM mempool_address_subscriptions')
-    subscriptions = c.fetchall()
+    c.execute(SUBSCRIBERS_QUERY, ('mempool',))
+    # Raggruppa le sottoscrizioni per indirizzo: una sola richiesta per indirizzo
+    subscriptions_by_address = {}
+    for address, user_key, user_id, sub_type, activation_timestamp, min_amount in c.fetchall():
+        subscriptions_by_address.setdefault(address, []).append((user_key, user_id, sub_type, min_amount))
+    # Gli snapshot di indirizzi non più monitorati vengono scartati
+    for address in list(MEMPOOL_SNAPSHOTS):
+        if address not in subscriptions_by_address:
+            del MEMPOOL_SNAPSHOTS[address]
+            MEMPOOL_SNAPSHOT_SUBSCRIBERS.pop(address, None)
     notified_list = []
-    for user_id, address, sub_type, activation_timestamp in subscriptions:
+    batch = NotificationBatch('mempool')
+    all_fetched = True
+    for address, subscribers in subscriptions_by_address.items():
         txs = get_mempool_transactions(address)
-        for tx in txs:
-            txid = tx['txid']
-            c.execute('SELECT 1 FROM notified_mempool_transactions WHERE user_id = ? AND txid = ?', (user_id, txid))
-            if c.fetchone():
-                continue
-            if sub_type == 'send' and any(inp['prevout']['scriptpubkey_address'] == address for inp in tx.get('vin', [])):
-                await context.bot.send_message(chat_id=user_id, text=f'Invio non confermato da {address}: {txid}')
-                notified_list.append((user_id, txid))
-            elif sub_type == 'receive' and any(out['scriptpubkey_address'] == address for out in tx.get('vout', [])):
-                await context.bot.send_message(chat_id=user_id, text=f'Ricezione non confermata su {address}: {txid}')
-                notified_list.append((user_id, txid))
+        if txs is None:
+            # Errore di rete: si conserva lo snapshot precedente
+            all_fetched = False
+            continue
+        new_txs, all_txs = diff_mempool_snapshot(address, txs)
+        known_subscribers = MEMPOOL_SNAPSHOT_SUBSCRIBERS.get(address, set())
+        MEMPOOL_SNAPSHOT_SUBSCRIBERS[address] = set(subscribers)
+        # I nuovi sottoscrittori devono vedere anche le transazioni già presenti nello snapshot
+        has_new_subscribers = any(sub not in known_subscribers for sub in subscribers)
+        new_txids = {tx.txid for tx in new_txs}
+        for tx in (all_txs if has_new_subscribers else new_txs):
+            txid = tx.txid
+            is_new_tx = txid in new_txids
+            net_value = tx.net_value(address)
+            direction = tx.direction(address)
+            amount = -net_value if direction == 'send' else net_value
+            for user_key, user_id, sub_type, min_amount in subscribers:
+                if not is_new_tx and (user_key, user_id, sub_type, min_amount) in known_subscribers:
+                    continue
+                if sub_type != direction or amount < min_amount:
+                    continue
+                # Dopo un riavvio lo snapshot è vuoto: la tabella evita notifiche doppie
+                c.execute('SELECT 1 FROM notified_mempool_transactions WHERE txid = ? AND user_id = ?', (txid, user_key))
+                if c.fetchone():
+                    continue
+                template = MEMPOOL_SEND_TEMPLATE if sub_type == 'send' else MEMPOOL_RECEIVE_TEMPLATE
+                batch.add(user_id, template.format(address=address, txid=txid, amount=net_value), sub_type, amount)
+                notified_list.append((user_key, txid))
+    await batch.flush(context.bot)
     if notified_list:
-        c.executemany('INSERT INTO notified_mempool_transactions VALUES (?, ?)', notified_list)
-        DB_CONN.commit()
+        c.executemany('INSERT OR IGNORE INTO notified_mempool_transactions (user_id, txid) VALUES (?, ?)', notified_list)
+    # La pulizia è sicura solo se tutti gli snapshot sono aggiornati
+    if all_fetched:
+        live_txids = set().union(*MEMPOOL_SNAPSHOTS.values())
+        prune_notified_mempool_transactions(c, live_txids)
+    DB_CONN.commit()
 
 # Comando /track_solo_miner
 async def track_solo_miner(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Avvia il monitoraggio dei blocchi minati da solo miner."""
+    channel = EVENT_PUBLISHER.channel('solo_miner')
+    if channel is not None:
+        await update.message.reply_text(f'I blocchi minati da "solo miner" vengono pubblicati {channel.describe()}: iscriviti per riceverli.')
+        return
     user_id = str(update.effective_user.id)
     height = get_last_block_height()
     if height is None:
         await update.message.reply_text('Impossibile avviare il monitoraggio.')
         return
     c = DB_CONN.cursor()
-    c.execute('INSERT OR REPLACE INTO solo_miner_subscriptions (user_id, last_checked_height) VALUES (?, ?)', (user_id, height))
+    c.execute('INSERT OR REPLACE INTO solo_miner_subscriptions (user_id, last_checked_height) VALUES (?, ?)', (ensure_user(c, user_id), height))
     DB_CONN.commit()
     await update.message.reply_text('Monitoraggio dei blocchi minati da "solo miner" avviato.')
 
 # Monitoraggio solo miner
+# Messaggi già preparati per altezza di blocco ('' se il blocco non è di un solo miner)
+SOLO_MINER_BLOCK_MESSAGES = {}
+
+def get_solo_miner_message(height):
+    """Restituisce il messaggio per un blocco da solo miner, preparato una sola volta per altezza."""
+    if height not in SOLO_MINER_BLOCK_MESSAGES:
+        block_details = get_block_details(height)
+        if not block_details:
+            return None
+        message = ''
+        # Senza le informazioni sul pool (backend non mempool) il miner non è identificabile
+        if 'extras' in block_details and get_block_miner(block_details) == 'Unknown':
+            message = SOLO_MINER_TEMPLATE.format(height=height, hash=block_details['id'], time=format_timestamp(block_details['timestamp']))
+        SOLO_MINER_BLOCK_MESSAGES[height] = message
+    return SOLO_MINER_BLOCK_MESSAGES[height]
+
 async def monitor_solo_miners(context: ContextTypes.DEFAULT_TYPE):
     """Controlla i nuovi blocchi per identificare quelli minati da solo miner."""
     c = DB_CONN.cursor()
-    c.execute('SELECT user_id, last_checked_height FROM solo_miner_subscriptions')
+    c.execute('SELECT s.user_id, u.chat_id, s.last_checked_height FROM solo_miner_subscriptions s JOIN users u ON u.id = s.user_id')
     subscriptions = c.fetchall()
     current_height = get_last_block_height()
     if current_height is None:
         return
-    for user_id, last_height in subscriptions:
-        if current_height > last_height:
-            for height in range(last_height + 1, current_height + 1):
-                block_details = get_block_details(height)
-                if block_details:
-                    miner = get_block_miner(block_details)
-                    if miner == 'Unknown':
-                        timestamp = datetime.fromtimestamp(block_details["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
-                        message = (
-                            f'Blocco minato da "solo miner":\n'
-                            f'Altezza: {height}\n'
-                            f'Hash: {block_details["id"]}\n'
-                            f'Timestamp: {timestamp}'
-                        )
-                        await context.bot.send_message(chat_id=user_id, text=message)
-            c.execute('UPDATE solo_miner_subscriptions SET last_checked_height = ? WHERE user_id = ?', (current_height, user_id))
+    channel = EVENT_PUBLISHER.channel('solo_miner')
+    if channel is not None:
+        # Con il canale attivo le sottoscrizioni individuali vengono sostituite dall'iscrizione al canale:
+        # vengono cancellate prima dell'avviso, così un invio fallito non lo fa ripetere al ciclo successivo
+        if subscriptions:
+            c.execute('DELETE FROM solo_miner_subscriptions')
             DB_CONN.commit()
+            await EVENT_PUBLISHER.notify(context.bot, 'solo_miner',
+                                         f'I blocchi minati da "solo miner" sono ora pubblicati {channel.describe()}: iscriviti per continuare a riceverli.',
+                                         [user_id for _, user_id, _ in subscriptions])
+            subscriptions = []
+        last_height = load_channel_state('solo_miner') or current_height
+    else:
+        last_height = min((height for _, _, height in subscriptions), default=current_height)
+    # Ogni blocco viene pubblicato una volta sul canale o inviato ai sottoscrittori non ancora aggiornati
+    for height in range(last_height + 1, current_height + 1):
+        message = get_solo_miner_message(height)
+        if message:
+            await EVENT_PUBLISHER.publish(context.bot, 'solo_miner', message,
+                                          [user_id for _, user_id, checked in subscriptions if checked < height])
+    if channel is not None:
+        save_channel_state('solo_miner', current_height)
+    c.execute('UPDATE solo_miner_subscriptions SET last_checked_height = ? WHERE last_checked_height < ?', (current_height, current_height))
+    DB_CONN.commit()
+    # Tutti i sottoscrittori sono ora allineati al tip: i messaggi precedenti non servono più
+    for height in [height for height in SOLO_MINER_BLOCK_MESSAGES if height <= current_height]:
+        del SOLO_MINER_BLOCK_MESSAGES[height]
+
+def render_price(prices):
+    """Compone il messaggio di /price (None se i prezzi non sono disponibili)."""
+    if prices.get('eur') is None or prices.get('usd') is None:
+        return None
+    return f'Prezzo attuale di Bitcoin:\nEUR: {prices["eur"]}\nUSD: {prices["usd"]}'
 
 # Comando /price
+@rate_limited('price', lambda update, context: render_price(context.bot_data['btc_prices']))
 async def current_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mostra il prezzo attuale di Bitcoin in EUR e USD."""
-    if 'last_price_update' not in context.bot_data or time() - context.bot_data['last_price_update'] > 300:
-        await update_price_cache(context)
-    eur_price = context.bot_data['btc_prices'].get('eur')
-    usd_price = context.bot_data['btc_prices'].get('usd')
-    if eur_price is not None and usd_price is not None:
-        await update.message.reply_text(f'Prezzo attuale di Bitcoin:\nEUR: {eur_price}\nUSD: {usd_price}')
-    else:
-        await update.message.reply_text('Prezzo non disponibile al momento.')
+    # Prezzi più vecchi del TTL: un solo aggiornamento condiviso tra le richieste concorrenti
+    await refresh_prices(context)
+    await update.message.reply_text(render_price(context.bot_data['btc_prices']) or 'Prezzo non disponibile al momento.')
 
-# Funzione per calcolare il prossimo orario di notifica
-def calculate_next_notification_time(frequency):
-    """Calcola il timestamp del prossimo invio di una notifica prezzo."""
-    now = datetime.now(timezone.utc)
-    if frequency == 'daily':
-        next_time = now.replace(hour=7, minute=0, second=0, microsecond=0)
-        if now >= next_time:
-            next_time += timedelta(days=1)
-    elif frequency == 'weekly':
-        days_ahead = (7 - now.weekday()) % 7
-        if days_ahead == 0 and now.time() >= time(7, 0):
-            days_ahead = 7
-        next_time = (now + timedelta(days=days_ahead)).replace(hour=7, minute=0, second=0, microsecond=0)
-    elif frequency == 'monthly':
-        if now.day == 1 and now.time() < time(7, 0):
-            next_time = now.replace(hour=7, minute=0, second=0, microsecond=0)
-        else:
-            next_month = now.month % 12 + 1
-            next_year = now.year + (now.month // 12)
-            if next_month == 13:
-                next_month = 1
-                next_year += 1
-            next_time = datetime(next_year, next_month, 1, 7, 0, 0, tzinfo=timezone.utc)
-    return int(next_time.timestamp())
-
-# Callback per inviare la notifica del prezzo
-async def send_price_alert(context: ContextTypes.DEFAULT_TYPE):
-    """Invia una notifica periodica del prezzo di Bitcoin."""
-    job = context.job
-    user_id = job.data['user_id']
-    c = DB_CONN.cursor()
-    c.execute('SELECT frequency, currency, next_notification_time FROM price_alerts WHERE user_id = ?', (user_id,))
-    alert = c.fetchone()
-    if alert:
-        frequency, currency, next_notification_time = alert
-        now = int(time())
-        if next_notification_time <= now:
-            btc_price = context.bot_data['btc_prices'].get(currency.lower())
-            if btc_price is not None:
-                await context.bot.send_message(chat_id=user_id, text=f'Prezzo attuale di Bitcoin in {currency}: {btc_price}')
-            else:
-                await context.bot.send_message(chat_id=user_id, text='Prezzo non disponibile al momento.')
-            
-            next_time = calculate_next_notification_time(frequency)
-            while next_time <= now:
-                if frequency == 'daily':
-                    next_time += 86400
-                elif frequency == 'weekly':
-                    next_time += 604800
-                elif frequency == 'monthly':
-                    next_time = calculate_next_notification_time(frequency)
-            c.execute('UPDATE price_alerts SET next_notification_time = ? WHERE user_id = ?', (next_time, user_id))
-            DB_CONN.commit()
-            delay = next_time - now
-            context.job_queue.run_once(send_price_alert, delay, data={'user_id': user_id})
+# Notifiche prezzo periodiche in memoria: chiave utente -> (chat_id, frequenza, valuta, fuso, ora)
+PRICE_ALERT_WHEEL = TimingWheel(time())
+# Pubblicazione giornaliera del prezzo sul canale dei prezzi, programmata nella stessa wheel
+PRICE_CHANNEL_KEY = 'channel'
+PRICE_CHANNEL_HOUR = int(os.getenv('PRICE_CHANNEL_HOUR', '7'))
+PRICE_CHANNEL_TIMEZONE = validate_timezone(os.getenv('PRICE_CHANNEL_TIMEZONE', 'UTC')) or 'UTC'
 
-# Funzione per schedulare le notifiche
-def schedule_price_alert_job(context: ContextTypes.DEFAULT_TYPE, user_id, next_notification_time):
-    """Schedula una notifica prezzo per un utente."""
+# Funzione per calcolare il prossimo orario di notifica
+def calculate_next_notification_time(frequency, tz_name='UTC', hour=7, after=None):
+    """Calcola il timestamp del prossimo invio di una notifica prezzo all'ora locale dell'utente."""
+    return next_occurrence(frequency, time() if after is None else after, tz_name, hour)
+
+def schedule_price_alert(user_key, next_notification_time, alert):
+    """Programma (o riprogramma) la notifica prezzo di un utente nella timing wheel."""
+    PRICE_ALERT_WHEEL.schedule(user_key, next_notification_time, alert)
+
+# Job che invia le notifiche prezzo scadute, una volta al minuto
+async def dispatch_price_alerts(context: ContextTypes.DEFAULT_TYPE):
+    """Invia in un unico lotto le notifiche prezzo scadute e le riprogramma."""
+    due = PRICE_ALERT_WHEEL.advance(time())
+    if not due:
+        return
     now = int(time())
-    delay = next_notification_time - now
-    if delay > 0:
-        context.job_queue.run_once(send_price_alert, delay, data={'user_id': user_id})
+    # Il testo dipende solo dalla valuta: viene composto una volta per lotto
+    texts = {}
+    updates = []
+    for user_key, alert in due:
+        chat_id, frequency, currency, tz_name, hour = alert
+        if user_key == PRICE_CHANNEL_KEY:
+            prices = context.bot_data['btc_prices']
+            if prices.get('eur') is not None and prices.get('usd') is not None:
+                await EVENT_PUBLISHER.publish(context.bot, 'price', PRICE_CHANNEL_TEMPLATE.format(eur=prices['eur'], usd=prices['usd']))
+            schedule_price_alert(user_key, calculate_next_notification_time(frequency, tz_name, hour, after=now), alert)
+            continue
+        if currency not in texts:
+            btc_price = context.bot_data['btc_prices'].get(currency.lower())
+            texts[currency] = (PRICE_ALERT_TEMPLATE.format(currency=currency, price=btc_price)
+                               if btc_price is not None else 'Prezzo non disponibile al momento.')
+        try:
+            await context.bot.send_message(chat_id=chat_id, text=texts[currency])
+        except Exception as e:
+            print(f"Errore nell'invio della notifica prezzo a {chat_id}: {e}")
+        next_time = calculate_next_notification_time(frequency, tz_name, hour, after=now)
+        updates.append((next_time, user_key))
+        schedule_price_alert(user_key, next_time, alert)
+    c = DB_CONN.cursor()
+    c.executemany('UPDATE price_alerts SET next_notification_time = ? WHERE user_id = ?', updates)
+    DB_CONN.commit()
 
 # Comando /set_price_alert
 async def set_price_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta notifiche periodiche del prezzo di Bitcoin."""
     context.user_data.clear()
+    channel = EVENT_PUBLISHER.channel('price')
+    if channel is not None:
+        await update.message.reply_text(f'Il prezzo viene pubblicato ogni giorno alle {PRICE_CHANNEL_HOUR}:00 ({PRICE_CHANNEL_TIMEZONE}) '
+                                        f'{channel.describe()}: iscriviti per riceverlo senza una notifica personale.')
     await update.message.reply_text('Scegli la frequenza delle notifiche:\n1. Daily\n2. Weekly\n3. Monthly\nInserisci il numero corrispondente:')
     return FREQUENCY_INPUT
 
@@ -959,19 +1761,39 @@ async def set_currency(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.message.reply_text('Numero non valido. Scegli 1 o 2.')
             return CURRENCY_INPUT
-        user_id = str(update.effective_user.id)
-        frequency = context.user_data['frequency']
-        next_notification_time = calculate_next_notification_time(frequency)
-        c = DB_CONN.cursor()
-        c.execute('INSERT OR REPLACE INTO price_alerts VALUES (?, ?, ?, ?)', (user_id, frequency, currency, next_notification_time))
-        DB_CONN.commit()
-        schedule_price_alert_job(context, user_id, next_notification_time)
-        await update.message.reply_text(f'Notifica prezzo impostata: {frequency} in {currency}. Le notifiche saranno inviate alle 07:00 UTC.')
-        return ConversationHandler.END
+        context.user_data['currency'] = currency
+        await update.message.reply_text("Inserisci l'ora locale e il fuso orario delle notifiche (es. 8 Europe/Rome), "
+                                        "oppure solo l'ora per UTC (predefinito: 7 UTC):")
+        return ALERT_TIME_INPUT
     except ValueError:
         await update.message.reply_text('Input non valido. Inserisci un numero.')
         return CURRENCY_INPUT
 
+async def set_alert_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Imposta ora e fuso orario delle notifiche prezzo e salva la notifica."""
+    parts = update.message.text.split()
+    tz_name = parts[1] if len(parts) > 1 else 'UTC'
+    if not parts or len(parts) > 2 or not parts[0].isdigit() or not 0 <= int(parts[0]) <= 23:
+        await update.message.reply_text("Ora non valida. Inserisci un numero da 0 a 23, seguito dal fuso orario (es. 8 Europe/Rome).")
+        return ALERT_TIME_INPUT
+    if validate_timezone(tz_name) is None:
+        await update.message.reply_text('Fuso orario non valido. Usa un nome come Europe/Rome o America/New_York.')
+        return ALERT_TIME_INPUT
+    hour = int(parts[0])
+    user_id = str(update.effective_user.id)
+    frequency = context.user_data['frequency']
+    currency = context.user_data['currency']
+    next_notification_time = calculate_next_notification_time(frequency, tz_name, hour)
+    c = DB_CONN.cursor()
+    user_key = ensure_user(c, user_id)
+    c.execute('INSERT OR REPLACE INTO price_alerts (user_id, frequency, currency, next_notification_time, timezone, hour) '
+              'VALUES (?, ?, ?, ?, ?, ?)', (user_key, frequency, currency, next_notification_time, tz_name, hour))
+    DB_CONN.commit()
+    schedule_price_alert(user_key, next_notification_time, (user_id, frequency, currency, tz_name, hour))
+    await update.message.reply_text(f'Notifica prezzo impostata: {frequency} in {currency}. '
+                                    f'Le notifiche saranno inviate alle {hour:02d}:00 ({tz_name}).')
+    return ConversationHandler.END
+
 # Comando /set_price_threshold
 async def set_price_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta una soglia di prezzo per ricevere notifiche."""
@@ -1019,10 +1841,7 @@ async def set_price_threshold_value(update: Update, context: ContextTypes.DEFAUL
             direction = 'below'
             message = f'Soglia di prezzo impostata a {threshold} {currency}. Riceverai una notifica quando il prezzo scende sotto questa soglia.'
 
-        # Salva nel database
-        c = DB_CONN.cursor()
-        c.execute('INSERT INTO price_thresholds VALUES (?, ?, ?, 0, ?)', (user_id, currency, threshold, direction))
-        DB_CONN.commit()
+        add_threshold(user_id, 'price', threshold, direction, currency)
 
         await update.message.reply_text(message)
         return ConversationHandler.END
@@ -1033,10 +1852,11 @@ async def set_price_threshold_value(update: Update, context: ContextTypes.DEFAUL
 async def monitor_price_thresholds(context: ContextTypes.DEFAULT_TYPE):
     """Monitora le soglie di prezzo e invia notifiche quando raggiunte."""
     c = DB_CONN.cursor()
-    c.execute('SELECT user_id, currency, threshold, direction FROM price_thresholds WHERE notified = 0')
+    c.execute("SELECT t.id, u.chat_id, t.currency, t.value, t.direction FROM thresholds t JOIN users u ON u.id = t.user_id "
+              "WHERE t.kind = 'price' AND t.notified = 0")
     thresholds = c.fetchall()
 
-    for user_id, currency, threshold, direction in thresholds:
+    for threshold_id, user_id, currency, threshold, direction in thresholds:
         current_price = context.bot_data['btc_prices'].get(currency.lower())
         if current_price is None:
             continue
@@ -1045,15 +1865,13 @@ async def monitor_price_thresholds(context: ContextTypes.DEFAULT_TYPE):
                 chat_id=user_id,
                 text=f'Il prezzo del Bitcoin ha raggiunto o superato la tua soglia di {threshold} {currency}: ora è {current_price} {currency}.'
             )
-            c.execute('UPDATE price_thresholds SET notified = 1 WHERE user_id = ? AND currency = ? AND threshold = ?',
-                      (user_id, currency, threshold))
+            c.execute('UPDATE thresholds SET notified = 1 WHERE id = ?', (threshold_id,))
         elif direction == 'below' and current_price <= threshold:
             await context.bot.send_message(
                 chat_id=user_id,
                 text=f'Il prezzo del Bitcoin è sceso a o sotto la tua soglia di {threshold} {currency}: ora è {current_price} {currency}.'
             )
-            c.execute('UPDATE price_thresholds SET notified = 1 WHERE user_id = ? AND currency = ? AND threshold = ?',
-                      (user_id, currency, threshold))
+            c.execute('UPDATE thresholds SET notified = 1 WHERE id = ?', (threshold_id,))
 
     DB_CONN.commit()
 
@@ -1137,10 +1955,97 @@ async def set_convert_amount(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
 
 # Main
+def prepare_background_state():
+    """Apre il database (inclusa la derivazione della chiave) e ricarica lo stato persistente.
+
+    Tutto avviene prima che i monitor partano, così nessun job usa la connessione condivisa
+    in parallelo a questo thread né trova la timing wheel delle notifiche prezzo incompleta.
+    """
+    DB_CONN.connection()
+    warm_persistent_cache()
+    if BLOCK_SCAN_ENABLED:
+        load_watched_scripts()
+    load_price_alert_schedule()
+
+def load_price_alert_schedule():
+    """Legge le notifiche prezzo salvate, riallinea quelle scadute e le carica nella timing wheel."""
+    c = DB_CONN.cursor()
+    c.execute('SELECT p.user_id, u.chat_id, p.frequency, p.currency, p.timezone, p.hour, p.next_notification_time '
+              'FROM price_alerts p JOIN users u ON u.id = p.user_id')
+    now = int(time())
+    updates = []
+    for user_key, user_id, frequency, currency, tz_name, hour, next_notification_time in c.fetchall():
+        if next_notification_time < now:
+            next_notification_time = calculate_next_notification_time(frequency, tz_name, hour, after=now)
+            updates.append((next_notification_time, user_key))
+        schedule_price_alert(user_key, next_notification_time, (user_id, frequency, currency, tz_name, hour))
+    c.executemany('UPDATE price_alerts SET next_notification_time = ? WHERE user_id = ?', updates)
+    DB_CONN.commit()
+    if EVENT_PUBLISHER.channel('price') is not None:
+        schedule_price_alert(PRICE_CHANNEL_KEY, calculate_next_notification_time('daily', PRICE_CHANNEL_TIMEZONE, PRICE_CHANNEL_HOUR),
+                             (None, 'daily', None, PRICE_CHANNEL_TIMEZONE, PRICE_CHANNEL_HOUR))
+    return len(PRICE_ALERT_WHEEL)
+
+# Job di monitoraggio periodici e relativo intervallo in secondi (usati anche da tools/replay.py)
+MONITOR_JOBS = [
+    (watch_chain_tip, 30),
+    (monitor_addresses, 300),
+    (monitor_fees, 300),
+    (monitor_transactions, 300),
+    (monitor_mempool_addresses, 300),
+    (monitor_solo_miners, 300),
+    (monitor_price_thresholds, 300),
+]
+
+async def warm_up(context: ContextTypes.DEFAULT_TYPE):
+    """Prepara database, cache e notifiche prezzo in un thread, poi avvia i job di monitoraggio."""
+    await asyncio.to_thread(prepare_background_state)
+    job_queue = context.job_queue
+    for job, interval in MONITOR_JOBS:
+        job_queue.run_repeating(job, interval=interval, first=0)
+    # Notifiche prezzo: già nella timing wheel, inviate a lotti all'inizio di ogni minuto
+    job_queue.run_repeating(dispatch_price_alerts, interval=60, first=60 - time() % 60)
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando di amministrazione: profila l'event loop per N secondi (/profile [secondi]) e invia gli stack collassati."""
+    if str(update.effective_user.id) not in ADMIN_CHAT_IDS:
+        return
+    if context.bot_data.get('profiling'):
+        await update.message.reply_text('Profilazione già in corso.')
+        return
+    try:
+        seconds = min(max(int(context.args[0]), 1), MAX_PROFILE_SECONDS) if context.args else 30
+    except ValueError:
+        await update.message.reply_text('Uso: /profile [secondi]')
+        return
+    context.bot_data['profiling'] = True
+    await update.message.reply_text(f'Profilazione dell\'event loop per {seconds}s...')
+    try:
+        profiler = await profile_loop(seconds)
+    finally:
+        context.bot_data['profiling'] = False
+    lines = [f'{sum(profiler.samples.values())} campioni in {seconds}s']
+    lines += [f'{share:5.1f}% {name}' for name, share in profiler.top()]
+    if LOOP_WATCHDOG:
+        lines += [f'{name}: {value}' for name, value in LOOP_WATCHDOG.stats().items()]
+    await update.message.reply_document(
+        document=profiler.collapsed().encode(),
+        filename=f'loop-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.folded',
+        caption='\n'.join(lines),
+    )
+
+async def start_instrumentation(application):
+    """Avvia il watchdog dell'event loop, se abilitato, appena il loop è attivo."""
+    if LOOP_WATCHDOG:
+        LOOP_WATCHDOG.start()
+
 def main():
-    """Avvia il bot e configura i job di monitoraggio."""
-    init_db()
-    application = Application.builder().token(TOKEN).build()
+    """Avvia il bot (polling o webhook, da BOT_MODE): database e monitoraggi vengono preparati in background."""
+    builder = Application.builder().token(TOKEN).post_init(start_instrumentation)
+    # Endpoint alternativo della Bot API (server locale o tools/fake_telegram.py)
+    if os.getenv('TELEGRAM_API_URL'):
+        builder = builder.base_url(os.getenv('TELEGRAM_API_URL').rstrip('/') + '/bot')
+    application = builder.build()
 
     # Inizializzazione del cache dei prezzi
     application.bot_data['btc_prices'] = {'eur': None, 'usd': None}
@@ -1196,6 +2101,7 @@ def main():
         states={
             FREQUENCY_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_frequency)],
             CURRENCY_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_currency)],
+            ALERT_TIME_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_alert_time)],
         },
         fallbacks=[MessageHandler(filters.COMMAND, end_conversation)],
     ))
@@ -1225,33 +2131,19 @@ def main():
     application.add_handler(CommandHandler("recent_blocks", recent_blocks))
     application.add_handler(CommandHandler("fee_forecast", fee_forecast))
     application.add_handler(CommandHandler("status", status))
+    application.add_handler(CommandHandler("mempool", mempool_report))
     application.add_handler(CommandHandler("track_solo_miner", track_solo_miner))
     application.add_handler(CommandHandler("price", current_price))
+    application.add_handler(CommandHandler("digest", digest))
+    application.add_handler(CommandHandler("profile", profile))
 
-    # Job di monitoraggio
-    application.job_queue.run_repeating(monitor_addresses, interval=300, first=0)
-    application.job_queue.run_repeating(monitor_fees, interval=300, first=0)
-    application.job_queue.run_repeating(monitor_transactions, interval=300, first=0)
-    application.job_queue.run_repeating(monitor_mempool_addresses, interval=300, first=0)
-    application.job_queue.run_repeating(monitor_solo_miners, interval=300, first=0)
-    application.job_queue.run_repeating(monitor_price_thresholds, interval=300, first=0)
-
-    # Schedulazione delle notifiche prezzo esistenti
-    c = DB_CONN.cursor()
-    c.execute('SELECT user_id, frequency, next_notification_time FROM price_alerts')
-    alerts = c.fetchall()
-    for user_id, frequency, next_notification_time in alerts:
-        now = int(time())
-        if next_notification_time < now:
-            next_time = calculate_next_notification_time(frequency)
-            c.execute('UPDATE price_alerts SET next_notification_time = ? WHERE user_id = ?', (next_time, user_id))
-            DB_CONN.commit()
-        else:
-            next_time = next_notification_time
-        delay = next_time - now
-        application.job_queue.run_once(send_price_alert, delay, data={'user_id': user_id})
+    # Job di monitoraggio e notifiche prezzo: avviati dal warm-up, dopo l'apertura del database
+    application.job_queue.run_once(warm_up, 0)
 
-    application.run_polling()
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        asyncio.run(run_webhook(application, webhook_settings_from_env()))
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
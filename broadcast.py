@@ -0,0 +1,87 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Pubblicazione degli eventi condivisi: un canale Telegram per tipo di evento o invio a ogni utente.
+
+Gli eventi identici per tutti (blocchi da solo miner, livelli della fee, prezzo periodico) possono
+essere pubblicati una sola volta su un canale o gruppo configurato: il bot deve esserne
+amministratore e gli utenti si iscrivono al canale invece di avere una sottoscrizione propria.
+Senza canale lo stesso evento viene inviato ai singoli destinatari.
+"""
+
+import os
+
+# Tipi di evento pubblicabili su un canale e prefisso delle rispettive variabili d'ambiente
+EVENT_TYPES = ('solo_miner', 'fee', 'price')
+
+
+class Channel:
+    """Canale (o gruppo) Telegram su cui vengono pubblicati gli eventi di un tipo."""
+
+    __slots__ = ('chat_id', 'url')
+
+    def __init__(self, chat_id, url=None):
+        self.chat_id = chat_id
+        # Senza link esplicito, un canale pubblico (@nome) è raggiungibile da t.me
+        self.url = url or (f'https://t.me/{chat_id[1:]}' if chat_id.startswith('@') else None)
+
+    def describe(self):
+        """Indica agli utenti dove trovare il canale, con il link se disponibile."""
+        return f'sul canale {self.url}' if self.url else 'sul canale delle notifiche del bot'
+
+
+class EventPublisher:
+    """Sceglie per ogni tipo di evento tra pubblicazione sul canale e invio ai singoli destinatari."""
+
+    def __init__(self, channels=None):
+        self.channels = dict(channels or {})
+        # Messaggi inviati per tipo di evento
+        self.sent = {event_type: 0 for event_type in EVENT_TYPES}
+
+    def channel(self, event_type):
+        """Canale configurato per il tipo di evento, o None se l'evento va inviato utente per utente."""
+        return self.channels.get(event_type)
+
+    async def publish(self, bot, event_type, text, recipients=()):
+        """Pubblica l'evento sul canale (un messaggio) o lo invia a ogni destinatario; restituisce i messaggi inviati."""
+        channel = self.channels.get(event_type)
+        return await self.notify(bot, event_type, text, [channel.chat_id] if channel is not None else recipients)
+
+    async def notify(self, bot, event_type, text, targets):
+        """Invia il messaggio a ciascun destinatario, anche con il canale attivo (es. avvisi ai sottoscrittori).
+
+        Un invio fallito (utente che ha bloccato il bot) viene registrato senza interrompere gli altri.
+        """
+        sent = 0
+        for chat_id in targets:
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                sent += 1
+            except Exception as e:
+                print(f"Errore nell'invio dell'evento {event_type} a {chat_id}: {e}")
+        self.sent[event_type] = self.sent.get(event_type, 0) + sent
+        return sent
+
+
+def channels_from_env():
+    """Canali configurati da SOLO_MINER_CHANNEL, FEE_CHANNEL e PRICE_CHANNEL (con *_CHANNEL_URL opzionale)."""
+    channels = {}
+    for event_type in EVENT_TYPES:
+        prefix = event_type.upper()
+        chat_id = os.getenv(f'{prefix}_CHANNEL')
+        if chat_id:
+            channels[event_type] = Channel(chat_id, os.getenv(f'{prefix}_CHANNEL_URL'))
+    return channels
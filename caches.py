@@ -0,0 +1,183 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Cache in memoria per le risposte delle API usate dal bot."""
+
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+
+
+class ResponseCache:
+    """Cache read-through condivisa con TTL per chiave e coalescenza delle richieste in corso.
+
+    Con max_entries le voci inserite da più tempo vengono scartate oltre il limite.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.discarded = 0
+
+    async def get(self, key, loader, ttl, tags=()):
+        """Restituisce il valore in cache o lo carica con `loader` (funzione bloccante) in un thread.
+
+        Le chiamate concorrenti sulla stessa chiave condividono un unico caricamento.
+        I risultati None (errori) non vengono salvati, e nemmeno quelli di un caricamento
+        invalidato mentre era in corso: il valore va solo a chi lo aveva già chiesto.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > monotonic():
+            self.hits += 1
+            return entry[1]
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight[0])
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (future, frozenset(tags))
+        value = None
+        try:
+            value = await asyncio.to_thread(loader)
+        finally:
+            # Se la chiave è stata invalidata nel frattempo il caricamento è stato staccato
+            # da _inflight (ed eventualmente sostituito da uno nuovo): il risultato è vecchio
+            current = self._inflight.get(key)
+            if current is not None and current[0] is future:
+                del self._inflight[key]
+            else:
+                self.discarded += 1
+                current = None
+            future.set_result(value)
+        if value is not None and current is not None:
+            self.set(key, value, ttl, tags)
+        return value
+
+    def set(self, key, value, ttl, tags=()):
+        """Inserisce direttamente un valore in cache."""
+        self._entries.pop(key, None)
+        self._entries[key] = (monotonic() + ttl, value, frozenset(tags))
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def peek(self, key):
+        """Restituisce l'ultimo valore noto per la chiave, anche se scaduto (None se assente)."""
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def expire(self, *keys):
+        """Fa scadere le chiavi indicate: la prossima get ricarica o si unisce al caricamento in corso.
+
+        A differenza di invalidate i caricamenti in corso restano validi e peek continua
+        a restituire l'ultimo valore.
+        """
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (0, entry[1], entry[2])
+
+    def invalidate(self, *keys):
+        """Rimuove dalla cache le chiavi indicate e scarta i loro caricamenti in corso."""
+        for key in keys:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def invalidate_tag(self, tag):
+        """Rimuove dalla cache tutte le voci associate al tag indicato, anche quelle in caricamento."""
+        for key in [key for key, entry in self._entries.items() if tag in entry[2]]:
+            del self._entries[key]
+        for key in [key for key, inflight in self._inflight.items() if tag in inflight[1]]:
+            del self._inflight[key]
+
+
+class BoundedCache:
+    """Cache LRU in memoria con TTL, limite di voci e budget in byte (dimensione stimata dal chiamante)."""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > monotonic()
+
+    def get(self, key):
+        """Restituisce il valore se presente e non scaduto, altrimenti None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, size):
+        """Inserisce un valore ed elimina le voci meno usate di recente oltre i limiti."""
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (monotonic() + self.ttl, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Rimuove una chiave dalla cache."""
+        if key in self._entries:
+            self._remove(key)
+
+    def purge_expired(self):
+        """Rimuove tutte le voci scadute."""
+        now = monotonic()
+        for key in [key for key, entry in self._entries.items() if entry[0] <= now]:
+            self._remove(key)
+            self.expirations += 1
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        """Statistiche della cache."""
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,878 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Sorgenti dati on-chain intercambiabili: Esplora/mempool, server Electrum e bitcoind RPC.
+
+Tutti i backend restituiscono i dati nel formato JSON di Esplora/Mempool.space,
+così il resto del bot non dipende dalla sorgente configurata.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy import lazy_module
+
+# requests viene importato al primo utilizzo: non rallenta l'avvio del bot
+requests = lazy_module('requests')
+
+from segwit_addr import decode as segwit_decode
+
+# Numero massimo di transazioni confermate restituite per indirizzo (come Esplora)
+ADDRESS_HISTORY_LIMIT = 25
+# Dimensione virtuale di un blocco proiettato
+BLOCK_VSIZE = 1_000_000
+
+
+class BackendError(Exception):
+    """Errore di comunicazione o di protocollo con il backend."""
+
+
+class NotFound(BackendError):
+    """L'oggetto richiesto (tx, blocco, indirizzo) non è noto al backend."""
+
+
+class NotSupported(BackendError):
+    """Il backend non offre il dato richiesto."""
+
+
+# Conversioni indirizzi/script
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+def base58check_decode(address):
+    """Decodifica un indirizzo Base58Check restituendo (versione, payload)."""
+    number = 0
+    for char in address:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    raw = b'\0' * (len(address) - len(address.lstrip('1'))) + raw
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise ValueError('Checksum Base58 non valido')
+    return payload[0], payload[1:]
+
+
+def address_to_scriptpubkey(address):
+    """Converte un indirizzo Bitcoin mainnet nel relativo scriptPubKey."""
+    if address.lower().startswith('bc1'):
+        version, program = segwit_decode('bc', address)
+        if version is None:
+            raise ValueError('Indirizzo segwit non valido')
+        return bytes([version + 0x50 if version else 0, len(program)]) + bytes(program)
+    version, payload = base58check_decode(address)
+    if version == 0x00:
+        return b'\x76\xa9\x14' + payload + b'\x88\xac'
+    if version == 0x05:
+        return b'\xa9\x14' + payload + b'\x87'
+    raise ValueError('Versione indirizzo non supportata')
+
+
+def address_to_scripthash(address):
+    """Calcola lo scripthash Electrum (sha256 dello scriptPubKey, byte invertiti)."""
+    return hashlib.sha256(address_to_scriptpubkey(address)).digest()[::-1].hex()
+
+
+# Conversioni dal formato bitcoind/Electrum verbose al formato Esplora
+def btc_to_sats(value):
+    """Converte un importo in BTC in satoshi."""
+    return int(round(value * 100_000_000))
+
+
+def esplora_output(output):
+    """Converte un output verbose di bitcoind nel formato Esplora."""
+    script = output.get('scriptPubKey', {})
+    address = script.get('address') or (script.get('addresses') or [None])[0]
+    return {
+        'scriptpubkey': script.get('hex'),
+        'scriptpubkey_type': script.get('type'),
+        'scriptpubkey_address': address,
+        'value': btc_to_sats(output['value']),
+    }
+
+
+def esplora_transaction(tx, prevouts=None, tip_height=None):
+    """Converte una transazione verbose di bitcoind nel formato Esplora."""
+    prevouts = prevouts or {}
+    vin = []
+    for inp in tx['vin']:
+        if 'coinbase' in inp:
+            vin.append({'is_coinbase': True, 'prevout': None})
+            continue
+        prevout = inp.get('prevout') or prevouts.get((inp['txid'], inp['vout']))
+        vin.append({
+            'txid': inp['txid'],
+            'vout': inp['vout'],
+            'is_coinbase': False,
+            'prevout': esplora_output(prevout) if prevout else None,
+        })
+    vout = [esplora_output(output) for output in tx['vout']]
+    if any(inp['is_coinbase'] for inp in vin):
+        fee = 0
+    elif all(inp['prevout'] is not None for inp in vin):
+        fee = sum(inp['prevout']['value'] for inp in vin) - sum(out['value'] for out in vout)
+    else:
+        fee = btc_to_sats(tx['fee']) if 'fee' in tx else None
+    confirmations = tx.get('confirmations', 0)
+    status = {'confirmed': confirmations > 0}
+    if confirmations > 0:
+        status['block_hash'] = tx.get('blockhash')
+        status['block_time'] = tx.get('blocktime')
+        status['block_height'] = tip_height - confirmations + 1 if tip_height is not None else tx.get('height')
+    return {
+        'txid': tx['txid'],
+        'version': tx.get('version'),
+        'locktime': tx.get('locktime'),
+        'size': tx.get('size'),
+        'weight': tx.get('weight', tx.get('vsize', 0) * 4),
+        'fee': fee,
+        'vin': vin,
+        'vout': vout,
+        'status': status,
+    }
+
+
+def missing_prevouts(txs):
+    """Restituisce i txid precedenti necessari per completare i prevout mancanti."""
+    return sorted({inp['txid'] for tx in txs for inp in tx['vin'] if 'coinbase' not in inp and 'prevout' not in inp})
+
+
+def project_mempool_blocks(fee_histogram, max_blocks=8):
+    """Proietta i prossimi blocchi dalla fee histogram ([[feerate, vsize], ...] decrescente)."""
+    blocks = []
+    current = None
+    for fee_rate, vsize in fee_histogram:
+        while vsize > 0 and len(blocks) < max_blocks:
+            if current is None:
+                current = {'blockVSize': 0, 'feeRange': [fee_rate, fee_rate], 'medianFee': None}
+                blocks.append(current)
+            taken = min(vsize, BLOCK_VSIZE - current['blockVSize'])
+            if current['medianFee'] is None and current['blockVSize'] + taken >= BLOCK_VSIZE / 2:
+                current['medianFee'] = fee_rate
+            current['blockVSize'] += taken
+            current['feeRange'][0] = fee_rate
+            vsize -= taken
+            if current['blockVSize'] >= BLOCK_VSIZE:
+                current = None
+    for block in blocks:
+        if block['medianFee'] is None:
+            block['medianFee'] = block['feeRange'][0]
+    return blocks
+
+
+def fees_from_estimates(estimates, minimum_fee):
+    """Costruisce le fee raccomandate (formato Mempool.space) da stime per numero di blocchi in sat/vB."""
+    def pick(target):
+        return max(round(estimates.get(target) or minimum_fee), 1)
+    return {
+        'fastestFee': pick(1),
+        'halfHourFee': pick(3),
+        'hourFee': pick(6),
+        'economyFee': pick(144),
+        'minimumFee': max(round(minimum_fee), 1),
+    }
+
+
+class ChainBackend:
+    """Interfaccia comune dei backend: i metodi non implementati sollevano NotSupported."""
+
+    name = 'base'
+
+    def address_txs(self, address):
+        """Transazioni di un indirizzo (mempool e ultime confermate)."""
+        raise NotSupported(f'{self.name}: address_txs')
+
+    def address_txs_many(self, addresses):
+        """Transazioni di più indirizzi: {indirizzo: lista o BackendError}."""
+        results = {}
+        for address in addresses:
+            try:
+                results[address] = self.address_txs(address)
+            except BackendError as e:
+                results[address] = e
+        return results
+
+    def address_mempool_txs(self, address):
+        """Transazioni non confermate di un indirizzo."""
+        raise NotSupported(f'{self.name}: address_mempool_txs')
+
+    def address_status_many(self, addresses):
+        """Digest di stato di più indirizzi: {indirizzo: stringa o BackendError}.
+
+        Il digest cambia solo quando cambia lo storico dell'indirizzo, quindi permette
+        di evitare il download dello storico completo degli indirizzi invariati.
+        """
+        raise NotSupported(f'{self.name}: address_status_many')
+
+    def tx(self, txid):
+        """Dettagli completi di una transazione."""
+        raise NotSupported(f'{self.name}: tx')
+
+    def txs_many(self, txids):
+        """Più transazioni complete: {txid: tx o BackendError}."""
+        results = {}
+        for txid in txids:
+            try:
+                results[txid] = self.tx(txid)
+            except NotSupported:
+                raise
+            except BackendError as e:
+                results[txid] = e
+        return results
+
+    def tx_status(self, txid):
+        """Stato di conferma di una transazione."""
+        raise NotSupported(f'{self.name}: tx_status')
+
+    def outspends_many(self, txids):
+        """Spese degli output di più transazioni: {txid: [{'spent', 'txid', 'vin', 'status'}, ...] o BackendError}."""
+        raise NotSupported(f'{self.name}: outspends_many')
+
+    def tx_replacement(self, txid):
+        """Txid che ha sostituito la transazione via RBF, o None se non è stata sostituita."""
+        raise NotSupported(f'{self.name}: tx_replacement')
+
+    def tip_height(self):
+        """Altezza dell'ultimo blocco."""
+        raise NotSupported(f'{self.name}: tip_height')
+
+    def block(self, height):
+        """Dettagli del blocco all'altezza indicata."""
+        raise NotSupported(f'{self.name}: block')
+
+    def block_extras(self, block_hash):
+        """Informazioni aggiuntive di mempool su un blocco (pool, fee...), come il campo 'extras' di /v1/block."""
+        raise NotSupported(f'{self.name}: block_extras')
+
+    def block_txs(self, height):
+        """Tutte le transazioni del blocco all'altezza indicata, nel formato Esplora con prevout."""
+        raise NotSupported(f'{self.name}: block_txs')
+
+    def recent_blocks(self):
+        """Ultimi blocchi minati con statistiche."""
+        raise NotSupported(f'{self.name}: recent_blocks')
+
+    def recommended_fees(self):
+        """Fee raccomandate in sat/vB."""
+        raise NotSupported(f'{self.name}: recommended_fees')
+
+    def mempool(self):
+        """Statistiche della mempool (count, vsize, total_fee, fee_histogram)."""
+        raise NotSupported(f'{self.name}: mempool')
+
+    def mempool_blocks(self):
+        """Blocchi proiettati della mempool."""
+        raise NotSupported(f'{self.name}: mempool_blocks')
+
+
+class HttpBackend(ChainBackend):
+    """Base dei backend HTTP: la sessione requests viene creata al primo utilizzo."""
+
+    _session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+
+class EsploraBackend(HttpBackend):
+    """Backend HTTP per Mempool.space, istanze mempool self-hosted ed Esplora."""
+
+    name = 'esplora'
+
+    def __init__(self, base_url, session=None, timeout=30, max_workers=8):
+        self.base_url = base_url.rstrip('/')
+        self.session = session
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+    def _request(self, path):
+        """Esegue una GET e restituisce la risposta, convertendo gli errori HTTP in BackendError."""
+        try:
+            response = self.session.get(f'{self.base_url}{path}', timeout=self.timeout)
+        except requests.RequestException as e:
+            raise BackendError(str(e)) from e
+        if response.status_code in (400, 404):
+            raise NotFound(path)
+        if response.status_code != 200:
+            raise BackendError(f'{path}: HTTP {response.status_code}')
+        return response
+
+    def _get(self, path):
+        """Esegue una GET e restituisce il JSON decodificato."""
+        response = self._request(path)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise BackendError(f'{path}: risposta non valida') from e
+
+    def _get_text(self, path):
+        """Esegue una GET su un endpoint che risponde in testo semplice (es. /block-height/{altezza})."""
+        return self._request(path).text.strip()
+
+    def address_txs(self, address):
+        return self._get(f'/address/{address}/txs')
+
+    def address_txs_many(self, addresses):
+        # HTTP non ha batch: le richieste vengono parallelizzate su un pool limitato
+        def fetch(address):
+            try:
+                return address, self.address_txs(address)
+            except BackendError as e:
+                return address, e
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(executor.map(fetch, addresses))
+
+    def address_mempool_txs(self, address):
+        return self._get(f'/address/{address}/txs/mempool')
+
+    def address_status_many(self, addresses):
+        # Il riepilogo /address/{addr} (numero di tx e somme) cambia a ogni nuova tx dell'indirizzo
+        def fetch(address):
+            try:
+                summary = self._get(f'/address/{address}')
+            except BackendError as e:
+                return address, e
+            stats = [summary.get('chain_stats'), summary.get('mempool_stats')]
+            return address, hashlib.sha256(json.dumps(stats, sort_keys=True).encode()).hexdigest()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(executor.map(fetch, addresses))
+
+    def _get_many(self, paths):
+        """GET parallele su un pool limitato: {chiave: JSON o BackendError}."""
+        def fetch(item):
+            key, path = item
+            try:
+                return key, self._get(path)
+            except BackendError as e:
+                return key, e
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(executor.map(fetch, paths.items()))
+
+    def tx(self, txid):
+        return self._get(f'/tx/{txid}')
+
+    def txs_many(self, txids):
+        return self._get_many({txid: f'/tx/{txid}' for txid in txids})
+
+    def tx_status(self, txid):
+        return self._get(f'/tx/{txid}/status')
+
+    def outspends_many(self, txids):
+        return self._get_many({txid: f'/tx/{txid}/outspends' for txid in txids})
+
+    def tx_replacement(self, txid):
+        try:
+            history = self._get(f'/v1/tx/{txid}/rbf')
+        except NotFound as e:
+            raise NotSupported('esplora: tx_replacement') from e
+        # La radice dell'albero delle sostituzioni è l'ultima versione della tx
+        latest = ((history or {}).get('replacements') or {}).get('tx', {}).get('txid')
+        return latest if latest and latest != txid else None
+
+    def tip_height(self):
+        return self._get('/blocks/tip/height')
+
+    def block(self, height):
+        block_hash = self._get_text(f'/block-height/{height}')
+        try:
+            # Le istanze mempool includono in /v1/block le informazioni sul pool
+            return self._get(f'/v1/block/{block_hash}')
+        except NotFound:
+            return self._get(f'/block/{block_hash}')
+
+    def block_extras(self, block_hash):
+        try:
+            extras = self._get(f'/v1/block/{block_hash}').get('extras')
+        except NotFound as e:
+            raise NotSupported('esplora: block_extras') from e
+        if extras is None:
+            raise NotSupported('esplora: block_extras')
+        return extras
+
+    def block_txs(self, height):
+        # Esplora restituisce le tx di un blocco in pagine da 25: le pagine vengono scaricate in parallelo
+        block_hash = self._get_text(f'/block-height/{height}')
+        tx_count = self._get(f'/block/{block_hash}')['tx_count']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pages = executor.map(lambda start: self._get(f'/block/{block_hash}/txs/{start}'), range(0, tx_count, 25))
+            return [tx for page in pages for tx in page]
+
+    def recent_blocks(self):
+        try:
+            return self._get('/v1/blocks')
+        except NotFound as e:
+            raise NotSupported('esplora: recent_blocks') from e
+
+    def recommended_fees(self):
+        try:
+            return self._get('/v1/fees/recommended')
+        except NotFound:
+            # Esplora espone solo le stime per numero di blocchi
+            estimates = {int(target): rate for target, rate in self._get('/fee-estimates').items()}
+            return fees_from_estimates(estimates, estimates.get(1008, 1))
+
+    def mempool(self):
+        return self._get('/mempool')
+
+    def mempool_blocks(self):
+        try:
+            return self._get('/v1/fees/mempool-blocks')
+        except NotFound:
+            return project_mempool_blocks(self.mempool().get('fee_histogram', []))
+
+
+class ElectrumBackend(ChainBackend):
+    """Backend per server Electrum (ElectrumX, Fulcrum) con richieste JSON-RPC in batch.
+
+    Richiede il supporto di `blockchain.transaction.get` in modalità verbose.
+    """
+
+    name = 'electrum'
+
+    def __init__(self, host, port, use_ssl=True, ssl_verify=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.ssl_verify = ssl_verify
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._file = None
+        self._next_id = 0
+
+    def _connect(self):
+        """Apre la connessione e negozia la versione del protocollo."""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.use_ssl:
+            context = ssl.create_default_context()
+            if not self.ssl_verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=self.host)
+        self._file = sock.makefile('rwb')
+        self._send([('server.version', ['bitrackbot', '1.4'])])
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        self._file = None
+
+    def _send(self, calls):
+        """Invia un batch di chiamate e restituisce i risultati (BackendError per le chiamate fallite)."""
+        ids = []
+        payload = []
+        for method, params in calls:
+            self._next_id += 1
+            ids.append(self._next_id)
+            payload.append({'jsonrpc': '2.0', 'id': self._next_id, 'method': method, 'params': params})
+        self._file.write(json.dumps(payload).encode() + b'\n')
+        self._file.flush()
+        responses = {}
+        while len(responses) < len(ids):
+            line = self._file.readline()
+            if not line:
+                raise OSError('Connessione chiusa dal server Electrum')
+            message = json.loads(line)
+            for item in (message if isinstance(message, list) else [message]):
+                # Le notifiche delle sottoscrizioni non hanno id
+                if item.get('id') is not None:
+                    responses[item['id']] = item
+        results = []
+        for request_id in ids:
+            item = responses[request_id]
+            if item.get('error'):
+                error = item['error']
+                text = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+                results.append(NotFound(text) if 'not found' in text.lower() or 'no such' in text.lower() else BackendError(text))
+            else:
+                results.append(item.get('result'))
+        return results
+
+    def call_many(self, calls):
+        """Esegue più chiamate JSON-RPC in un solo round trip, riconnettendosi una volta se necessario."""
+        if not calls:
+            return []
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._file is None:
+                        self._connect()
+                    return self._send(calls)
+                except (OSError, ValueError) as e:
+                    self._close()
+                    if attempt:
+                        raise BackendError(f'electrum: {e}') from e
+
+    def call(self, method, *params):
+        """Esegue una singola chiamata JSON-RPC."""
+        result = self.call_many([(method, list(params))])[0]
+        if isinstance(result, BackendError):
+            raise result
+        return result
+
+    def _verbose_txs(self, txids):
+        """Scarica in batch le transazioni verbose complete di prevout, nel formato Esplora."""
+        results = self.call_many([('blockchain.transaction.get', [txid, True]) for txid in txids] + [('blockchain.headers.subscribe', [])])
+        tip = results.pop()
+        if isinstance(tip, BackendError):
+            raise tip
+        raw_txs = {}
+        for txid, result in zip(txids, results):
+            if not isinstance(result, BackendError):
+                raw_txs[txid] = result
+        prev_txids = missing_prevouts(raw_txs.values())
+        prev_results = self.call_many([('blockchain.transaction.get', [txid, True]) for txid in prev_txids])
+        prevouts = {}
+        for prev_txid, prev_tx in zip(prev_txids, prev_results):
+            if isinstance(prev_tx, BackendError):
+                continue
+            for index, output in enumerate(prev_tx['vout']):
+                prevouts[(prev_txid, index)] = output
+        return {
+            txid: result if isinstance(result, BackendError) else esplora_transaction(result, prevouts, tip['height'])
+            for txid, result in zip(txids, results)
+        }
+
+    def _histories(self, addresses, method):
+        """Recupera in batch lo storico (o la mempool) degli scripthash degli indirizzi."""
+        calls = [(method, [address_to_scripthash(address)]) for address in addresses]
+        return dict(zip(addresses, self.call_many(calls)))
+
+    def address_txs_many(self, addresses):
+        histories = self._histories(addresses, 'blockchain.scripthash.get_history')
+        wanted = {}
+        for address, history in histories.items():
+            if isinstance(history, BackendError):
+                continue
+            # Prima la mempool, poi le conferme più recenti, come Esplora
+            history = sorted(history, key=lambda item: item['height'] if item['height'] > 0 else float('inf'), reverse=True)
+            unconfirmed = [item['tx_hash'] for item in history if item['height'] <= 0]
+            confirmed = [item['tx_hash'] for item in history if item['height'] > 0][:ADDRESS_HISTORY_LIMIT]
+            wanted[address] = unconfirmed + confirmed
+        txs = self._verbose_txs(sorted({txid for txids in wanted.values() for txid in txids}))
+        results = {}
+        for address in addresses:
+            if address not in wanted:
+                results[address] = histories[address]
+                continue
+            results[address] = [txs[txid] for txid in wanted[address] if not isinstance(txs[txid], BackendError)]
+        return results
+
+    def address_txs(self, address):
+        result = self.address_txs_many([address])[address]
+        if isinstance(result, BackendError):
+            raise result
+        return result
+
+    def address_status_many(self, addresses):
+        # subscribe restituisce lo status Electrum, sha256 della cronologia ordinata "txid:altezza:" (None se vuota);
+        # le notifiche che il server invia poi per la sottoscrizione vengono scartate da _send
+        statuses = self._histories(addresses, 'blockchain.scripthash.subscribe')
+        return {address: '' if status is None else status for address, status in statuses.items()}
+
+    def address_mempool_txs(self, address):
+        mempool = self.call('blockchain.scripthash.get_mempool', address_to_scripthash(address))
+        txids = [item['tx_hash'] for item in mempool]
+        txs = self._verbose_txs(txids)
+        return [tx for tx in txs.values() if not isinstance(tx, BackendError)]
+
+    def txs_many(self, txids):
+        return self._verbose_txs(list(txids))
+
+    def tx(self, txid):
+        result = self._verbose_txs([txid])[txid]
+        if isinstance(result, BackendError):
+            raise result
+        return result
+
+    def tx_status(self, txid):
+        tx, tip = self.call_many([('blockchain.transaction.get', [txid, True]), ('blockchain.headers.subscribe', [])])
+        if isinstance(tx, BackendError):
+            raise tx
+        confirmations = tx.get('confirmations', 0)
+        if confirmations <= 0:
+            return {'confirmed': False}
+        return {
+            'confirmed': True,
+            'block_height': tip['height'] - confirmations + 1,
+            'block_hash': tx.get('blockhash'),
+            'block_time': tx.get('blocktime'),
+        }
+
+    def tip_height(self):
+        return self.call('blockchain.headers.subscribe')['height']
+
+    def block(self, height):
+        header = bytes.fromhex(self.call('blockchain.block.header', height))
+        return {
+            'id': hashlib.sha256(hashlib.sha256(header).digest()).digest()[::-1].hex(),
+            'height': height,
+            'timestamp': int.from_bytes(header[68:72], 'little'),
+        }
+
+    def recommended_fees(self):
+        targets = (1, 3, 6, 144)
+        results = self.call_many([('blockchain.estimatefee', [target]) for target in targets] + [('blockchain.relayfee', [])])
+        if any(isinstance(result, BackendError) for result in results):
+            raise BackendError('electrum: stima fee non disponibile')
+        # Le stime sono in BTC/kvB (-1 se non disponibili)
+        estimates = {target: rate * 100_000 for target, rate in zip(targets, results) if rate and rate > 0}
+        return fees_from_estimates(estimates, results[-1] * 100_000)
+
+    def mempool(self):
+        histogram = self.call('mempool.get_fee_histogram')
+        return {'count': None, 'vsize': sum(vsize for _, vsize in histogram), 'total_fee': None, 'fee_histogram': histogram}
+
+    def mempool_blocks(self):
+        return project_mempool_blocks(self.mempool()['fee_histogram'])
+
+
+class BitcoindBackend(HttpBackend):
+    """Backend per bitcoind via JSON-RPC HTTP con richieste in batch (richiede -txindex per le tx)."""
+
+    name = 'bitcoind'
+
+    def __init__(self, url, user=None, password=None, session=None, timeout=30):
+        self.url = url
+        self.auth = (user, password) if user else None
+        self.session = session
+        self.timeout = timeout
+
+    def call_many(self, calls):
+        """Esegue più chiamate RPC in un solo round trip (BackendError per le chiamate fallite)."""
+        if not calls:
+            return []
+        payload = [{'jsonrpc': '1.0', 'id': i, 'method': method, 'params': params} for i, (method, params) in enumerate(calls)]
+        try:
+            response = self.session.post(self.url, json=payload, auth=self.auth, timeout=self.timeout)
+            items = response.json()
+        except requests.RequestException as e:
+            raise BackendError(f'bitcoind: {e}') from e
+        except ValueError as e:
+            raise BackendError(f'bitcoind: HTTP {response.status_code}') from e
+        if not isinstance(items, list):
+            raise BackendError(f'bitcoind: {items}')
+        by_id = {item['id']: item for item in items}
+        results = []
+        for i in range(len(calls)):
+            item = by_id.get(i, {'error': {'message': 'risposta mancante'}})
+            error = item.get('error')
+            if error:
+                # -5: oggetto non trovato (tx o blocco sconosciuto)
+                results.append(NotFound(error.get('message')) if error.get('code') == -5 else BackendError(error.get('message')))
+            else:
+                results.append(item.get('result'))
+        return results
+
+    def call(self, method, *params):
+        """Esegue una singola chiamata RPC."""
+        result = self.call_many([(method, list(params))])[0]
+        if isinstance(result, BackendError):
+            raise result
+        return result
+
+    def txs_many(self, txids):
+        """Scarica in batch più transazioni complete di prevout, nel formato Esplora."""
+        results = self.call_many([('getrawtransaction', [txid, 2]) for txid in txids] + [('getblockcount', [])])
+        tip_height = results.pop()
+        if isinstance(tip_height, BackendError):
+            raise tip_height
+        raw_txs = [result for result in results if not isinstance(result, BackendError)]
+        # Le versioni precedenti alla 25 non includono i prevout nella verbosità 2
+        prev_txids = missing_prevouts(raw_txs)
+        prevouts = {}
+        for prev_txid, prev_tx in zip(prev_txids, self.call_many([('getrawtransaction', [txid, 1]) for txid in prev_txids])):
+            if not isinstance(prev_tx, BackendError):
+                for index, output in enumerate(prev_tx['vout']):
+                    prevouts[(prev_txid, index)] = output
+        return {
+            txid: result if isinstance(result, BackendError) else esplora_transaction(result, prevouts, tip_height)
+            for txid, result in zip(txids, results)
+        }
+
+    def tx(self, txid):
+        result = self.txs_many([txid])[txid]
+        if isinstance(result, BackendError):
+            raise result
+        return result
+
+    def tx_status(self, txid):
+        tx, tip_height = self.call_many([('getrawtransaction', [txid, 1]), ('getblockcount', [])])
+        if isinstance(tx, BackendError):
+            raise tx
+        confirmations = tx.get('confirmations', 0)
+        if confirmations <= 0:
+            return {'confirmed': False}
+        return {
+            'confirmed': True,
+            'block_height': tip_height - confirmations + 1,
+            'block_hash': tx.get('blockhash'),
+            'block_time': tx.get('blocktime'),
+        }
+
+    def tip_height(self):
+        return self.call('getblockcount')
+
+    def block(self, height):
+        header = self.call('getblockheader', self.call('getblockhash', height))
+        return {'id': header['hash'], 'height': height, 'timestamp': header['time'], 'tx_count': header['nTx']}
+
+    def block_txs(self, height):
+        # La verbosità 3 (bitcoind 25+) include i prevout degli input
+        block = self.call('getblock', self.call('getblockhash', height), 3)
+        for tx in block['tx']:
+            tx['confirmations'] = block['confirmations']
+            tx['blockhash'], tx['blocktime'], tx['height'] = block['hash'], block['time'], height
+        return [esplora_transaction(tx) for tx in block['tx']]
+
+    def recommended_fees(self):
+        targets = (1, 3, 6, 144)
+        results = self.call_many([('estimatesmartfee', [target]) for target in targets] + [('getmempoolinfo', [])])
+        mempool_info = results.pop()
+        if isinstance(mempool_info, BackendError):
+            raise mempool_info
+        # feerate in BTC/kvB
+        estimates = {
+            target: result['feerate'] * 100_000
+            for target, result in zip(targets, results)
+            if not isinstance(result, BackendError) and 'feerate' in result
+        }
+        return fees_from_estimates(estimates, mempool_info['mempoolminfee'] * 100_000)
+
+    def mempool(self):
+        info = self.call('getmempoolinfo')
+        return {'count': info['size'], 'vsize': info['bytes'], 'total_fee': btc_to_sats(info.get('total_fee', 0)), 'fee_histogram': []}
+
+
+class CompositeBackend(ChainBackend):
+    """Combina più backend: ogni richiesta va al primo che la supporta."""
+
+    name = 'composite'
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    def _dispatch(self, method, *args):
+        for backend in self.backends:
+            try:
+                return getattr(backend, method)(*args)
+            except NotSupported:
+                continue
+        raise NotSupported(method)
+
+    def address_txs(self, address):
+        return self._dispatch('address_txs', address)
+
+    def address_txs_many(self, addresses):
+        for backend in self.backends:
+            if type(backend).address_txs is not ChainBackend.address_txs:
+                return backend.address_txs_many(addresses)
+        raise NotSupported('address_txs_many')
+
+    def address_mempool_txs(self, address):
+        return self._dispatch('address_mempool_txs', address)
+
+    def address_status_many(self, addresses):
+        # Lo stato deve provenire dallo stesso backend che fornisce lo storico
+        for backend in self.backends:
+            if type(backend).address_txs is not ChainBackend.address_txs:
+                return backend.address_status_many(addresses)
+        raise NotSupported('address_status_many')
+
+    def tx(self, txid):
+        return self._dispatch('tx', txid)
+
+    def txs_many(self, txids):
+        return self._dispatch('txs_many', txids)
+
+    def tx_status(self, txid):
+        return self._dispatch('tx_status', txid)
+
+    def outspends_many(self, txids):
+        return self._dispatch('outspends_many', txids)
+
+    def tx_replacement(self, txid):
+        return self._dispatch('tx_replacement', txid)
+
+    def tip_height(self):
+        return self._dispatch('tip_height')
+
+    def block(self, height):
+        block = self._dispatch('block', height)
+        if 'extras' not in block:
+            # Electrum e bitcoind non conoscono il pool: viene chiesto per hash a MEMPOOL_API_URL
+            try:
+                block = dict(block, extras=self._dispatch('block_extras', block['id']))
+            except NotSupported:
+                pass
+        return block
+
+    def block_txs(self, height):
+        return self._dispatch('block_txs', height)
+
+    def recent_blocks(self):
+        return self._dispatch('recent_blocks')
+
+    def recommended_fees(self):
+        return self._dispatch('recommended_fees')
+
+    def mempool(self):
+        return self._dispatch('mempool')
+
+    def mempool_blocks(self):
+        return self._dispatch('mempool_blocks')
+
+
+def build_backend_from_env(session=None):
+    """Crea il backend configurato dalle variabili d'ambiente.
+
+    CHAIN_BACKEND: esplora (predefinito), electrum o bitcoind. I backend non HTTP
+    vengono affiancati da MEMPOOL_API_URL per i dati che non possono fornire.
+    """
+    esplora = EsploraBackend(os.getenv('MEMPOOL_API_URL', 'https://mempool.space/api'), session=session)
+    kind = os.getenv('CHAIN_BACKEND', 'esplora').lower()
+    if kind == 'esplora':
+        return esplora
+    if kind == 'electrum':
+        primary = ElectrumBackend(
+            os.getenv('ELECTRUM_HOST', 'localhost'),
+            int(os.getenv('ELECTRUM_PORT', '50002')),
+            use_ssl=os.getenv('ELECTRUM_SSL', '1') == '1',
+            ssl_verify=os.getenv('ELECTRUM_SSL_VERIFY', '1') == '1',
+        )
+    elif kind == 'bitcoind':
+        primary = BitcoindBackend(
+            os.getenv('BITCOIND_RPC_URL', 'http://localhost:8332'),
+            os.getenv('BITCOIND_RPC_USER'),
+            os.getenv('BITCOIND_RPC_PASSWORD'),
+            session=session,
+        )
+    else:
+        raise ValueError(f'CHAIN_BACKEND non valido: {kind}')
+    return CompositeBackend([primary, esplora])
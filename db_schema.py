@@ -0,0 +1,299 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Schema normalizzato del database delle sottoscrizioni e migrazioni versionate (PRAGMA user_version).
+
+Versione 0: le tabelle separate delle versioni precedenti (address_subscriptions, tx_subscriptions, ...).
+Versione 1: users, watched_objects, subscriptions, thresholds e le tabelle per utente, con chiavi
+intere, vincoli di unicità, indici coprenti per i monitor e cancellazione a cascata dall'utente.
+Versione 2: fuso orario e ora locale delle notifiche prezzo periodiche.
+Versione 3: stato dei canali di pubblicazione (ultimo livello fee, ultimo blocco controllato).
+"""
+
+SCHEMA_VERSION = 3
+
+# Schema della versione 0, completato prima della migrazione anche per i database più vecchi
+LEGACY_TABLES = [
+    'CREATE TABLE IF NOT EXISTS address_subscriptions (user_id TEXT, address TEXT, type TEXT, timestamp INTEGER, min_amount INTEGER DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS fee_thresholds (user_id TEXT, threshold REAL, direction TEXT, notified INTEGER DEFAULT 0)',
+    "CREATE TABLE IF NOT EXISTS tx_subscriptions (user_id TEXT, txid TEXT, confirmations INTEGER, timestamp INTEGER, thresholds TEXT, reached TEXT DEFAULT '')",
+    'CREATE TABLE IF NOT EXISTS notified_transactions (user_id TEXT, txid TEXT)',
+    'CREATE TABLE IF NOT EXISTS mempool_address_subscriptions (user_id TEXT, address TEXT, type TEXT, timestamp INTEGER, min_amount INTEGER DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS notified_mempool_transactions (user_id TEXT, txid TEXT)',
+    'CREATE TABLE IF NOT EXISTS solo_miner_subscriptions (user_id TEXT, last_checked_height INTEGER)',
+    'CREATE TABLE IF NOT EXISTS price_thresholds (user_id TEXT, currency TEXT, threshold REAL, notified INTEGER, direction TEXT)',
+    'CREATE TABLE IF NOT EXISTS price_alerts (user_id TEXT PRIMARY KEY, frequency TEXT, currency TEXT, next_notification_time INTEGER)',
+    'CREATE TABLE IF NOT EXISTS user_settings (user_id TEXT PRIMARY KEY, digest INTEGER DEFAULT 0)',
+]
+LEGACY_COLUMNS = [
+    ('tx_subscriptions', 'thresholds', 'TEXT'),
+    ('tx_subscriptions', 'reached', "TEXT DEFAULT ''"),
+    ('address_subscriptions', 'min_amount', 'INTEGER DEFAULT 0'),
+    ('mempool_address_subscriptions', 'min_amount', 'INTEGER DEFAULT 0'),
+]
+LEGACY_TABLE_NAMES = [
+    'address_subscriptions', 'fee_thresholds', 'tx_subscriptions', 'notified_transactions',
+    'mempool_address_subscriptions', 'notified_mempool_transactions', 'solo_miner_subscriptions',
+    'price_thresholds', 'price_alerts', 'user_settings',
+]
+
+CHANNEL_STATE_TABLE = '''CREATE TABLE channel_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID'''
+
+# Schema dell'ultima versione, creato direttamente sui database nuovi o della versione 0
+TABLES = [
+    # chat_id è l'id Telegram usato come destinatario dei messaggi
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY,
+        chat_id TEXT NOT NULL UNIQUE,
+        digest INTEGER NOT NULL DEFAULT 0
+    )''',
+    # Indirizzi e txid osservati, condivisi da tutte le sottoscrizioni che li riguardano
+    '''CREATE TABLE watched_objects (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL CHECK (kind IN ('address', 'tx')),
+        value TEXT NOT NULL,
+        UNIQUE (kind, value)
+    )''',
+    # kind: 'address' (confermate), 'mempool' (non confermate) o 'tx'; targets e reached solo per 'tx'
+    '''CREATE TABLE subscriptions (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        object_id INTEGER NOT NULL REFERENCES watched_objects(id) ON DELETE CASCADE,
+        kind TEXT NOT NULL CHECK (kind IN ('address', 'mempool', 'tx')),
+        direction TEXT NOT NULL DEFAULT '',
+        min_amount INTEGER NOT NULL DEFAULT 0,
+        created INTEGER NOT NULL DEFAULT 0,
+        targets TEXT NOT NULL DEFAULT '',
+        reached TEXT NOT NULL DEFAULT '',
+        UNIQUE (user_id, object_id, kind, direction)
+    )''',
+    # kind: 'fee' (currency vuota) o 'price'; direction: 'above', 'below' o 'percentile'
+    '''CREATE TABLE thresholds (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        kind TEXT NOT NULL CHECK (kind IN ('fee', 'price')),
+        currency TEXT NOT NULL DEFAULT '',
+        value REAL NOT NULL,
+        direction TEXT NOT NULL,
+        notified INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (user_id, kind, currency, value, direction)
+    )''',
+    '''CREATE TABLE notified_transactions (
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        txid TEXT NOT NULL,
+        PRIMARY KEY (user_id, txid)
+    ) WITHOUT ROWID''',
+    # Chiave per txid: la pulizia delle tx uscite dalla mempool legge e cancella per txid
+    '''CREATE TABLE notified_mempool_transactions (
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        txid TEXT NOT NULL,
+        PRIMARY KEY (txid, user_id)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE solo_miner_subscriptions (
+        user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+        last_checked_height INTEGER NOT NULL
+    )''',
+    '''CREATE TABLE price_alerts (
+        user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+        frequency TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        next_notification_time INTEGER NOT NULL,
+        timezone TEXT NOT NULL DEFAULT 'UTC',
+        hour INTEGER NOT NULL DEFAULT 7 CHECK (hour BETWEEN 0 AND 23)
+    )''',
+    # Stato dei canali: sta qui e non nella cache persistente, che può scartare le voci
+    CHANNEL_STATE_TABLE,
+]
+INDEXES = [
+    # Coprente per i monitor (filtro su kind, raggruppamento per oggetto, dati del sottoscrittore)
+    'CREATE INDEX idx_subscriptions_monitor ON subscriptions(kind, object_id, user_id, direction, min_amount, created)',
+    # Cascata da watched_objects, ricerca "l'indirizzo è ancora monitorato?" e pulizia degli orfani
+    'CREATE INDEX idx_subscriptions_object ON subscriptions(object_id, kind)',
+    # Coprente per monitor_fees e monitor_price_thresholds: contiene solo le soglie da notificare
+    # (notified è tra le colonne perché SQLite lo legge per verificare la condizione dell'indice)
+    'CREATE INDEX idx_thresholds_pending ON thresholds(kind, user_id, currency, value, direction, notified) WHERE notified = 0',
+    # Cascata dalla tabella users
+    'CREATE INDEX idx_notified_mempool_user ON notified_mempool_transactions(user_id)',
+]
+
+MIGRATION_V1 = '''
+INSERT OR IGNORE INTO users (chat_id)
+    SELECT user_id FROM legacy_address_subscriptions
+    UNION SELECT user_id FROM legacy_mempool_address_subscriptions
+    UNION SELECT user_id FROM legacy_tx_subscriptions
+    UNION SELECT user_id FROM legacy_fee_thresholds
+    UNION SELECT user_id FROM legacy_price_thresholds
+    UNION SELECT user_id FROM legacy_solo_miner_subscriptions
+    UNION SELECT user_id FROM legacy_price_alerts
+    UNION SELECT user_id FROM legacy_user_settings;
+UPDATE users SET digest = 1
+    WHERE chat_id IN (SELECT user_id FROM legacy_user_settings WHERE digest = 1);
+
+INSERT OR IGNORE INTO watched_objects (kind, value)
+    SELECT 'address', address FROM legacy_address_subscriptions
+    UNION SELECT 'address', address FROM legacy_mempool_address_subscriptions
+    UNION SELECT 'tx', txid FROM legacy_tx_subscriptions;
+
+INSERT OR IGNORE INTO subscriptions (user_id, object_id, kind, direction, min_amount, created)
+    SELECT u.id, o.id, 'address', a.type, COALESCE(a.min_amount, 0), COALESCE(a.timestamp, 0)
+    FROM legacy_address_subscriptions a
+    JOIN users u ON u.chat_id = a.user_id
+    JOIN watched_objects o ON o.kind = 'address' AND o.value = a.address;
+INSERT OR IGNORE INTO subscriptions (user_id, object_id, kind, direction, min_amount, created)
+    SELECT u.id, o.id, 'mempool', m.type, COALESCE(m.min_amount, 0), COALESCE(m.timestamp, 0)
+    FROM legacy_mempool_address_subscriptions m
+    JOIN users u ON u.chat_id = m.user_id
+    JOIN watched_objects o ON o.kind = 'address' AND o.value = m.address;
+-- Le righe create prima delle soglie multiple hanno solo 'confirmations'; più righe dello stesso
+-- utente per la stessa tx (profondità diverse) diventano una sola sottoscrizione con tutte le soglie
+INSERT OR IGNORE INTO subscriptions (user_id, object_id, kind, created, targets, reached)
+    SELECT u.id, o.id, 'tx', MIN(COALESCE(t.timestamp, 0)),
+           merge_int_lists(COALESCE(NULLIF(t.thresholds, ''), CAST(t.confirmations AS TEXT))),
+           merge_int_lists(t.reached)
+    FROM legacy_tx_subscriptions t
+    JOIN users u ON u.chat_id = t.user_id
+    JOIN watched_objects o ON o.kind = 'tx' AND o.value = t.txid
+    GROUP BY u.id, o.id;
+
+INSERT OR IGNORE INTO thresholds (user_id, kind, value, direction, notified)
+    SELECT u.id, 'fee', f.threshold, f.direction, COALESCE(f.notified, 0)
+    FROM legacy_fee_thresholds f JOIN users u ON u.chat_id = f.user_id;
+INSERT OR IGNORE INTO thresholds (user_id, kind, currency, value, direction, notified)
+    SELECT u.id, 'price', p.currency, p.threshold, p.direction, COALESCE(p.notified, 0)
+    FROM legacy_price_thresholds p JOIN users u ON u.chat_id = p.user_id;
+
+INSERT OR IGNORE INTO notified_transactions (user_id, txid)
+    SELECT u.id, n.txid FROM legacy_notified_transactions n JOIN users u ON u.chat_id = n.user_id;
+INSERT OR IGNORE INTO notified_mempool_transactions (user_id, txid)
+    SELECT u.id, n.txid FROM legacy_notified_mempool_transactions n JOIN users u ON u.chat_id = n.user_id;
+INSERT OR IGNORE INTO solo_miner_subscriptions (user_id, last_checked_height)
+    SELECT u.id, MIN(s.last_checked_height)
+    FROM legacy_solo_miner_subscriptions s JOIN users u ON u.chat_id = s.user_id GROUP BY u.id;
+INSERT OR IGNORE INTO price_alerts (user_id, frequency, currency, next_notification_time)
+    SELECT u.id, p.frequency, p.currency, p.next_notification_time
+    FROM legacy_price_alerts p JOIN users u ON u.chat_id = p.user_id;
+'''
+
+# Migrazioni incrementali dalla versione 1 in poi: versione di arrivo -> istruzioni
+MIGRATIONS = {
+    2: [
+        "ALTER TABLE price_alerts ADD COLUMN timezone TEXT NOT NULL DEFAULT 'UTC'",
+        'ALTER TABLE price_alerts ADD COLUMN hour INTEGER NOT NULL DEFAULT 7 CHECK (hour BETWEEN 0 AND 23)',
+    ],
+    3: [CHANNEL_STATE_TABLE],
+}
+
+
+class MergeIntLists:
+    """Aggregato SQL merge_int_lists: unione ordinata e senza duplicati di liste "1,3,6"."""
+
+    def __init__(self):
+        self.values = set()
+
+    def step(self, text):
+        if text is not None:
+            self.values.update(int(value) for value in str(text).split(',') if value.strip())
+
+    def finalize(self):
+        return ','.join(map(str, sorted(self.values)))
+
+
+def table_exists(c, name):
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return c.fetchone() is not None
+
+
+def add_column_if_missing(c, table, column, definition):
+    """Aggiunge una colonna a una tabella esistente se non è già presente."""
+    c.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def migrate(conn):
+    """Porta il database all'ultima versione dello schema e attiva le chiavi esterne; restituisce la versione."""
+    c = conn.cursor()
+    version = c.execute('PRAGMA user_version').fetchone()[0]
+    if version < 1:
+        # Un database della versione 0 si riconosce dalle vecchie tabelle; altrimenti è nuovo
+        legacy = table_exists(c, 'address_subscriptions')
+        script = ['BEGIN']
+        if legacy:
+            # Completa lo schema 0 (tabelle e colonne aggiunte nel tempo) così la copia è uniforme
+            for statement in LEGACY_TABLES:
+                c.execute(statement)
+            for table, column, definition in LEGACY_COLUMNS:
+                add_column_if_missing(c, table, column, definition)
+            conn.commit()
+            script += [f'ALTER TABLE {name} RENAME TO legacy_{name}' for name in LEGACY_TABLE_NAMES]
+        script += TABLES
+        if legacy:
+            conn.create_aggregate('merge_int_lists', 1, MergeIntLists)
+            script.append(MIGRATION_V1)
+            script += [f'DROP TABLE legacy_{name}' for name in LEGACY_TABLE_NAMES]
+        script += INDEXES
+        script += [f'PRAGMA user_version = {SCHEMA_VERSION}', 'COMMIT']
+        try:
+            conn.executescript(';\n'.join(script) + ';')
+        except Exception:
+            conn.rollback()
+            raise
+        version = SCHEMA_VERSION
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        try:
+            conn.executescript(';\n'.join(['BEGIN'] + MIGRATIONS[target] + [f'PRAGMA user_version = {target}', 'COMMIT']) + ';')
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    # Vale per connessione e non dentro una transazione: va attivato dopo la migrazione
+    c.execute('PRAGMA foreign_keys = ON')
+    return version
+
+
+def ensure_user(c, chat_id):
+    """Restituisce la chiave interna dell'utente, creandolo se necessario."""
+    c.execute('INSERT OR IGNORE INTO users (chat_id) VALUES (?)', (chat_id,))
+    c.execute('SELECT id FROM users WHERE chat_id = ?', (chat_id,))
+    return c.fetchone()[0]
+
+
+def ensure_watched_object(c, kind, value):
+    """Restituisce la chiave dell'indirizzo o txid osservato, creandolo se necessario."""
+    c.execute('INSERT OR IGNORE INTO watched_objects (kind, value) VALUES (?, ?)', (kind, value))
+    c.execute('SELECT id FROM watched_objects WHERE kind = ? AND value = ?', (kind, value))
+    return c.fetchone()[0]
+
+
+def prune_watched_objects(c):
+    """Cancella gli indirizzi e i txid senza più sottoscrizioni."""
+    c.execute('DELETE FROM watched_objects WHERE NOT EXISTS (SELECT 1 FROM subscriptions s WHERE s.object_id = watched_objects.id)')
+    return c.rowcount
+
+
+def get_channel_state(c, name):
+    """Restituisce lo stato salvato del canale (None se assente)."""
+    c.execute('SELECT value FROM channel_state WHERE name = ?', (name,))
+    row = c.fetchone()
+    return row[0] if row is not None else None
+
+
+def set_channel_state(c, name, value):
+    """Salva lo stato del canale."""
+    c.execute('INSERT OR REPLACE INTO channel_state (name, value) VALUES (?, ?)', (name, value))
@@ -0,0 +1,172 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Profili di configurazione SQLCipher (chiave, cifratura e pragma di connessione) e migrazione dei database.
+
+Uso da riga di comando (con il bot fermo):
+    python db_tuning.py genkey
+    python db_tuning.py migrate subscriptions.db [--from-kdf-iter N] [--from-cipher-page-size N] [--from-raw-key] [--new-key CHIAVE]
+
+La migrazione legge il database con le impostazioni --from-* e DB_KEY, lo riscrive con il
+profilo configurato nell'ambiente (DB_PROFILE, DB_RAW_KEY, DB_KDF_ITER, ...) tramite
+sqlcipher_export e conserva l'originale come <file>.bak.
+"""
+
+import argparse
+import os
+import re
+import secrets
+import sys
+
+# Impostazioni di cifratura: devono coincidere con quelle usate alla creazione del database
+CIPHER_SETTINGS = ('kdf_iter', 'cipher_page_size')
+# Impostazioni della connessione: possono cambiare a ogni apertura
+CONNECTION_SETTINGS = ('cache_size', 'mmap_size', 'journal_mode', 'synchronous', 'temp_store')
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+TEMP_STORE_MODES = {'DEFAULT', 'FILE', 'MEMORY'}
+
+PROFILES = {
+    # Impostazioni predefinite di SQLCipher 4: compatibile con i database esistenti
+    'default': {},
+    # Journal WAL con fsync solo ai checkpoint, cache di pagina più ampia e temporanei in memoria
+    'tuned': {'cache_size': -16000, 'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'temp_store': 'MEMORY'},
+}
+
+ENV_SETTINGS = {
+    'kdf_iter': 'DB_KDF_ITER',
+    'cipher_page_size': 'DB_CIPHER_PAGE_SIZE',
+    'cache_size': 'DB_CACHE_SIZE',
+    'mmap_size': 'DB_MMAP_SIZE',
+    'journal_mode': 'DB_JOURNAL_MODE',
+    'synchronous': 'DB_SYNCHRONOUS',
+    'temp_store': 'DB_TEMP_STORE',
+}
+
+
+def validate_setting(name, value):
+    """Valida e normalizza un'impostazione del profilo (ValueError se non valida)."""
+    if name in ('journal_mode', 'synchronous', 'temp_store'):
+        value = str(value).upper()
+        allowed = {'journal_mode': JOURNAL_MODES, 'synchronous': SYNCHRONOUS_MODES, 'temp_store': TEMP_STORE_MODES}[name]
+        if value not in allowed:
+            raise ValueError(f'{name} non valido: {value}')
+        return value
+    if name in CIPHER_SETTINGS + ('cache_size', 'mmap_size'):
+        return int(value)
+    raise ValueError(f'Impostazione sconosciuta: {name}')
+
+
+def profile_from_env():
+    """Costruisce il profilo da DB_PROFILE e dalle singole variabili DB_* che lo sovrascrivono."""
+    name = os.getenv('DB_PROFILE', 'default')
+    if name not in PROFILES:
+        raise ValueError(f'DB_PROFILE non valido: {name}')
+    profile = dict(PROFILES[name])
+    for setting, variable in ENV_SETTINGS.items():
+        if os.getenv(variable):
+            profile[setting] = validate_setting(setting, os.getenv(variable))
+    profile['raw_key'] = os.getenv('DB_RAW_KEY') == '1'
+    return profile
+
+
+def key_literal(key, raw=False):
+    """Valore SQL della chiave: passphrase (derivata con PBKDF2) o chiave grezza da 256 bit in esadecimale."""
+    if raw:
+        if not re.fullmatch(r'[0-9a-fA-F]{64}', key):
+            raise ValueError('Con DB_RAW_KEY=1 la chiave deve essere di 64 caratteri esadecimali')
+        return f'"x\'{key}\'"'
+    return "'" + key.replace("'", "''") + "'"
+
+
+def apply_profile(conn, key, profile):
+    """Imposta chiave, parametri di cifratura e pragma di connessione su una connessione appena aperta."""
+    conn.execute(f'PRAGMA key = {key_literal(key, profile.get("raw_key", False))}')
+    # Con una chiave grezza kdf_iter viene ignorato: non c'è derivazione PBKDF2
+    for name in CIPHER_SETTINGS:
+        if name in profile:
+            conn.execute(f'PRAGMA {name} = {profile[name]}')
+    # I pragma seguenti leggono il database: la derivazione della chiave avviene qui
+    for name in CONNECTION_SETTINGS:
+        if name in profile:
+            conn.execute(f'PRAGMA {name} = {profile[name]}')
+
+
+def migrate(path, key, old_profile, new_profile, new_key=None):
+    """Riscrive il database con il nuovo profilo tramite sqlcipher_export; restituisce il percorso del backup."""
+    from sqlcipher3 import dbapi2 as sqlite3
+    new_key = new_key or key
+    tmp_path = f'{path}.migrating'
+    backup_path = f'{path}.bak'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(path)
+    try:
+        apply_profile(conn, key, {name: value for name, value in old_profile.items() if name not in CONNECTION_SETTINGS})
+        user_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        conn.execute(f"ATTACH DATABASE '{tmp_path}' AS migrated KEY {key_literal(new_key, new_profile.get('raw_key', False))}")
+        for name in CIPHER_SETTINGS:
+            if name in new_profile:
+                conn.execute(f'PRAGMA migrated.{name} = {new_profile[name]}')
+        conn.execute("SELECT sqlcipher_export('migrated')")
+        conn.execute(f'PRAGMA migrated.user_version = {user_version}')
+        conn.execute('DETACH DATABASE migrated')
+    finally:
+        conn.close()
+    os.replace(path, backup_path)
+    os.replace(tmp_path, path)
+    # Verifica: il nuovo file deve aprirsi con il profilo di destinazione
+    check = sqlite3.connect(path)
+    try:
+        apply_profile(check, new_key, new_profile)
+        check.execute('SELECT count(*) FROM sqlite_master').fetchone()
+    finally:
+        check.close()
+    return backup_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Strumenti per i profili SQLCipher del bot.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('genkey', help='genera una chiave grezza da 256 bit per DB_RAW_KEY=1')
+    migrate_parser = commands.add_parser('migrate', help='riscrive un database con il profilo configurato')
+    migrate_parser.add_argument('path')
+    migrate_parser.add_argument('--from-kdf-iter', type=int)
+    migrate_parser.add_argument('--from-cipher-page-size', type=int)
+    migrate_parser.add_argument('--from-raw-key', action='store_true', help='il database attuale usa una chiave grezza')
+    migrate_parser.add_argument('--new-key', help='chiave del database migrato (predefinita: DB_KEY)')
+    args = parser.parse_args()
+
+    if args.command == 'genkey':
+        print(secrets.token_hex(32))
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    key = os.getenv('DB_KEY')
+    if not key:
+        sys.exit('DB_KEY non definita')
+    old_profile = {'raw_key': args.from_raw_key}
+    if args.from_kdf_iter:
+        old_profile['kdf_iter'] = args.from_kdf_iter
+    if args.from_cipher_page_size:
+        old_profile['cipher_page_size'] = args.from_cipher_page_size
+    backup_path = migrate(args.path, key, old_profile, profile_from_env(), args.new_key)
+    print(f'Database migrato: {args.path} (originale in {backup_path})')
+
+
+if __name__ == '__main__':
+    main()
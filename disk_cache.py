@@ -0,0 +1,114 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Cache persistente cifrata per i dati on-chain immutabili, conservata tra un riavvio e l'altro."""
+
+import json
+import threading
+import zlib
+from time import time
+
+from lazy import LazyConnection
+
+
+class PersistentCache:
+    """Archivio chiave/valore su SQLCipher con valori JSON compressi ed eviction LRU a dimensione massima.
+
+    Gli accessi in lettura vengono registrati in memoria e scritti su disco solo da commit(),
+    così una lettura non costa una scrittura sul database. Il file viene aperto al primo utilizzo.
+    """
+
+    def __init__(self, path, key, max_bytes=64 * 1024 * 1024, profile=None):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._conn = LazyConnection(path, key, on_connect=self._init_schema, profile=profile)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _init_schema(self):
+        self._conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access INTEGER)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)')
+        self._conn.commit()
+        self.total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+
+    @staticmethod
+    def _encode(value):
+        return zlib.compress(json.dumps(value, separators=(',', ':')).encode())
+
+    @staticmethod
+    def _decode(blob):
+        return json.loads(zlib.decompress(blob))
+
+    def get(self, key):
+        """Restituisce il valore salvato per la chiave (None se assente)."""
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = int(time())
+        return self._decode(row[0])
+
+    def put(self, key, value):
+        """Salva un valore; viene scritto su disco al prossimo commit()."""
+        blob = self._encode(value)
+        with self._lock:
+            row = self._conn.execute('SELECT size FROM cache WHERE key = ?', (key,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', (key, blob, len(blob), int(time())))
+            self.total_bytes += len(blob) - (row[0] if row else 0)
+            self._touched.pop(key, None)
+
+    def delete(self, key):
+        """Rimuove una chiave dalla cache."""
+        with self._lock:
+            row = self._conn.execute('SELECT size FROM cache WHERE key = ?', (key,)).fetchone()
+            if row:
+                self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self.total_bytes -= row[0]
+            self._touched.pop(key, None)
+
+    def items(self, prefix):
+        """Itera su (chiave, valore) delle voci con il prefisso indicato."""
+        with self._lock:
+            rows = self._conn.execute('SELECT key, value FROM cache WHERE key >= ? AND key < ?', (prefix, prefix + '\uffff')).fetchall()
+        for key, blob in rows:
+            yield key, self._decode(blob)
+
+    def commit(self):
+        """Registra gli accessi, applica l'eviction LRU oltre la dimensione massima e salva su disco."""
+        with self._lock:
+            if self._touched:
+                self._conn.executemany('UPDATE cache SET last_access = ? WHERE key = ?', [(ts, key) for key, ts in self._touched.items()])
+                self._touched.clear()
+            if self.total_bytes > self.max_bytes:
+                # Si libera un 10% in più per non ripetere l'eviction a ogni commit
+                target = self.max_bytes * 9 // 10
+                evicted = []
+                for key, size in self._conn.execute('SELECT key, size FROM cache ORDER BY last_access'):
+                    if self.total_bytes <= target:
+                        break
+                    evicted.append((key,))
+                    self.total_bytes -= size
+                self._conn.executemany('DELETE FROM cache WHERE key = ?', evicted)
+            self._conn.commit()
+
+    def close(self):
+        if self._conn.connected:
+            self.commit()
+            self._conn.close()
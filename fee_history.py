@@ -0,0 +1,163 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Serie storiche compatte su buffer circolari a larghezza fissa, salvate su disco."""
+
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from time import time
+
+HOUR = 3600
+DAY = 86400
+WEEK = 7 * DAY
+
+
+class RingSeries:
+    """Serie temporale su buffer circolari: un array di timestamp e un array float per campo."""
+
+    MAGIC = b'BTRS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHII')
+    FIELDS = ()
+
+    def __init__(self, capacity, fields=None):
+        self.fields = tuple(fields or self.FIELDS)
+        self.capacity = capacity
+        self.timestamps = array('I', bytes(4 * capacity))
+        self.columns = {field: array('f', bytes(4 * capacity)) for field in self.fields}
+        self.count = 0
+        self.next = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, values):
+        """Aggiunge un campione; i campi mancanti vengono salvati come 0."""
+        self.timestamps[self.next] = int(timestamp)
+        for field in self.fields:
+            self.columns[field][self.next] = values.get(field) or 0.0
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _physical(self, logical):
+        """Converte un indice logico (0 = campione più vecchio) nell'indice dell'array."""
+        return (self.next - self.count + logical) % self.capacity
+
+    def _first_index_since(self, since):
+        """Primo indice logico con timestamp >= since (ricerca binaria sul buffer circolare)."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[self._physical(middle)] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, field, seconds, now=None):
+        """Restituisce i valori del campo negli ultimi `seconds` secondi, dal più vecchio."""
+        since = (now if now is not None else time()) - seconds
+        column = self.columns[field]
+        return [column[self._physical(i)] for i in range(self._first_index_since(since), self.count)]
+
+    def latest(self, field):
+        """Restituisce l'ultimo valore registrato del campo (None se la serie è vuota)."""
+        return self.columns[field][self._physical(self.count - 1)] if self.count else None
+
+    def min_max(self, field, seconds, now=None):
+        """Minimo e massimo del campo nella finestra indicata (None se vuota)."""
+        values = self.window(field, seconds, now)
+        return (min(values), max(values)) if values else None
+
+    def percentile(self, field, pct, seconds, now=None):
+        """Valore al percentile `pct` (0-100) nella finestra indicata (None se vuota)."""
+        values = sorted(self.window(field, seconds, now))
+        if not values:
+            return None
+        rank = (len(values) - 1) * pct / 100
+        lower = int(rank)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+    def percentile_rank(self, field, value, seconds, now=None):
+        """Percentuale di campioni della finestra strettamente inferiori a `value` (None se vuota)."""
+        values = sorted(self.window(field, seconds, now))
+        if not values:
+            return None
+        return 100 * bisect_left(values, value) / len(values)
+
+    def save(self, path):
+        """Salva la serie su disco in modo atomico."""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(self.fields), self.capacity, self.count))
+            f.write(struct.pack('<I', self.next))
+            f.write(','.join(self.fields).encode().ljust(256, b'\0'))
+            f.write(self.timestamps.tobytes())
+            for field in self.fields:
+                f.write(self.columns[field].tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, capacity, fields=None):
+        """Carica una serie salvata; se il file manca o non è compatibile restituisce una serie vuota."""
+        series = cls(capacity, fields)
+        try:
+            with open(path, 'rb') as f:
+                magic, version, _, saved_capacity, saved_count = cls.HEADER.unpack(f.read(cls.HEADER.size))
+                saved_next = struct.unpack('<I', f.read(4))[0]
+                saved_fields = f.read(256).rstrip(b'\0').decode().split(',')
+                if magic != cls.MAGIC or version != cls.VERSION:
+                    return series
+                saved = RingSeries(saved_capacity, saved_fields)
+                saved.count, saved.next = saved_count, saved_next
+                saved.timestamps = array('I')
+                saved.timestamps.frombytes(f.read(4 * saved_capacity))
+                for field in saved_fields:
+                    saved.columns[field] = array('f')
+                    saved.columns[field].frombytes(f.read(4 * saved_capacity))
+            # Un file troncato o scritto a metà ha array più corti della capacità dichiarata
+            if not 0 <= saved_count <= saved_capacity or not 0 <= saved_next < saved_capacity:
+                raise ValueError('intestazione incoerente')
+            if any(len(column) != saved_capacity for column in [saved.timestamps, *saved.columns.values()]):
+                raise ValueError('file troncato')
+        except (OSError, struct.error, ValueError, UnicodeDecodeError):
+            return series
+        # I campioni vengono reinseriti in ordine: gestisce cambi di capacità o di campi
+        for i in range(saved.count):
+            index = saved._physical(i)
+            values = {field: saved.columns[field][index] for field in saved_fields if field in series.columns}
+            series.append(saved.timestamps[index], values)
+        return series
+
+
+class FeeHistory(RingSeries):
+    """Storico delle fee raccomandate e della fee mediana del prossimo blocco proiettato."""
+
+    FIELDS = ('fastest', 'half_hour', 'hour', 'economy', 'minimum', 'next_block_median')
+
+    def sample(self, fees, mempool_blocks, timestamp=None):
+        """Registra un campione a partire da /v1/fees/recommended e /v1/fees/mempool-blocks."""
+        self.append(timestamp if timestamp is not None else time(), {
+            'fastest': fees.get('fastestFee'),
+            'half_hour': fees.get('halfHourFee'),
+            'hour': fees.get('hourFee'),
+            'economy': fees.get('economyFee'),
+            'minimum': fees.get('minimumFee'),
+            'next_block_median': mempool_blocks[0].get('medianFee') if mempool_blocks else None,
+        })
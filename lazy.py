@@ -0,0 +1,81 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Caricamento differito di moduli e connessioni al database per un avvio rapido."""
+
+import importlib.util
+import sys
+import threading
+
+from db_tuning import apply_profile
+
+
+def lazy_module(name):
+    """Restituisce il modulo indicato, eseguendone l'import solo al primo accesso a un attributo."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class LazyConnection:
+    """Connessione SQLCipher aperta al primo utilizzo.
+
+    La derivazione della chiave (PRAGMA key) costa centinaia di millisecondi: viene pagata
+    solo quando serve, tipicamente dal warm-up in background. on_connect viene eseguita una
+    volta subito dopo l'apertura (es. creazione dello schema). profile contiene le impostazioni
+    SQLCipher (vedi db_tuning).
+    """
+
+    def __init__(self, path, key, on_connect=None, profile=None):
+        self.path = path
+        self._key = key
+        self._on_connect = on_connect
+        self.profile = profile or {}
+        self._conn = None
+        self._ready = False
+        self._lock = threading.RLock()
+
+    @property
+    def connected(self):
+        return self._ready
+
+    def connection(self):
+        """Restituisce la connessione, aprendola se necessario."""
+        if self._ready:
+            return self._conn
+        with self._lock:
+            # Le chiamate rientranti da on_connect trovano la connessione già aperta
+            if self._conn is None:
+                from sqlcipher3 import dbapi2 as sqlite3
+                # La connessione può essere aperta dal thread di warm-up e usata dall'event loop
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                apply_profile(conn, self._key, self.profile)
+                self._conn = conn
+                if self._on_connect is not None:
+                    self._on_connect()
+                self._ready = True
+            return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self.connection(), name)
@@ -0,0 +1,178 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Strumentazione dell'event loop: ritardo del loop, callback lente e profiler a campionamento.
+
+Il watchdog misura continuamente il ritardo del loop con un battito periodico; un thread di
+controllo, se il battito tarda oltre la soglia, legge lo stack del thread del loop con
+sys._current_frames e individua il callback o l'handler che lo sta bloccando (es. set_tx_fee_id).
+Il profiler campiona lo stesso stack per una finestra fissa e produce stack collassati
+(formato "f1;f2;f3 conteggio") utilizzabili con flamegraph.pl o speedscope.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import traceback
+from collections import Counter
+from time import monotonic, sleep
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def frame_label(frame):
+    """Etichetta compatta di un frame: modulo:funzione."""
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f'{module}:{frame.f_code.co_name}'
+
+
+def frame_stack(frame):
+    """Frame dello stack dal più esterno al più interno."""
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def culprit(stack):
+    """Il primo frame del progetto eseguito dal loop: di norma l'handler o il job che lo blocca."""
+    # Lo stack parte da main() e run_polling: si cerca dopo l'ultimo callback lanciato dal loop
+    start = 0
+    for index, frame in enumerate(stack):
+        if frame_label(frame) == 'events:_run':
+            start = index
+    for frame in stack[start:]:
+        if frame.f_code.co_filename.startswith(PROJECT_DIR) and frame.f_code.co_filename != __file__:
+            return frame.f_code.co_name
+    return frame_label(stack[-1]) if stack else '?'
+
+
+class LoopWatchdog:
+    """Misura il ritardo dell'event loop e registra i blocchi oltre la soglia con nome e stack."""
+
+    def __init__(self, threshold=0.25, interval=0.5):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.stalls = 0
+        self.worst = None
+        self._beat = monotonic()
+        self._stall = None
+        self._loop_thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Avvia battito e thread di controllo; va chiamato dal thread dell'event loop."""
+        self._loop_thread = threading.get_ident()
+        self._beat = monotonic()
+        asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def _heartbeat(self):
+        while not self._stop.is_set():
+            await asyncio.sleep(self.interval)
+            now = monotonic()
+            lag = max(now - self._beat - self.interval, 0.0)
+            self._beat = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                # Lo stack viene catturato dal thread di controllo durante il blocco
+                name, stack = self._stall or ('?', '')
+                self._stall = None
+                if self.worst is None or lag > self.worst[0]:
+                    self.worst = (lag, name)
+                print(f'Event loop bloccato per {lag * 1000:.0f} ms in {name}\n{stack}', end='')
+
+    def _watch(self):
+        poll = min(self.threshold / 4, 0.05)
+        captured = None
+        while not self._stop.wait(poll):
+            beat = self._beat
+            if monotonic() - beat < self.interval + self.threshold or captured == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = frame_stack(frame)
+            self._stall = (culprit(stack), ''.join(traceback.format_stack(frame)))
+            captured = beat
+
+    def stats(self):
+        return {
+            'ultimo ritardo ms': round(self.last_lag * 1000, 1),
+            'ritardo massimo ms': round(self.max_lag * 1000, 1),
+            'blocchi': self.stalls,
+            'blocco peggiore': f'{self.worst[1]} ({self.worst[0] * 1000:.0f} ms)' if self.worst else '-',
+        }
+
+
+class SamplingProfiler:
+    """Campiona lo stack di un thread a intervalli regolari e conta gli stack collassati."""
+
+    def __init__(self, thread_id, rate=0.005):
+        self.thread_id = thread_id
+        self.rate = rate
+        self.samples = Counter()
+
+    def run(self, duration):
+        """Campiona per duration secondi (bloccante: da eseguire in un thread separato)."""
+        deadline = monotonic() + duration
+        while monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[';'.join(frame_label(f) for f in frame_stack(frame))] += 1
+            sleep(self.rate)
+        return self
+
+    def collapsed(self):
+        """Stack collassati, uno per riga, dal più frequente."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def top(self, limit=5):
+        """Percentuale di campioni per funzione del progetto più interna nello stack, o per attesa del loop."""
+        modules = {os.path.splitext(name)[0] for name in os.listdir(PROJECT_DIR) if name.endswith('.py')}
+        total = sum(self.samples.values()) or 1
+        owners = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(';')
+            if frames[-1].startswith('selectors:'):
+                owners['(loop inattivo)'] += count
+                continue
+            own = [label for label in frames if label.split(':', 1)[0] in modules]
+            owners[own[-1] if own else frames[-1]] += count
+        return [(name, count * 100 / total) for name, count in owners.most_common(limit)]
+
+
+async def profile_loop(duration, rate=0.005):
+    """Profila il thread dell'event loop corrente per duration secondi."""
+    profiler = SamplingProfiler(threading.get_ident(), rate)
+    return await asyncio.to_thread(profiler.run, duration)
+
+
+def watchdog_from_env():
+    """LoopWatchdog configurato da LOOP_WATCHDOG e LOOP_LAG_THRESHOLD_MS, o None se disattivato."""
+    if os.getenv('LOOP_WATCHDOG') != '1':
+        return None
+    return LoopWatchdog(threshold=int(os.getenv('LOOP_LAG_THRESHOLD_MS', '250')) / 1000)
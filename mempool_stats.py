@@ -0,0 +1,104 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Analisi della fee histogram della mempool: vsize sopra un fee rate, tempi di smaltimento e tendenze.
+
+La fee histogram di /mempool ([[fee rate, vsize], ...] in ordine decrescente) viene trasformata
+una volta per risposta in due array paralleli e in una somma cumulativa (itertools.accumulate),
+così ogni interrogazione è una bisezione. Per lo storico si salvano solo le vsize cumulative a
+fasce di fee rate fisse, in un buffer circolare come quello delle fee: le tendenze si calcolano
+dai campioni già registrati, senza altre chiamate alle API.
+"""
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from time import time
+
+from chain_backends import BLOCK_VSIZE
+from fee_history import RingSeries
+from tx_eta import BLOCK_INTERVAL
+
+# Fasce di fee rate (sat/vB) registrate nello storico: vsize con fee rate >= fascia
+FEE_BANDS = (1, 2, 3, 5, 8, 10, 15, 20, 30, 50, 100, 200)
+
+
+class MempoolHistogram:
+    """Fee histogram di una risposta /mempool con la vsize cumulativa per fee rate decrescente."""
+
+    def __init__(self, mempool):
+        histogram = sorted(mempool.get('fee_histogram') or [], key=lambda entry: -entry[0])
+        # Fee rate negati (crescenti) per la bisezione e vsize cumulativa dalla fee più alta
+        self._rates = array('d', (-fee_rate for fee_rate, _ in histogram))
+        self._cumulative = array('d', accumulate(vsize for _, vsize in histogram))
+        self.count = mempool.get('count')
+        self.total_fee = mempool.get('total_fee')
+        self.vsize = mempool.get('vsize') or (self._cumulative[-1] if self._cumulative else 0)
+
+    def __bool__(self):
+        return bool(self._rates)
+
+    def vsize_above(self, fee_rate):
+        """Vsize delle tx con fee rate maggiore o uguale a fee_rate."""
+        index = bisect_right(self._rates, -fee_rate)
+        return self._cumulative[index - 1] if index else 0.0
+
+    def bands(self, bands=FEE_BANDS):
+        """Vsize cumulativa per ciascuna fascia: {fascia: vsize con fee rate >= fascia}."""
+        return {band: self.vsize_above(band) for band in bands}
+
+    def min_rate_for_blocks(self, blocks):
+        """Fee rate minimo che rientra nei primi `blocks` blocchi (None se la mempool è più piccola)."""
+        index = bisect_right(self._cumulative, blocks * BLOCK_VSIZE)
+        return -self._rates[index] if index < len(self._rates) else None
+
+
+class MempoolHistory(RingSeries):
+    """Storico compatto della mempool: conteggio, vsize, fee totali e vsize cumulativa per fascia."""
+
+    FIELDS = ('count', 'vsize', 'total_fee') + tuple(f'above_{band}' for band in FEE_BANDS)
+
+    def sample(self, histogram, timestamp):
+        """Registra un campione a partire da un MempoolHistogram."""
+        values = {'count': histogram.count, 'vsize': histogram.vsize, 'total_fee': histogram.total_fee}
+        values.update((f'above_{band}', vsize) for band, vsize in histogram.bands().items())
+        self.append(timestamp, values)
+
+    def change(self, field, seconds, now=None):
+        """Variazione del campo nella finestra indicata e secondi coperti dai campioni (None con meno di due campioni)."""
+        first = self._first_index_since((now if now is not None else time()) - seconds)
+        if self.count - first < 2:
+            return None
+        start, end = self._physical(first), self._physical(self.count - 1)
+        elapsed = self.timestamps[end] - self.timestamps[start]
+        if elapsed <= 0:
+            return None
+        return self.columns[field][end] - self.columns[field][start], elapsed
+
+    def growth(self, field, seconds, now=None):
+        """Variazione media del campo per secondo nella finestra indicata (None con meno di due campioni)."""
+        change = self.change(field, seconds, now)
+        return change[0] / change[1] if change else None
+
+def clearing_seconds(vsize_above, growth=None):
+    """Tempo stimato per smaltire vsize_above al ritmo dei blocchi, tenendo conto della crescita in vB/s.
+
+    Restituisce None se la coda cresce più in fretta di quanto i blocchi riescano a smaltirla.
+    """
+    capacity = BLOCK_VSIZE / BLOCK_INTERVAL - max(growth or 0.0, 0.0)
+    if capacity <= 0:
+        return None
+    return vsize_above / capacity
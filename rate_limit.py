@@ -0,0 +1,135 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Limitazione delle richieste degli utenti con token bucket per utente e per comando.
+
+Ogni comando che interroga le API consuma un gettone dal bucket dell'utente (limite complessivo)
+e uno dal bucket dell'utente per quel comando; i gettoni si ricaricano a ritmo costante fino alla
+capacità. I bucket pieni non servono più e vengono scartati, così la memoria resta proporzionale
+agli utenti attivi di recente.
+"""
+
+import os
+from collections import Counter
+from time import monotonic
+
+
+class TokenBucket:
+    """Bucket con `capacity` gettoni ricaricati al ritmo di `rate` gettoni al secondo."""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity, now):
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def refill(self, capacity, rate, now):
+        """Aggiorna i gettoni disponibili all'istante now."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+
+class Limit:
+    """Limite di `capacity` richieste ogni `period` secondi (raffica fino a capacity)."""
+
+    __slots__ = ('capacity', 'rate')
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    @classmethod
+    def parse(cls, text):
+        """Legge un limite nel formato "richieste/secondi" (es. "6/60"); None se vuoto o "0"."""
+        text = (text or '').strip()
+        if not text or text == '0':
+            return None
+        capacity, _, period = text.partition('/')
+        capacity, period = int(capacity), float(period or 60)
+        if capacity <= 0 or period <= 0:
+            raise ValueError(f'Limite non valido: {text}')
+        return cls(capacity, period)
+
+
+class RateLimiter:
+    """Token bucket per utente e per (utente, comando); un comando passa solo se entrambi hanno un gettone."""
+
+    def __init__(self, user_limit=None, command_limit=None, command_limits=None, max_buckets=50000):
+        self.user_limit = user_limit
+        self.command_limit = command_limit
+        # Limiti specifici per comando, al posto di command_limit
+        self.command_limits = dict(command_limits or {})
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self.allowed = 0
+        self.throttled = Counter()
+
+    def _limits(self, user_id, command):
+        limits = []
+        if self.user_limit is not None:
+            limits.append((user_id, self.user_limit))
+        command_limit = self.command_limits.get(command, self.command_limit)
+        if command_limit is not None:
+            limits.append(((user_id, command), command_limit))
+        return limits
+
+    def allow(self, user_id, command, now=None):
+        """Consuma un gettone per la richiesta; restituisce 0 se ammessa, altrimenti i secondi di attesa."""
+        now = monotonic() if now is None else now
+        buckets = []
+        wait = 0.0
+        for key, limit in self._limits(user_id, command):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(limit.capacity, now)
+            else:
+                bucket.refill(limit.capacity, limit.rate, now)
+            if bucket.tokens < 1:
+                wait = max(wait, (1 - bucket.tokens) / limit.rate)
+            buckets.append(bucket)
+        if wait:
+            self.throttled[command] += 1
+            return wait
+        # I gettoni vengono consumati solo se tutti i bucket li hanno
+        for bucket in buckets:
+            bucket.tokens -= 1
+        self.allowed += 1
+        if len(self._buckets) > self.max_buckets:
+            self.prune(now)
+        return 0
+
+    def prune(self, now=None):
+        """Scarta i bucket tornati pieni: equivalgono a un bucket nuovo."""
+        now = monotonic() if now is None else now
+        for key in list(self._buckets):
+            limit = self.user_limit if isinstance(key, str) else self.command_limits.get(key[1], self.command_limit)
+            bucket = self._buckets[key]
+            if limit is None or bucket.tokens + (now - bucket.updated) * limit.rate >= limit.capacity:
+                del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def limiter_from_env():
+    """Limiti da RATE_LIMIT_USER, RATE_LIMIT_COMMAND e RATE_LIMIT_<COMANDO> ("richieste/secondi", "0" disattiva)."""
+    command_limits = {}
+    for name, value in os.environ.items():
+        if name.startswith('RATE_LIMIT_') and name not in ('RATE_LIMIT_USER', 'RATE_LIMIT_COMMAND'):
+            command_limits[name[len('RATE_LIMIT_'):].lower()] = Limit.parse(value)
+    return RateLimiter(Limit.parse(os.getenv('RATE_LIMIT_USER', '30/60')),
+                       Limit.parse(os.getenv('RATE_LIMIT_COMMAND', '6/60')),
+                       command_limits)
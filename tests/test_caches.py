@@ -0,0 +1,125 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Test della cache delle risposte: coalescenza e invalidazione dei caricamenti in corso.
+
+Uso: python -m unittest discover tests
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from caches import ResponseCache
+
+
+class SlowLoader:
+    """Loader bloccante che restituisce i valori in ordine, ognuno solo dopo `release()`."""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+        self.gates = [threading.Event() for _ in values]
+
+    def __call__(self):
+        index = self.calls
+        self.calls += 1
+        self.gates[index].wait(5)
+        return self.values[index]
+
+    def release(self, index):
+        self.gates[index].set()
+
+
+async def started(loader, calls):
+    while loader.calls < calls:
+        await asyncio.sleep(0.001)
+
+
+class ResponseCacheInvalidateTest(unittest.TestCase):
+
+    def test_coalesced_load(self):
+        async def scenario():
+            cache = ResponseCache()
+            loader = SlowLoader('tip')
+            first = asyncio.create_task(cache.get('tip', loader, 60))
+            second = asyncio.create_task(cache.get('tip', loader, 60))
+            await started(loader, 1)
+            loader.release(0)
+            self.assertEqual(await asyncio.gather(first, second), ['tip', 'tip'])
+            self.assertEqual((loader.calls, cache.coalesced), (1, 1))
+            self.assertEqual(cache.peek('tip'), 'tip')
+        asyncio.run(scenario())
+
+    def test_invalidate_discards_inflight_result(self):
+        async def scenario():
+            cache = ResponseCache()
+            loader = SlowLoader('old', 'new')
+            waiting = asyncio.create_task(cache.get('tip', loader, 60))
+            await started(loader, 1)
+            cache.invalidate('tip')
+            # Dopo l'invalidazione parte un nuovo caricamento invece di aspettare quello vecchio
+            fresh = asyncio.create_task(cache.get('tip', loader, 60))
+            await started(loader, 2)
+            loader.release(1)
+            self.assertEqual(await fresh, 'new')
+            loader.release(0)
+            self.assertEqual(await waiting, 'old')
+            self.assertEqual(cache.peek('tip'), 'new')
+            self.assertEqual(cache.discarded, 1)
+        asyncio.run(scenario())
+
+    def test_invalidate_tag_discards_inflight_result(self):
+        async def scenario():
+            cache = ResponseCache()
+            loader = SlowLoader('old')
+            waiting = asyncio.create_task(cache.get('tip', loader, 60, tags=('block',)))
+            await started(loader, 1)
+            cache.invalidate_tag('block')
+            loader.release(0)
+            self.assertEqual(await waiting, 'old')
+            self.assertIsNone(cache.peek('tip'))
+        asyncio.run(scenario())
+
+
+class ResponseCacheExpireTest(unittest.TestCase):
+
+    def test_expire_joins_inflight_load(self):
+        async def scenario():
+            cache = ResponseCache()
+            cache.set('prices', 'old', 60)
+            cache.expire('prices')
+            self.assertEqual(cache.peek('prices'), 'old')
+            loader = SlowLoader('new')
+            first = asyncio.create_task(cache.get('prices', loader, 60))
+            await started(loader, 1)
+            # Una nuova scadenza durante il caricamento non lo stacca: la get successiva lo condivide
+            cache.expire('prices')
+            second = asyncio.create_task(cache.get('prices', loader, 60))
+            await asyncio.sleep(0.01)
+            loader.release(0)
+            self.assertEqual(await asyncio.gather(first, second), ['new', 'new'])
+            self.assertEqual((loader.calls, cache.coalesced, cache.discarded), (1, 1, 0))
+            self.assertEqual(cache.peek('prices'), 'new')
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Test dei backend on-chain con sessioni HTTP e backend sostitutivi, senza rete.
+
+Uso: python -m unittest discover tests
+"""
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chain_backends import ChainBackend, CompositeBackend, ElectrumBackend, EsploraBackend, NotSupported, address_to_scripthash
+
+BLOCK_HASH = '00000000000000000001a2b3c4d5e6f708192a3b4c5d6e7f8091a2b3c4d5e6f7'
+
+
+class FakeResponse:
+    """Risposta HTTP minima: JSON per i dict e le liste, testo semplice per le stringhe."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeSession:
+    """Sessione che risponde da un dizionario path -> corpo (404 per i path assenti)."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requested = []
+
+    def get(self, url, timeout=None):
+        path = url.split('/api', 1)[1]
+        self.requested.append(path)
+        if path not in self.routes:
+            return FakeResponse(404, 'Not Found')
+        return FakeResponse(200, self.routes[path])
+
+
+class FakeElectrumStream:
+    """Flusso del socket Electrum: risponde a ogni batch con le righe preparate da `reply`."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.lines = []
+        self.requests = []
+
+    def write(self, data):
+        batch = json.loads(data)
+        self.requests.append(batch)
+        self.lines.extend(json.dumps(message).encode() + b'\n' for message in self.reply(batch))
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        return self.lines.pop(0) if self.lines else b''
+
+
+class StandInBackend(ChainBackend):
+    """Backend senza informazioni sul pool, come Electrum e bitcoind."""
+
+    name = 'stand-in'
+
+    def block(self, height):
+        return {'id': BLOCK_HASH, 'height': height, 'timestamp': 1700000000}
+
+
+class EsploraBlockTest(unittest.TestCase):
+
+    def test_block_height_text_response(self):
+        # /block-height risponde con l'hash in testo semplice, che non è JSON valido
+        session = FakeSession({
+            '/block-height/800000': BLOCK_HASH + '\n',
+            f'/v1/block/{BLOCK_HASH}': {'id': BLOCK_HASH, 'height': 800000, 'extras': {'pool': {'name': 'Foundry USA'}}},
+        })
+        block = EsploraBackend('https://mempool.test/api', session=session).block(800000)
+        self.assertEqual(block['id'], BLOCK_HASH)
+        self.assertEqual(block['extras']['pool']['name'], 'Foundry USA')
+        self.assertEqual(session.requested, ['/block-height/800000', f'/v1/block/{BLOCK_HASH}'])
+
+    def test_block_txs_pages(self):
+        txs = [{'txid': f'{index:064x}'} for index in range(30)]
+        session = FakeSession({
+            '/block-height/800000': BLOCK_HASH,
+            f'/block/{BLOCK_HASH}': {'id': BLOCK_HASH, 'tx_count': 30},
+            f'/block/{BLOCK_HASH}/txs/0': txs[:25],
+            f'/block/{BLOCK_HASH}/txs/25': txs[25:],
+        })
+        self.assertEqual(EsploraBackend('https://mempool.test/api', session=session).block_txs(800000), txs)
+
+    def test_block_extras_not_supported_on_plain_esplora(self):
+        esplora = EsploraBackend('https://esplora.test/api', session=FakeSession({}))
+        with self.assertRaises(NotSupported):
+            esplora.block_extras(BLOCK_HASH)
+
+
+class ElectrumStatusTest(unittest.TestCase):
+
+    def test_status_from_scripthash_subscribe(self):
+        addresses = ['bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4', '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2']
+        statuses = {address_to_scripthash(addresses[0]): 'ab' * 32, address_to_scripthash(addresses[1]): None}
+
+        def reply(batch):
+            # Una notifica di una sottoscrizione precedente arriva prima delle risposte
+            yield {'jsonrpc': '2.0', 'method': 'blockchain.scripthash.subscribe', 'params': ['00' * 32, 'cd' * 32]}
+            yield [{'jsonrpc': '2.0', 'id': call['id'], 'result': statuses[call['params'][0]]} for call in batch]
+
+        backend = ElectrumBackend('electrum.test', 50002)
+        backend._file = stream = FakeElectrumStream(reply)
+        self.assertEqual(backend.address_status_many(addresses), {addresses[0]: 'ab' * 32, addresses[1]: ''})
+        self.assertEqual({call['method'] for call in stream.requests[0]}, {'blockchain.scripthash.subscribe'})
+
+
+class CompositeBlockTest(unittest.TestCase):
+
+    def test_pool_info_from_mempool_fallback(self):
+        session = FakeSession({f'/v1/block/{BLOCK_HASH}': {'id': BLOCK_HASH, 'extras': {'pool': {'name': 'Unknown'}}}})
+        backend = CompositeBackend([StandInBackend(), EsploraBackend('https://mempool.test/api', session=session)])
+        block = backend.block(800000)
+        self.assertEqual(block['timestamp'], 1700000000)
+        self.assertEqual(block['extras'], {'pool': {'name': 'Unknown'}})
+
+    def test_block_without_pool_info(self):
+        # Con un'istanza Esplora senza /v1 il blocco resta senza 'extras'
+        backend = CompositeBackend([StandInBackend(), EsploraBackend('https://esplora.test/api', session=FakeSession({}))])
+        self.assertNotIn('extras', backend.block(800000))
+
+
+if __name__ == '__main__':
+    unittest.main()
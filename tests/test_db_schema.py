@@ -0,0 +1,74 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Test delle migrazioni dello schema.
+
+Uso: python -m unittest discover tests
+"""
+
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_schema import CHANNEL_STATE_TABLE, LEGACY_TABLES, SCHEMA_VERSION, TABLES, get_channel_state, migrate, set_channel_state
+
+TXID = 'ab' * 32
+
+
+class LegacyMigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        for statement in LEGACY_TABLES:
+            self.conn.execute(statement)
+
+    def tx_subscriptions(self):
+        return self.conn.execute(
+            'SELECT u.chat_id, s.targets, s.reached, s.created FROM subscriptions s '
+            'JOIN users u ON u.id = s.user_id ORDER BY u.chat_id').fetchall()
+
+    def test_duplicate_tx_rows_are_merged(self):
+        self.conn.executemany(
+            'INSERT INTO tx_subscriptions (user_id, txid, confirmations, timestamp, thresholds, reached) VALUES (?, ?, ?, ?, ?, ?)', [
+                ('42', TXID, 3, 1700000200, None, '1'),
+                ('42', TXID, 6, 1700000100, None, ''),
+                ('42', TXID, 1, 1700000300, '0,1,6', '0,1'),
+                ('7', TXID, 2, None, '', ''),
+            ])
+        self.conn.commit()
+        self.assertEqual(migrate(self.conn), SCHEMA_VERSION)
+        self.assertEqual(self.tx_subscriptions(), [('42', '0,1,3,6', '0,1', 1700000100), ('7', '2', '', 0)])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM watched_objects WHERE kind = 'tx'").fetchone()[0], 1)
+
+
+class ChannelStateMigrationTest(unittest.TestCase):
+
+    def test_channel_state_added_to_version_2(self):
+        conn = sqlite3.connect(':memory:')
+        conn.executescript(';\n'.join(table for table in TABLES if table is not CHANNEL_STATE_TABLE) + ';\nPRAGMA user_version = 2;')
+        self.assertEqual(migrate(conn), SCHEMA_VERSION)
+        c = conn.cursor()
+        self.assertIsNone(get_channel_state(c, 'solo_miner'))
+        set_channel_state(c, 'solo_miner', 800000)
+        set_channel_state(c, 'solo_miner', 800001)
+        self.assertEqual(get_channel_state(c, 'solo_miner'), 800001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Test del salvataggio e del caricamento dei buffer circolari dello storico.
+
+Uso: python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fee_history import FeeHistory, RingSeries
+
+
+class RingSeriesLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'fee_history.bin')
+        history = FeeHistory(100)
+        for i in range(150):
+            history.append(1700000000 + i, {'fastest': i})
+        history.save(self.path)
+        with open(self.path, 'rb') as f:
+            self.data = f.read()
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def test_round_trip(self):
+        history = FeeHistory.load(self.path, 100)
+        self.assertEqual(len(history), 100)
+        self.assertEqual(history.latest('fastest'), 149)
+
+    def test_truncated_file(self):
+        for size in (10, RingSeries.HEADER.size + 300, len(self.data) // 2, len(self.data) - 1):
+            self.write(self.data[:size])
+            self.assertEqual(len(FeeHistory.load(self.path, 100)), 0)
+
+    def test_count_larger_than_capacity(self):
+        header = list(RingSeries.HEADER.unpack(self.data[:RingSeries.HEADER.size]))
+        header[-1] = 500
+        self.write(RingSeries.HEADER.pack(*header) + self.data[RingSeries.HEADER.size:])
+        self.assertEqual(len(FeeHistory.load(self.path, 100)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Telegram finto per provare la modalità webhook in locale.
+
+Avvia una Bot API finta, attende che il bot registri il webhook (setWebhook), gli invia una
+serie di comandi come farebbe Telegram e misura la conferma HTTP e il tempo fino alla risposta
+(sendMessage). Con --serve resta solo in ascolto, per usi manuali o per la modalità polling.
+
+Uso:
+    python tools/fake_telegram.py [--api-port 8081] [--updates 200] [--concurrency 20] [--text /start]
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8080/telegram python bitrackbot.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+from collections import Counter
+from time import monotonic, time
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook import read_request, write_response
+
+BOT_USER = {
+    'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+    'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False,
+}
+
+
+class FakeBotApi:
+    """Bot API minima: registra il webhook e i messaggi inviati dal bot."""
+
+    def __init__(self):
+        self.webhook = asyncio.Future()
+        self.replies = {}
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader, 10 * 1024 * 1024)
+                if request is None:
+                    break
+                _, path, headers, body = request
+                method = path.rsplit('/', 1)[-1]
+                if headers.get('content-type', '').startswith('application/json'):
+                    params = json.loads(body or b'{}')
+                else:
+                    params = dict(parse_qsl(body.decode()))
+                result = await self.call(method, params)
+                write_response(writer, 200, json.dumps({'ok': True, 'result': result}).encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def call(self, method, params):
+        self.calls[method] += 1
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'setWebhook':
+            if not self.webhook.done():
+                self.webhook.set_result((params['url'], params.get('secret_token')))
+            return True
+        if method == 'getUpdates':
+            await asyncio.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+            return []
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            self.replies.setdefault(chat_id, monotonic())
+            return {
+                'message_id': next(self._message_ids), 'date': int(time()),
+                'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER, 'text': params.get('text', ''),
+            }
+        return True
+
+
+async def post_update(url, secret_token, payload):
+    """Invia un update come farebbe Telegram; restituisce lo status HTTP."""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                                   ssl=parts.scheme == 'https' or None)
+    body = json.dumps(payload).encode()
+    headers = [f'POST {parts.path or "/"} HTTP/1.1', f'Host: {parts.netloc}', 'Content-Type: application/json',
+               f'Content-Length: {len(body)}', 'Connection: close']
+    if secret_token:
+        headers.append(f'X-Telegram-Bot-Api-Secret-Token: {secret_token}')
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+def command_update(update_id, user_id, text):
+    command = text.split()[0]
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'Utente {user_id}'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+        },
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float('nan')
+
+
+async def run(args):
+    api = FakeBotApi()
+    server = await asyncio.start_server(api.serve, '127.0.0.1', args.api_port)
+    print(f'Bot API finta su http://127.0.0.1:{args.api_port} (TELEGRAM_API_URL)')
+    if args.serve:
+        async with server:
+            await server.serve_forever()
+    print('In attesa di setWebhook dal bot...')
+    url, secret_token = await api.webhook
+    print(f'Webhook registrato: {url}')
+
+    sent_at = {}
+    statuses = Counter()
+    ack_latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(index):
+        user_id = 100000 + index
+        async with semaphore:
+            sent_at[user_id] = monotonic()
+            status = await post_update(url, secret_token, command_update(index + 1, user_id, args.text))
+            ack_latencies.append((monotonic() - sent_at[user_id]) * 1000)
+            statuses[status] += 1
+
+    started = monotonic()
+    await asyncio.gather(*(send(index) for index in range(args.updates)))
+    accepted = statuses[200]
+    deadline = monotonic() + args.timeout
+    while len(api.replies) < accepted and monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = monotonic() - started
+    server.close()
+
+    latencies = [(api.replies[user_id] - sent) * 1000 for user_id, sent in sent_at.items() if user_id in api.replies]
+    print(f'{args.updates} update in {elapsed:.2f}s, status HTTP: {dict(statuses)}')
+    print(f'Conferma HTTP: mediana {statistics.median(ack_latencies):.1f} ms, p95 {percentile(ack_latencies, 95):.1f} ms')
+    if latencies:
+        print(f'Risposta del bot: {len(latencies)}/{accepted}, mediana {statistics.median(latencies):.1f} ms, '
+              f'p95 {percentile(latencies, 95):.1f} ms, max {max(latencies):.1f} ms')
+    else:
+        print('Nessuna risposta dal bot')
+    print(f'Chiamate alla Bot API: {dict(api.calls)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--text', default='/start', help='comando inviato da ogni utente finto')
+    parser.add_argument('--timeout', type=float, default=30, help='secondi di attesa per le risposte')
+    parser.add_argument('--serve', action='store_true', help='solo Bot API finta, senza inviare update')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Riproduce un archivio di traffico registrato contro un database di partenza e misura i monitor.
+
+Il bot viene caricato con UPSTREAM_REPLAY sull'archivio e un orologio virtuale che parte dall'inizio
+della registrazione: i job di monitoraggio vengono eseguiti ai loro intervalli sul tempo virtuale
+(subito con --speed 0, oppure al ritmo reale moltiplicato per --speed) e i messaggi vengono
+raccolti da un bot finto. Il rapporto contiene chiamate alle API per endpoint, tempo CPU per job
+e notifiche inviate; con --compare viene confrontato con quello di un'altra versione del bot.
+
+Uso:
+    UPSTREAM_RECORD=traffico.jsonl.gz python bitrackbot.py
+    DB_KEY=... python tools/replay.py traffico.jsonl.gz --db subscriptions.db --report base.json
+    DB_KEY=... python tools/replay.py traffico.jsonl.gz --db subscriptions.db --compare base.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from time import monotonic, process_time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class VirtualClock:
+    """Tempo della riproduzione: secondi dall'inizio della registrazione."""
+
+    def __init__(self, started):
+        self.started = started
+        self.offset = 0.0
+
+    def now(self):
+        return self.started + self.offset
+
+
+class ReplayBot:
+    """Bot finto: raccoglie i messaggi con l'istante virtuale di invio."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((round(self.clock.offset), str(chat_id), text))
+
+
+def load_bot(args, workdir):
+    """Importa il bot in una directory di lavoro con una copia del database e l'archivio in riproduzione."""
+    if not os.getenv('DB_KEY'):
+        sys.exit('DB_KEY è necessaria per aprire il database di partenza.')
+    shutil.copy(args.db, os.path.join(workdir, 'subscriptions.db'))
+    os.environ['UPSTREAM_REPLAY'] = os.path.abspath(args.archive)
+    os.environ['UPSTREAM_REPLAY_SPEED'] = str(args.speed)
+    os.environ['CACHE_DB_PATH'] = os.path.join(workdir, 'cache.db')
+    os.environ.setdefault('TELEGRAM_TOKEN', 'replay')
+    os.environ.setdefault('LIGHTNING_ADDRESS', 'replay')
+    os.chdir(workdir)
+    import bitrackbot
+    return bitrackbot
+
+
+def install_clock(bot, clock):
+    """Sostituisce l'orologio del bot e delle cache con quello virtuale."""
+    import caches
+    import fee_history
+    import mempool_stats
+    for module in (bot, fee_history, mempool_stats):
+        module.time = clock.now
+    caches.monotonic = clock.now
+    bot.UPSTREAM_SESSION.get_adapter('https://').clock = lambda: clock.offset
+    # La wheel delle notifiche prezzo è stata creata all'import con l'orologio reale
+    bot.PRICE_ALERT_WHEEL = bot.TimingWheel(clock.now())
+
+
+async def replay(args):
+    workdir = tempfile.mkdtemp(prefix='bitrackbot-replay-')
+    bot = load_bot(args, workdir)
+    adapter = bot.UPSTREAM_SESSION.get_adapter('https://')
+    clock = VirtualClock(adapter.archive.started)
+    install_clock(bot, clock)
+    context = SimpleNamespace(bot=ReplayBot(clock), bot_data={'btc_prices': {'eur': None, 'usd': None}, 'last_price_update': 0},
+                              user_data={}, args=[], job_queue=None)
+    bot.prepare_background_state()
+
+    jobs = bot.MONITOR_JOBS + [(bot.update_price_cache, 300), (bot.dispatch_price_alerts, 60)]
+    duration = args.duration or adapter.archive.duration
+    cpu = Counter()
+    next_runs = [0] * len(jobs)
+    wall_started = monotonic()
+    tick = 0
+    while tick <= duration:
+        clock.offset = tick
+        for index, (job, interval) in enumerate(jobs):
+            if tick >= next_runs[index]:
+                next_runs[index] += interval
+                started = process_time()
+                await job(context)
+                cpu[job.__name__] += process_time() - started
+        tick += args.step
+        if args.speed:
+            await asyncio.sleep(max(0.0, tick / args.speed - (monotonic() - wall_started)))
+
+    notifications = context.bot.sent
+    return {
+        'archive': os.path.basename(args.archive),
+        'duration': duration,
+        'requests_recorded': len(adapter.archive),
+        'api_calls': sum(adapter.calls.values()),
+        'api_calls_by_endpoint': dict(adapter.calls.most_common()),
+        'api_misses': adapter.misses,
+        'cpu_seconds': round(sum(cpu.values()), 3),
+        'cpu_by_job': {name: round(seconds, 3) for name, seconds in cpu.most_common()},
+        'wall_seconds': round(monotonic() - wall_started, 3),
+        'notifications': len(notifications),
+        'notifications_sha256': hashlib.sha256(json.dumps(notifications).encode()).hexdigest(),
+        'notification_log': notifications,
+    }
+
+
+def print_report(report):
+    print(f"Archivio {report['archive']}: {report['duration']:.0f} s registrati, {report['requests_recorded']} richieste")
+    print(f"Chiamate API: {report['api_calls']} (non registrate: {report['api_misses']})")
+    for name, count in report['api_calls_by_endpoint'].items():
+        print(f'  {count:7d}  {name}')
+    print(f"Tempo CPU: {report['cpu_seconds']:.3f} s (tempo reale {report['wall_seconds']:.1f} s)")
+    for name, seconds in report['cpu_by_job'].items():
+        print(f'  {seconds:8.3f} s  {name}')
+    print(f"Notifiche: {report['notifications']}")
+
+
+def compare(baseline, report):
+    """Stampa le differenze rispetto al rapporto di riferimento; restituisce False se le notifiche differiscono."""
+    print("\nConfronto con il riferimento:")
+    for key in ('api_calls', 'api_misses', 'cpu_seconds', 'notifications'):
+        before, after = baseline[key], report[key]
+        change = f' ({(after - before) / before:+.1%})' if before else ''
+        print(f'  {key:14s} {before:>10} -> {after:<10}{change}')
+    for name in sorted(set(baseline['api_calls_by_endpoint']) | set(report['api_calls_by_endpoint'])):
+        before, after = baseline['api_calls_by_endpoint'].get(name, 0), report['api_calls_by_endpoint'].get(name, 0)
+        if before != after:
+            print(f'  {before:7d} -> {after:<7d} {name}')
+    if baseline['notifications_sha256'] == report['notifications_sha256']:
+        print('  Notifiche identiche.')
+        return True
+    before = Counter(map(tuple, baseline['notification_log']))
+    after = Counter(map(tuple, report['notification_log']))
+    for label, entries in (('mancanti', before - after), ('nuove', after - before)):
+        for offset, chat_id, text in list(entries.elements())[:10]:
+            print(f'  {label} t={offset}s {chat_id}: {text[:80]!r}')
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('archive', help='archivio registrato con UPSTREAM_RECORD')
+    parser.add_argument('--db', required=True, help='database delle sottoscrizioni di partenza (ne viene usata una copia)')
+    parser.add_argument('--speed', type=float, default=0, help='moltiplicatore del tempo reale (0 = il più veloce possibile)')
+    parser.add_argument('--step', type=int, default=30, help='passo del tempo virtuale in secondi')
+    parser.add_argument('--duration', type=float, help='secondi da riprodurre (predefinito: tutta la registrazione)')
+    parser.add_argument('--report', help='salva il rapporto in JSON')
+    parser.add_argument('--compare', help='rapporto JSON di riferimento da confrontare')
+    args = parser.parse_args()
+    args.db = os.path.abspath(args.db)
+    for name in ('report', 'compare'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            if not compare(json.load(f), report):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Stima del blocco di conferma delle tx non confermate dai blocchi proiettati della mempool.
+
+Dai blocchi di /v1/fees/mempool-blocks si costruisce una volta per ciclo un indice cumulativo
+fee rate -> vsize che precede in mempool: ogni feeRange fornisce alcuni punti (minimo, percentili,
+massimo) e la vsize tra due punti viene interpolata. La posizione di una tx si ottiene per
+bisezione sul suo fee rate, senza altre chiamate alle API.
+"""
+
+from bisect import bisect_left
+
+from chain_backends import BLOCK_VSIZE
+
+# Intervallo medio tra due blocchi, in secondi
+BLOCK_INTERVAL = 600
+# Percentili dei valori di feeRange di Mempool.space (min, 10, 25, 50, 75, 90, max); per le
+# altre lunghezze (es. [min, max] dei blocchi proiettati localmente) i punti sono equidistanti
+FEE_RANGE_PERCENTILES = {7: (0, 10, 25, 50, 75, 90, 100)}
+
+
+class MempoolEtaIndex:
+    """Indice cumulativo dei blocchi proiettati: fee rate decrescenti e vsize che li precede."""
+
+    def __init__(self, blocks, block_vsize=BLOCK_VSIZE):
+        self.block_vsize = block_vsize
+        # Fee rate negati (crescenti) per la bisezione e vsize cumulativa corrispondente
+        self._rates = []
+        self._ahead = []
+        cumulative = 0
+        for block in blocks:
+            fee_range = block.get('feeRange') or [block.get('medianFee', 0)]
+            vsize = block['blockVSize']
+            points = len(fee_range)
+            percentiles = FEE_RANGE_PERCENTILES.get(points) or [100 * i / max(points - 1, 1) for i in range(points)]
+            for fee_rate, percentile in reversed(list(zip(fee_range, percentiles))):
+                # I pacchetti CPFP possono rendere i feeRange non monotoni tra blocchi adiacenti
+                rate = -fee_rate if not self._rates else max(-fee_rate, self._rates[-1])
+                self._rates.append(rate)
+                self._ahead.append(cumulative + (100 - percentile) / 100 * vsize)
+            cumulative += vsize
+        self.total_vsize = cumulative
+
+    def vsize_ahead(self, fee_rate):
+        """Vsize stimata delle tx con fee rate maggiore, o None se fee_rate è sotto tutti i blocchi proiettati."""
+        index = bisect_left(self._rates, -fee_rate)
+        if index == 0:
+            return 0.0
+        if index == len(self._rates):
+            return None
+        high, low = -self._rates[index - 1], -self._rates[index]
+        if high == low:
+            return self._ahead[index - 1]
+        fraction = (high - fee_rate) / (high - low)
+        return self._ahead[index - 1] + fraction * (self._ahead[index] - self._ahead[index - 1])
+
+    def block_position(self, fee_rate):
+        """Indice del blocco proiettato che dovrebbe includere la tx (0 = prossimo blocco), o None."""
+        ahead = self.vsize_ahead(fee_rate)
+        if ahead is None:
+            return None
+        # L'ultimo blocco di Mempool.space raccoglie tutta la coda: la posizione è in blocchi pieni
+        return int(ahead // self.block_vsize)
+
+
+def eta_seconds(position):
+    """Tempo medio stimato fino al blocco proiettato indicato."""
+    return (position + 1) * BLOCK_INTERVAL
+
+
+def eta_changed(previous, current, min_blocks):
+    """True se la stima si è spostata di almeno min_blocks blocchi (None = oltre la proiezione)."""
+    if previous == current:
+        return False
+    if previous is None or current is None:
+        return True
+    return abs(current - previous) >= min_blocks
@@ -0,0 +1,107 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Modello compatto delle transazioni usato dai monitor al posto del JSON Esplora completo."""
+
+
+class TxRecord:
+    """Transazione ridotta ai dati usati dal bot, costruita una sola volta dal JSON Esplora.
+
+    inputs e outputs associano a ogni indirizzo il totale in satoshi speso o ricevuto, così
+    verificare se una tx tocca un indirizzo è una ricerca in un dizionario.
+    """
+
+    __slots__ = ('txid', 'confirmed', 'block_height', 'block_time', 'inputs', 'outputs', 'fee', 'vsize')
+
+    def __init__(self, txid, confirmed, block_height, block_time, inputs, outputs, fee, vsize):
+        self.txid = txid
+        self.confirmed = confirmed
+        self.block_height = block_height
+        self.block_time = block_time
+        self.inputs = inputs
+        self.outputs = outputs
+        self.fee = fee
+        self.vsize = vsize
+
+    @classmethod
+    def from_esplora(cls, tx):
+        """Costruisce il record da una transazione nel formato Esplora."""
+        inputs = {}
+        prevouts_complete = True
+        for inp in tx.get('vin', []):
+            prevout = inp.get('prevout')
+            if not prevout:
+                prevouts_complete = False
+                continue
+            address = prevout.get('scriptpubkey_address')
+            if address:
+                inputs[address] = inputs.get(address, 0) + prevout['value']
+        outputs = {}
+        output_sum = 0
+        for out in tx.get('vout', []):
+            output_sum += out['value']
+            address = out.get('scriptpubkey_address')
+            if address:
+                outputs[address] = outputs.get(address, 0) + out['value']
+        fee = tx.get('fee')
+        if fee is None and prevouts_complete and tx.get('vin'):
+            fee = sum(inp['prevout']['value'] for inp in tx['vin']) - output_sum
+        status = tx.get('status', {})
+        weight = tx.get('weight')
+        return cls(
+            tx['txid'],
+            status.get('confirmed', False),
+            status.get('block_height'),
+            status.get('block_time'),
+            inputs,
+            outputs,
+            fee,
+            (weight + 3) // 4 if weight else None,
+        )
+
+    def sends_from(self, address):
+        return address in self.inputs
+
+    def receives_on(self, address):
+        return address in self.outputs
+
+    def net_value(self, address):
+        """Variazione netta in satoshi del saldo dell'indirizzo (negativa per un invio)."""
+        return self.outputs.get(address, 0) - self.inputs.get(address, 0)
+
+    def direction(self, address):
+        """Verso della tx per l'indirizzo dal segno della variazione netta: 'send', 'receive' o None.
+
+        Un invio con resto verso lo stesso indirizzo resta un invio; a saldo invariato decidono gli input.
+        """
+        net = self.net_value(address)
+        if net < 0 or (net == 0 and self.sends_from(address)):
+            return 'send'
+        if net > 0 or self.receives_on(address):
+            return 'receive'
+        return None
+
+    def to_json(self):
+        """Forma serializzabile compatta (lista) per la cache su disco."""
+        return [self.txid, self.confirmed, self.block_height, self.block_time, self.inputs, self.outputs, self.fee, self.vsize]
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(*data)
+
+    def estimated_size(self):
+        """Stima approssimativa in byte della memoria occupata dal record."""
+        return 250 + 120 * (len(self.inputs) + len(self.outputs))
@@ -0,0 +1,203 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Pacchetti di transazioni non confermate: antenati, discendenti (CPFP) e conflitti (RBF).
+
+Le tx dei pacchetti sono tenute in una cache condivisa da tutte le tx monitorate: gli antenati
+vengono scaricati un livello alla volta con una sola richiesta batch per livello, e un genitore
+comune a più tx monitorate viene scaricato una volta sola. Le tx confermate restano in cache
+(fermano la risalita), quelle non confermate vengono riscaricate dopo ogni nuovo blocco.
+"""
+
+import threading
+
+from chain_backends import BackendError
+
+# Limite di antenati non confermati della policy di Bitcoin Core
+MAX_ANCESTOR_DEPTH = 25
+
+
+class PackageTx:
+    """Dati di una tx necessari al calcolo del pacchetto."""
+
+    __slots__ = ('txid', 'confirmed', 'fee', 'vsize', 'inputs')
+
+    def __init__(self, txid, confirmed, fee, vsize, inputs):
+        self.txid = txid
+        self.confirmed = confirmed
+        self.fee = fee
+        self.vsize = vsize
+        # Output spesi: [(txid, vout)]
+        self.inputs = inputs
+
+    @classmethod
+    def from_esplora(cls, tx):
+        weight = tx.get('weight')
+        return cls(
+            tx['txid'],
+            tx.get('status', {}).get('confirmed', False),
+            tx.get('fee'),
+            (weight + 3) // 4 if weight else None,
+            [(inp['txid'], inp['vout']) for inp in tx.get('vin', []) if 'coinbase' not in inp and not inp.get('is_coinbase')],
+        )
+
+    @property
+    def parents(self):
+        return {txid for txid, _ in self.inputs}
+
+
+class PackageInfo:
+    """Fee rate proprio ed effettivo (con antenati e figli CPFP) di una tx non confermata."""
+
+    __slots__ = ('fee_rate', 'effective_rate', 'ancestors', 'descendants')
+
+    def __init__(self, fee_rate, effective_rate, ancestors, descendants):
+        self.fee_rate = fee_rate
+        self.effective_rate = effective_rate
+        self.ancestors = ancestors
+        self.descendants = descendants
+
+
+class PackageTracker:
+    """Cache condivisa delle tx dei pacchetti e calcolo del fee rate effettivo."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.txs = {}
+        self.children = {}
+        # Tx non confermate da riscaricare (restano utilizzabili per cercare i conflitti)
+        self.stale = set()
+        self.tip_height = None
+        # Il tracker è usato dal monitoraggio e dalle ricerche di /tx_fee in thread diversi
+        self._lock = threading.RLock()
+
+    def _fetch(self, txids):
+        """Scarica in un'unica richiesta batch le tx non ancora in cache o da aggiornare."""
+        missing = [txid for txid in txids if txid not in self.txs or txid in self.stale]
+        if not missing:
+            return
+        for txid, tx in self.backend.txs_many(missing).items():
+            if not isinstance(tx, BackendError):
+                self.txs[txid] = PackageTx.from_esplora(tx)
+                self.stale.discard(txid)
+
+    def _new_block(self, tip_height):
+        # Un nuovo blocco può confermare gli antenati o i figli: le tx non confermate vanno riscaricate
+        if tip_height != self.tip_height:
+            self.tip_height = tip_height
+            self.stale = {txid for txid, tx in self.txs.items() if not tx.confirmed}
+            self.children = {}
+
+    def refresh(self, txids, tip_height):
+        """Aggiorna antenati e discendenti delle tx indicate; restituisce {txid: PackageInfo}."""
+        with self._lock:
+            self._new_block(tip_height)
+            self._fetch(txids)
+            pending = [txid for txid in txids if txid in self.txs and not self.txs[txid].confirmed]
+            seen = set(pending)
+            frontier = {parent for txid in pending for parent in self.txs[txid].parents}
+            for _ in range(MAX_ANCESTOR_DEPTH):
+                frontier -= seen
+                if not frontier:
+                    break
+                seen |= frontier
+                self._fetch(frontier)
+                frontier = {parent for txid in frontier if txid in self.txs and not self.txs[txid].confirmed
+                            for parent in self.txs[txid].parents}
+            # Discendenti: gli output spesi da tx non confermate (figli che possono pagare per la tx)
+            try:
+                outspends = self.backend.outspends_many([txid for txid in pending if txid not in self.children])
+            except BackendError:
+                outspends = {}
+            for txid, spends in outspends.items():
+                if not isinstance(spends, BackendError):
+                    self.children[txid] = sorted({spend['txid'] for spend in spends
+                                                  if spend.get('spent') and not spend.get('status', {}).get('confirmed')})
+            self._fetch({child for txid in pending for child in self.children.get(txid, [])})
+            packages = {}
+            for txid in pending:
+                info = self.package(txid)
+                if info is not None:
+                    packages[txid] = info
+            return packages
+
+    def ancestors(self, txid):
+        """Antenati non confermati in cache della tx."""
+        with self._lock:
+            found = set()
+            stack = list(self.txs[txid].parents)
+            while stack:
+                parent = stack.pop()
+                tx = self.txs.get(parent)
+                if parent in found or tx is None or tx.confirmed:
+                    continue
+                found.add(parent)
+                stack.extend(tx.parents)
+            return found
+
+    def package(self, txid):
+        """Calcola il fee rate effettivo: limitato dagli antenati, aumentato dal miglior figlio CPFP."""
+        with self._lock:
+            tx = self.txs[txid]
+            if tx.fee is None or not tx.vsize:
+                return None
+            ancestors = [self.txs[parent] for parent in self.ancestors(txid)]
+            if any(parent.fee is None or not parent.vsize for parent in ancestors):
+                ancestors = []
+            package_fee = tx.fee + sum(parent.fee for parent in ancestors)
+            package_vsize = tx.vsize + sum(parent.vsize for parent in ancestors)
+            fee_rate = tx.fee / tx.vsize
+            # Un miner include la tx solo insieme agli antenati: conta il minore tra i due fee rate
+            effective = min(fee_rate, package_fee / package_vsize)
+            children = [self.txs[child] for child in self.children.get(txid, []) if child in self.txs]
+            for child in children:
+                if child.fee is not None and child.vsize:
+                    effective = max(effective, (package_fee + child.fee) / (package_vsize + child.vsize))
+            return PackageInfo(fee_rate, effective, len(ancestors), len(children))
+
+    def conflict(self, txid):
+        """Tx che spende uno degli stessi output della tx (sostituzione o doppia spesa), o None."""
+        with self._lock:
+            tx = self.txs.get(txid)
+        if tx is None:
+            return None
+        outspends = self.backend.outspends_many(sorted(tx.parents))
+        for parent, vout in tx.inputs:
+            spends = outspends.get(parent)
+            if isinstance(spends, BackendError) or spends is None or vout >= len(spends):
+                continue
+            spend = spends[vout]
+            if spend.get('spent') and spend.get('txid') != txid:
+                return spend['txid']
+        return None
+
+    def retain(self, tracked):
+        """Mantiene in cache solo le tx monitorate e quelle dei loro pacchetti."""
+        with self._lock:
+            keep = {txid for txid in tracked if txid in self.txs}
+            for txid in list(keep):
+                ancestors = self.ancestors(txid)
+                keep |= ancestors
+                # I genitori confermati restano come punto di arresto della risalita
+                keep.update(parent for member in ancestors | {txid} for parent in self.txs[member].parents)
+                keep.update(self.children.get(txid, []))
+            for txid in list(self.txs):
+                if txid not in keep:
+                    del self.txs[txid]
+                    self.stale.discard(txid)
+            for txid in list(self.children):
+                if txid not in tracked:
+                    del self.children[txid]
@@ -0,0 +1,228 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Registrazione e riproduzione del traffico HTTP verso le API esterne.
+
+Con UPSTREAM_RECORD=<file> la sessione HTTP condivisa (backend Esplora/bitcoind e prezzi) passa
+da un adapter che salva ogni richiesta con risposta, latenza e istante in un archivio JSON lines
+compresso con gzip. Con UPSTREAM_REPLAY=<file> un adapter locale risponde al posto delle API: per
+ogni richiesta restituisce l'ultima risposta registrata fino all'istante corrente della
+riproduzione, che avanza al ritmo reale moltiplicato per UPSTREAM_REPLAY_SPEED (o è impostato da
+tools/replay.py). I server Electrum usano un socket proprio e non vengono registrati.
+"""
+
+import base64
+import gzip
+import json
+import os
+import re
+import threading
+from bisect import bisect_right
+from collections import Counter
+from time import monotonic, perf_counter, sleep, time
+from urllib.parse import urlsplit
+
+from lazy import lazy_module
+
+requests = lazy_module('requests')
+
+ARCHIVE_VERSION = 1
+
+
+def request_key(method, url, body):
+    """Chiave di una richiesta: metodo, URL e corpo (per le chiamate RPC in POST)."""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    return f'{method} {url} {body or ""}'
+
+
+def endpoint(method, url):
+    """Nome dell'endpoint di una richiesta, con hash, indirizzi e numeri sostituiti da segnaposto."""
+    parts = urlsplit(url)
+    segments = []
+    for segment in parts.path.split('/'):
+        if re.fullmatch(r'[0-9a-fA-F]{64}', segment):
+            segment = '{hash}'
+        elif segment.isdigit():
+            segment = '{n}'
+        elif len(segment) >= 26 and segment.isalnum():
+            segment = '{address}'
+        segments.append(segment)
+    return f'{method} {parts.netloc}{"/".join(segments)}'
+
+
+class UpstreamArchive:
+    """Archivio gzip di scambi HTTP: una riga di intestazione e una riga JSON per richiesta."""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time()
+        # Chiave -> ([istanti], [scambi]) in ordine di registrazione
+        self.exchanges = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path):
+        """Apre un nuovo archivio in scrittura."""
+        archive = cls()
+        archive._file = gzip.open(path, 'wt', encoding='utf-8')
+        archive._file.write(json.dumps({'version': ARCHIVE_VERSION, 'started': archive.started}) + '\n')
+        return archive
+
+    @classmethod
+    def load(cls, path):
+        """Legge un archivio registrato."""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f'Versione di archivio non supportata: {header.get("version")}')
+            archive = cls(header['started'])
+            for line in f:
+                try:
+                    exchange = json.loads(line)
+                except ValueError:
+                    # L'ultima riga può essere troncata se la registrazione è stata interrotta
+                    break
+                archive._add(exchange)
+        return archive
+
+    def _add(self, exchange):
+        offsets, exchanges = self.exchanges.setdefault(request_key(exchange['m'], exchange['u'], exchange.get('b')), ([], []))
+        offsets.append(exchange['t'])
+        exchanges.append(exchange)
+
+    @property
+    def duration(self):
+        """Secondi coperti dalla registrazione."""
+        return max((offsets[-1] for offsets, _ in self.exchanges.values()), default=0.0)
+
+    def __len__(self):
+        return sum(len(offsets) for offsets, _ in self.exchanges.values())
+
+    def record(self, method, url, body, status, content, content_type, latency, error=None):
+        """Aggiunge uno scambio all'archivio e lo scrive su disco."""
+        exchange = {'t': round(time() - self.started, 3), 'm': method, 'u': url, 'l': round(latency, 4)}
+        if body:
+            exchange['b'] = body.decode('utf-8', 'replace') if isinstance(body, bytes) else body
+        if error is not None:
+            exchange['e'] = error
+        else:
+            exchange['s'] = status
+            exchange['h'] = content_type
+            try:
+                exchange['c'] = content.decode('utf-8')
+            except UnicodeDecodeError:
+                exchange['c64'] = base64.b64encode(content).decode()
+        with self._lock:
+            self._add(exchange)
+            if self._file is not None:
+                self._file.write(json.dumps(exchange, separators=(',', ':')) + '\n')
+                self._file.flush()
+
+    def lookup(self, key, offset):
+        """Ultimo scambio registrato per la chiave fino a offset (il primo se offset lo precede), o None."""
+        entry = self.exchanges.get(key)
+        if entry is None:
+            return None
+        offsets, exchanges = entry
+        return exchanges[max(bisect_right(offsets, offset) - 1, 0)]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RecordingAdapter:
+    """Adapter requests che inoltra le richieste e le salva nell'archivio."""
+
+    def __init__(self, archive, inner=None):
+        self.archive = archive
+        self.inner = inner if inner is not None else requests.adapters.HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        started = perf_counter()
+        try:
+            response = self.inner.send(request, **kwargs)
+        except requests.RequestException as e:
+            self.archive.record(request.method, request.url, request.body, None, None, None, perf_counter() - started, error=str(e))
+            raise
+        self.archive.record(request.method, request.url, request.body, response.status_code, response.content,
+                            response.headers.get('Content-Type'), perf_counter() - started)
+        return response
+
+    def close(self):
+        self.inner.close()
+        self.archive.close()
+
+
+class ReplayAdapter:
+    """Adapter requests che risponde dall'archivio, senza traffico di rete.
+
+    clock restituisce i secondi trascorsi dall'inizio della registrazione; speed divide le latenze
+    registrate (0 = risposte immediate). Le richieste assenti dall'archivio ricevono un 503.
+    """
+
+    def __init__(self, archive, speed=1.0, clock=None):
+        self.archive = archive
+        self.speed = speed
+        started = monotonic()
+        self.clock = clock or (lambda: (monotonic() - started) * (speed or 1.0))
+        self.calls = Counter()
+        self.misses = 0
+
+    def send(self, request, **kwargs):
+        self.calls[endpoint(request.method, request.url)] += 1
+        exchange = self.archive.lookup(request_key(request.method, request.url, request.body), self.clock())
+        if exchange is None:
+            self.misses += 1
+            return self._response(request, 503, b'not recorded', 'text/plain')
+        if self.speed:
+            sleep(exchange['l'] / self.speed)
+        if 'e' in exchange:
+            raise requests.ConnectionError(exchange['e'], request=request)
+        content = exchange['c'].encode('utf-8') if 'c' in exchange else base64.b64decode(exchange['c64'])
+        return self._response(request, exchange['s'], content, exchange.get('h'))
+
+    @staticmethod
+    def _response(request, status, content, content_type):
+        response = requests.models.Response()
+        response.status_code = status
+        response._content = content
+        response.headers = requests.structures.CaseInsensitiveDict({'Content-Type': content_type or 'application/octet-stream'})
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def session_from_env():
+    """Sessione HTTP condivisa con registrazione (UPSTREAM_RECORD) o riproduzione (UPSTREAM_REPLAY), altrimenti None."""
+    record_path = os.getenv('UPSTREAM_RECORD')
+    replay_path = os.getenv('UPSTREAM_REPLAY')
+    if not record_path and not replay_path:
+        return None
+    if replay_path:
+        adapter = ReplayAdapter(UpstreamArchive.load(replay_path), speed=float(os.getenv('UPSTREAM_REPLAY_SPEED', '1')))
+    else:
+        adapter = RecordingAdapter(UpstreamArchive.create(record_path))
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,287 @@
+# Bitcoin Track Bot
+# Copyright (C) 2025 d0nch4n
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Modalità webhook: listener HTTP(S) asyncio integrato, coda di update limitata e worker concorrenti.
+
+Telegram invia ogni update con una POST (di norma tramite il reverse proxy); la richiesta viene
+confermata appena l'update è in coda, e l'elaborazione avviene nei worker. Gli update dello stesso
+utente finiscono sempre nello stesso worker, così le conversazioni restano in ordine. Con la coda
+piena si risponde 503 e Telegram ritenta più tardi. Allo spegnimento il listener smette di accettare
+richieste e gli update già in coda vengono elaborati entro WEBHOOK_DRAIN_TIMEOUT secondi.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import signal
+import ssl
+from time import monotonic
+
+from telegram import Update
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+    503: 'Service Unavailable',
+}
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(HTTP_REASONS.get(status, str(status)))
+        self.status = status
+
+
+async def read_request(reader, max_body):
+    """Legge una richiesta HTTP/1.1: (metodo, percorso, header, corpo), o None se il client ha chiuso."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(431)
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, path, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'transfer-encoding' in headers:
+        raise HttpError(411)
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HttpError(400)
+    if length > max_body:
+        raise HttpError(413)
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def write_response(writer, status, body=b'', keep_alive=True):
+    """Scrive una risposta HTTP/1.1 con corpo JSON (o vuoto)."""
+    writer.write(
+        f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}\r\n'
+        f'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body
+    )
+
+
+class UpdateDispatcher:
+    """Code limitate e worker per l'elaborazione degli update.
+
+    Ogni worker ha la propria coda; la chiave (utente o chat) sceglie la coda, quindi gli update di
+    uno stesso utente vengono elaborati in ordine mentre utenti diversi procedono in parallelo.
+    """
+
+    def __init__(self, process, workers=4, queue_size=256):
+        self._process = process
+        self._queues = [asyncio.Queue(max(1, queue_size // workers)) for _ in range(workers)]
+        self._tasks = []
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    def submit(self, key, item):
+        """Mette in coda l'update; False se la coda del worker è piena."""
+        try:
+            self._queues[hash(key) % len(self._queues)].put_nowait(item)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def pending(self):
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _worker(self, queue):
+        while True:
+            item = await queue.get()
+            try:
+                await self._process(item)
+            except Exception as e:
+                self.failed += 1
+                print(f"Errore nell'elaborazione di un update: {e}")
+            finally:
+                queue.task_done()
+
+    async def drain(self, timeout):
+        """Attende l'elaborazione degli update in coda (al massimo timeout secondi), poi ferma i worker."""
+        drained = True
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            drained = False
+            print(f'Drain incompleto: {self.pending()} update non elaborati')
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        return drained
+
+
+def update_key(update):
+    """Chiave di instradamento: utente, poi chat, poi id dell'update."""
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return update.update_id
+
+
+class WebhookServer:
+    """Listener HTTP(S) che riceve gli update sul percorso del webhook e li passa al dispatcher."""
+
+    def __init__(self, application, dispatcher, path, secret_token=None, max_body=1024 * 1024):
+        self.application = application
+        self.dispatcher = dispatcher
+        self.path = path
+        self.secret_token = secret_token
+        self.max_body = max_body
+        self.accepting = True
+        self._server = None
+        self._connections = set()
+
+    async def start(self, host, port, ssl_context=None):
+        self._server = await asyncio.start_server(self._serve, host, port, ssl=ssl_context, limit=MAX_HEADER_BYTES)
+
+    async def close(self):
+        """Smette di accettare connessioni e richieste e chiude quelle aperte (Telegram ritenta quelle interrotte)."""
+        self.accepting = False
+        self._server.close()
+        # Le connessioni keep-alive inattive vanno chiuse, altrimenti wait_closed le attende
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while self.accepting:
+                try:
+                    request = await read_request(reader, self.max_body)
+                except HttpError as e:
+                    write_response(writer, e.status, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                status, body = self.handle(*request)
+                keep_alive = self.accepting and request[2].get('connection', '').lower() != 'close'
+                write_response(writer, status, body, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    def handle(self, method, path, headers, body):
+        """Gestisce una richiesta e restituisce (status, corpo)."""
+        if path.split('?', 1)[0] == '/healthz':
+            stats = {'pending': self.dispatcher.pending(), 'accepted': self.dispatcher.accepted, 'rejected': self.dispatcher.rejected}
+            return (200 if self.accepting else 503), json.dumps(stats).encode()
+        if path.split('?', 1)[0] != self.path:
+            return 404, b''
+        if method != 'POST':
+            return 405, b''
+        if self.secret_token and not hmac.compare_digest(headers.get('x-telegram-bot-api-secret-token', ''), self.secret_token):
+            return 403, b''
+        if not self.accepting:
+            return 503, b''
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400, b''
+        # Telegram ritenta gli update non confermati: con la coda piena si chiede di riprovare
+        if not self.dispatcher.submit(update_key(update), update):
+            return 503, b''
+        return 200, b''
+
+
+def webhook_settings_from_env():
+    """Legge la configurazione della modalità webhook dalle variabili d'ambiente."""
+    return {
+        'url': os.getenv('WEBHOOK_URL'),
+        'listen': os.getenv('WEBHOOK_LISTEN', '127.0.0.1'),
+        'port': int(os.getenv('WEBHOOK_PORT', '8080')),
+        'path': os.getenv('WEBHOOK_PATH', '/telegram'),
+        'secret_token': os.getenv('WEBHOOK_SECRET') or None,
+        'cert': os.getenv('WEBHOOK_CERT'),
+        'key': os.getenv('WEBHOOK_KEY'),
+        'workers': int(os.getenv('UPDATE_WORKERS', '4')),
+        'queue_size': int(os.getenv('UPDATE_QUEUE_SIZE', '256')),
+        'drain_timeout': float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '30')),
+        'max_connections': int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')),
+    }
+
+
+async def run_webhook(application, settings):
+    """Avvia l'applicazione in modalità webhook e la ferma con drain su SIGINT/SIGTERM."""
+    if not settings['url']:
+        raise ValueError('WEBHOOK_URL è obbligatoria in modalità webhook')
+    ssl_context = None
+    if settings['cert']:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(settings['cert'], settings['key'])
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    dispatcher = UpdateDispatcher(application.process_update, settings['workers'], settings['queue_size'])
+    server = WebhookServer(application, dispatcher, settings['path'], settings['secret_token'])
+    await application.initialize()
+    # Come run_polling/run_webhook di PTB: gli hook dell'applicazione (es. watchdog dell'event loop)
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    dispatcher.start()
+    await server.start(settings['listen'], settings['port'], ssl_context)
+    await application.bot.set_webhook(
+        settings['url'],
+        secret_token=settings['secret_token'],
+        max_connections=settings['max_connections'],
+        allowed_updates=Update.ALL_TYPES,
+    )
+    print(f"Webhook in ascolto su {settings['listen']}:{settings['port']}{settings['path']} "
+          f"({settings['workers']} worker, coda {settings['queue_size']})")
+
+    await stop.wait()
+    started = monotonic()
+    # Il webhook resta registrato: Telegram conserva gli update finché il bot non torna attivo
+    await server.close()
+    drained = await dispatcher.drain(settings['drain_timeout'])
+    await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+    print(f"Webhook fermato in {monotonic() - started:.1f}s ({'drain completo' if drained else 'drain interrotto'}, "
+          f"{dispatcher.accepted} update accettati, {dispatcher.rejected} rifiutati)")